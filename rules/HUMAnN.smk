@@ -1,6 +1,6 @@
 rule humann:
     input:
-        fastq="results/fastp/{sample}_merged.fastq",
+        fastq="results/fastp/{sample}_merged.fastq.gz",
 
     output:
         pathabundance="results/function/{sample}_pathabundance.tsv",
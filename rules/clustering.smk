@@ -1,13 +1,25 @@
 rule clustering:
     input:
-        expand("results/normalized/{sample}_clr.tsv", sample=RAW_SAMPLES)
+        "results/normalized/combined_normalized.fmx"
     output:
         report = "results/ml/clustering_results.pdf",
-        cluster_data = "results/ml/cluster_assignments.tsv"
+        cluster_data = "results/ml/cluster_assignments.tsv",
+        timings = "results/ml/clustering_timings.tsv"
+    params:
+        methods = config.get("clustering_methods", ["PCA", "t-SNE", "UMAP", "NMDS"])
     conda: "stats_env"
-    threads: 2
+    threads: 4
     log:
         "results/ml/clustering.log"
-    script:
-        "scripts/clustering.py"
-
+    # Methods run concurrently, one worker process each, sharing one matrix
+    shell:
+        """
+        python {workflow.basedir}/scripts/clustering.py \
+               --input {input} \
+               --output {output.report} \
+               --coords {output.cluster_data} \
+               --timings {output.timings} \
+               --methods {params.methods:q} \
+               --threads {threads} \
+               > {log} 2>&1
+        """
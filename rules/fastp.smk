@@ -3,8 +3,8 @@ rule fastp:
         r1 = lambda wildcards: sample_dict[wildcards.sample]["R1"],
         r2 = lambda wildcards: sample_dict[wildcards.sample]["R2"]
     output:
-        r1_trimmed="results/fastp/{sample}_R1_trimmed.fastq",
-        r2_trimmed="results/fastp/{sample}_R2_trimmed.fastq",
+        r1_trimmed="results/fastp/{sample}_R1_trimmed.fastq.gz",
+        r2_trimmed="results/fastp/{sample}_R2_trimmed.fastq.gz",
         html="results/fastp/{sample}.html",     
         json="results/fastp/{sample}.json"     
 
@@ -12,6 +12,9 @@ rule fastp:
         sample="|".join([re.escape(s) for s in RAW_SAMPLES])
     log:
         "logs/fastp/{sample}.log"
+    params:
+        # gzip level for the trimmed reads (fastp -z, 1 = fastest .. 9 = smallest)
+        level = config.get("fastp_compression_level", 4)
     threads: config.get("fastp_threads", config["threads"])
     
     conda: "fastp"
@@ -21,6 +24,7 @@ rule fastp:
         fastp -i {input.r1} -I {input.r2} \
               -o {output.r1_trimmed} -O {output.r2_trimmed} \
               -h {output.html} -j {output.json} \
+              -z {params.level} \
               --thread {threads} \
               2> {log}
         """
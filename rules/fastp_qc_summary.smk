@@ -5,6 +5,9 @@ rule fastp_qc_summary:
         csv = "results/reports/fastp_qc_summary.csv",
         plot1 = "results/plots/basepair_stacked_barplot.png",
         plot2 = "results/plots/base_quality_density.png"
+    params:
+        # Persistent per-sample record cache; only new/changed JSONs are reparsed
+        store = "results/reports/fastp_qc_store.sqlite"
     conda: "fastp"
     threads: 2
     log:
@@ -0,0 +1,21 @@
+rule feature_matrix:
+    input:
+        expand("results/normalized/{sample}_clr.tsv", sample=RAW_SAMPLES)
+    output:
+        matrix = directory("results/normalized/combined_normalized.fmx"),
+        tsv = "results/normalized/combined_normalized.tsv"
+    conda: "stats_env"
+    threads: 1
+    log:
+        "results/normalized/combined_normalized.log"
+    # float32 store read memory-mapped by clustering and supervised learning;
+    # the TSV export is kept for the R scripts (indicator species)
+    shell:
+        """
+        python {workflow.basedir}/scripts/feature_matrix.py \
+               --inputs {input} \
+               --output {output.matrix} \
+               --suffix _clr.tsv \
+               --tsv {output.tsv} \
+               > {log} 2>&1
+        """
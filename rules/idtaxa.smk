@@ -0,0 +1,46 @@
+IDTAXA_TRAINING_SET = config.get("idtaxa_training_set", "data/DECIPHER/SILVA_SSU_r138_2019.RData")
+
+# Train once from a reference FASTA only when no pre-trained set is supplied;
+# every classification job then just loads the cached .RData
+if config.get("idtaxa_reference"):
+    rule idtaxa_training_set:
+        input:
+            config["idtaxa_reference"]
+        output:
+            IDTAXA_TRAINING_SET
+        conda: "idtaxa_env"
+        threads: 1
+        log:
+            "logs/idtaxa/training_set.log"
+        shell:
+            """
+            Rscript {workflow.basedir}/scripts/run_idtaxa.R --train-only \
+                    --training-set {output} \
+                    --reference {input} \
+                    > {log} 2>&1
+            """
+
+rule idtaxa:
+    input:
+        r1 = "results/fastp/{sample}_R1_trimmed.fastq.gz",
+        r2 = "results/fastp/{sample}_R2_trimmed.fastq.gz",
+        training_set = IDTAXA_TRAINING_SET
+    output:
+        "results/taxonomy/{sample}_idtaxa.tsv"
+    params:
+        chunk_size = config.get("idtaxa_chunk_size", 100000),
+        threshold = config.get("idtaxa_threshold", 60)
+    conda: "idtaxa_env"
+    threads: config.get("idtaxa_threads", 8)
+    log:
+        "logs/idtaxa/{sample}.log"
+    # Reads are streamed in chunks and dereplicated; results are appended per chunk
+    shell:
+        """
+        Rscript {workflow.basedir}/scripts/run_idtaxa.R {input.r1} {input.r2} {output} \
+                --training-set {input.training_set} \
+                --chunk-size {params.chunk_size} \
+                --threshold {params.threshold} \
+                --processors {threads} \
+                > {log} 2>&1
+        """
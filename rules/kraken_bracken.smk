@@ -0,0 +1,63 @@
+KRAKEN_DB = config.get("kraken_db", "database/kraken2_db")
+KRAKEN_BATCH_SIZE = int(config.get("kraken_batch_size", 8))
+KRAKEN_BATCHES = [RAW_SAMPLES[i:i + KRAKEN_BATCH_SIZE]
+                  for i in range(0, len(RAW_SAMPLES), KRAKEN_BATCH_SIZE)]
+
+# One job per batch of samples: the memory-mapped database is loaded once
+# and reused from the page cache by every sample in the batch
+for batch_idx, batch in enumerate(KRAKEN_BATCHES):
+    rule:
+        name: f"kraken_bracken_batch{batch_idx}"
+        input:
+            r1 = expand("results/fastp/{sample}_R1_trimmed.fastq.gz", sample=batch),
+            r2 = expand("results/fastp/{sample}_R2_trimmed.fastq.gz", sample=batch)
+        output:
+            reports = expand("results/kraken2/{sample}.kraken_report", sample=batch),
+            bracken = expand("results/kraken2/{sample}.bracken_report", sample=batch)
+        params:
+            samples = batch,
+            db = KRAKEN_DB,
+            # Staged copies are kept for later batches; delete the directory when done
+            stage_db = ("--stage-db " + config["kraken_stage_db"]) if config.get("kraken_stage_db") else "",
+            read_len = config.get("bracken_read_len", 150),
+            level = config.get("bracken_level", "S")
+        conda: "kraken_env"
+        threads: config.get("kraken_threads", 16)
+        resources:
+            mem_gb = config.get("kraken_mem_gb", 64)
+        log:
+            f"logs/kraken2/batch{batch_idx}.log"
+        shell:
+            """
+            python {workflow.basedir}/scripts/kraken_batch.py run \
+                   --db {params.db} {params.stage_db} \
+                   --samples {params.samples} \
+                   --r1 {input.r1} \
+                   --r2 {input.r2} \
+                   --outdir results/kraken2 \
+                   --threads {threads} \
+                   --read-len {params.read_len} \
+                   --level {params.level} \
+                   > {log} 2>&1
+            """
+
+# Runs only after every batch has produced its Bracken reports
+rule bracken_combine:
+    input:
+        expand("results/kraken2/{sample}.bracken_report", sample=RAW_SAMPLES)
+    output:
+        "results/kraken2/bracken_abundance_matrix.tsv"
+    params:
+        samples = RAW_SAMPLES
+    conda: "kraken_env"
+    threads: 1
+    log:
+        "logs/kraken2/bracken_combine.log"
+    shell:
+        """
+        python {workflow.basedir}/scripts/kraken_batch.py combine \
+               --reports {input} \
+               --samples {params.samples} \
+               --output {output} \
+               > {log} 2>&1
+        """
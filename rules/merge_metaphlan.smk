@@ -8,5 +8,14 @@ rule merge_metaphlan_profiles:
         "logs/merge_metaphlan.log"
     conda:
         "metaphlan_env"
-    script:
-        "workflow/scripts/merge_metaphlan_tables.py"
+    threads: 4
+    # --threads sets the number of parallel profile readers
+    shell:
+        """
+        python {workflow.basedir}/scripts/merge_metaphlan_tables.py \
+               {input} \
+               {output.merged} \
+               {output.summary} \
+               --threads {threads} \
+               > {log} 2>&1
+        """
@@ -1,18 +1,25 @@
 rule merge_reads:
     input:
-        r1 = "results/fastp/{sample}_R1_trimmed.fastq",
-        r2 = "results/fastp/{sample}_R2_trimmed.fastq"
+        r1 = "results/fastp/{sample}_R1_trimmed.fastq.gz",
+        r2 = "results/fastp/{sample}_R2_trimmed.fastq.gz"
     output:
-        merged = "results/fastp/{sample}_merged.fastq"
+        merged = "results/fastp/{sample}_merged.fastq.gz",
+        report = "results/fastp/{sample}_merged.json"
         
     wildcard_constraints:
         sample="|".join([re.escape(s) for s in RAW_SAMPLES])
     
+    log:
+        "logs/merge_reads/{sample}.log"
     conda: "fastp"
         
+    # Gzipped R1/R2 are concatenated as gzip members (no recompression, so
+    # one thread and no compression level); HUMAnN reads .fastq.gz directly
     shell:
         """
-        cat results/fastp/{wildcards.sample}_R1_trimmed.fastq \
-            results/fastp/{wildcards.sample}_R2_trimmed.fastq \
-            > results/fastp/{wildcards.sample}_merged.fastq
+        python {workflow.basedir}/scripts/merge_reads.py \
+               --inputs {input.r1} {input.r2} \
+               --output {output.merged} \
+               --report {output.report} \
+               2> {log}
         """
@@ -1,8 +1,8 @@
 rule normalization:
     input:
-        "results/function/{sample}_pathabundance.tsv.gz"
+        expand("results/function/{sample}_pathabundance.tsv.gz", sample=RAW_SAMPLES)
     output:
-        "results/normalized/{sample}_{method}.tsv"
+        expand("results/normalized/{sample}_{{method}}.tsv", sample=RAW_SAMPLES)
     params:
         method = "{method}"
 
@@ -10,8 +10,15 @@ rule normalization:
     
     threads: 2
     log:
-        "results/normalized/{sample}_{method}.log"
-    script:
-        "workflow/scripts/normalization.py"
+        "results/normalized/cohort_{method}.log"
+    # One interpreter (and one R session for css/deseq2) for the whole cohort
+    shell:
+        """
+        python {workflow.basedir}/scripts/normalization.py \
+               --method {params.method} \
+               --input {input} \
+               --output {output} \
+               > {log} 2>&1
+        """
 
 
@@ -1,6 +1,6 @@
 rule supervised_learning:
     input:
-        features = "results/normalized/combined_normalized.tsv",
+        features = "results/normalized/combined_normalized.fmx",
         labels = "metadata/merged_soil_env_data.csv",
 
     output:
@@ -8,11 +8,15 @@ rule supervised_learning:
         features = "results/ml/supervised_learning_features.png",
         metrics = "results/ml/supervised_learning_metrics.json",
         importances = "results/ml/supervised_learning_feature_importances.json",
-        report = "results/ml/supervised_learning_results.pdf" 
+        report = "results/ml/supervised_learning_results.pdf",
+        cv_tasks = "results/ml/supervised_learning_cv_tasks.tsv"
     params:
         n_iterations = config.get("ml_n_iterations", 100),
         test_size = config.get("ml_test_size", 0.2),
-        random_state = config.get("random_state", 42
+        random_state = config.get("random_state", 42),
+        targets = config.get("ml_targets", ["pH", "temperature", "moisture"]),
+        shap_background = config.get("ml_shap_background", 100),
+        shap_cache = "results/cache/shap"
 
     conda:"stats_env"
     
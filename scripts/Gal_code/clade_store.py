@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pandas as pd
+
+# ==============================================================
+# Indexed columnar store for merged MetaPhlAn tables
+#
+#   <store_dir>/abundances.npy   clades x samples float64 matrix
+#   <store_dir>/clades.tsv       clade_name per matrix row
+#   <store_dir>/samples.tsv      sample_id per matrix column
+#
+# Replaces one tiny TSV per clade (tens of thousands of files on
+# Lustre) with three files; lookups memory-map the matrix.
+# ==============================================================
+
+MATRIX_FILE = "abundances.npy"
+CLADES_FILE = "clades.tsv"
+SAMPLES_FILE = "samples.tsv"
+
+
+def safe_clade_filename(clade):
+    """Sanitize a clade name for use as a file name (remove | and / etc.)."""
+    return clade.replace("|", "_").replace("/", "_").replace(" ", "_")
+
+
+def write_clade_store(merged_df, store_dir):
+    """Write a clade_name x sample table (as from merge_profiles) to store_dir."""
+    os.makedirs(store_dir, exist_ok=True)
+    sample_cols = [c for c in merged_df.columns if c != "clade_name"]
+    values = merged_df[sample_cols].to_numpy(dtype=np.float64)
+
+    np.save(os.path.join(store_dir, MATRIX_FILE), values)
+    pd.DataFrame({"clade_name": merged_df["clade_name"].to_numpy()}).to_csv(
+        os.path.join(store_dir, CLADES_FILE), sep="\t", index=False)
+    pd.DataFrame({"sample_id": sample_cols}).to_csv(
+        os.path.join(store_dir, SAMPLES_FILE), sep="\t", index=False)
+    return store_dir
+
+
+class CladeStore:
+    """Read-only view of a store written by write_clade_store."""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.values = np.load(os.path.join(store_dir, MATRIX_FILE), mmap_mode="r")
+        self.clades = pd.read_csv(os.path.join(store_dir, CLADES_FILE), sep="\t", keep_default_na=False)["clade_name"].tolist()
+        self.samples = pd.read_csv(os.path.join(store_dir, SAMPLES_FILE), sep="\t", keep_default_na=False)["sample_id"].tolist()
+        self._offsets = {clade: i for i, clade in enumerate(self.clades)}
+
+    def __len__(self):
+        return len(self.clades)
+
+    def __contains__(self, clade):
+        return clade in self._offsets
+
+    def lookup(self, clade):
+        """Per-sample abundance vector of one clade (KeyError if unknown)."""
+        row = self._offsets[clade]
+        s = pd.Series(np.asarray(self.values[row]), index=self.samples, name="relative_abundance")
+        s.index.name = "sample_id"
+        return s
+
+    def export_tsv(self, output_dir, clades=None):
+        """Write the legacy one-TSV-per-clade layout for the given (default: all) clades."""
+        os.makedirs(output_dir, exist_ok=True)
+        clades = self.clades if clades is None else clades
+        for clade in clades:
+            out_path = os.path.join(output_dir, f"{safe_clade_filename(clade)}.tsv")
+            self.lookup(clade).to_frame().to_csv(out_path, sep="\t")
+        return len(clades)
@@ -1,14 +1,17 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import networkx as nx
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
-from skbio.diversity import beta_diversity
 from skbio.stats.ordination import pcoa
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from distance_cache import distance_matrix
+from pca_backend import fit_pca
+from cooccurrence import cooccurrence_edges, write_network
+
 
 # ---------------------------------------------------------------------
 # Setup
@@ -17,6 +20,22 @@ file_path = r"C:\Users\hadis\OneDrive\Documents\Project\Ga_output\MetaphlanOutpu
 out_dir = r"C:\Users\hadis\OneDrive\Documents\Project\Soil_Pipeline\soil-pipeline\Metaphlan_Exploratory_Analysis"
 os.makedirs(out_dir, exist_ok=True)
 
+# PCA solver: "full" (exact SVD), "randomized" or "incremental" (row blocks)
+pca_backend = "full"
+
+# Worker processes for uncached Bray-Curtis distance tiles. This script has
+# no __main__ guard, so keep 1 on Windows (spawned workers re-run it)
+distance_workers = 1
+
+# Co-occurrence network: "pearson" (the original 0.7 < r < 1 network),
+# "spearman" or "sparcc". permutations > 0 adds permutation p-values and keeps
+# only the edges with BH q < network_max_q
+network_method = "pearson"
+network_threshold = 0.7
+network_permutations = 0
+network_max_q = 0.05
+network_workers = 1
+
 # Load data
 df = pd.read_csv(file_path, sep="\t", index_col=0)
 print("✅ Data loaded successfully!")
@@ -130,14 +149,12 @@ save_fig("alpha_shannon")
 # PCA (beta diversity)
 # ---------------------------------------------------------------------
 X = df.T.fillna(0)
-X_scaled = StandardScaler().fit_transform(X)
-pca = PCA(n_components=2)
-coords = pca.fit_transform(X_scaled)
+coords, pca_var_ratio = fit_pca(X, n_components=2, backend=pca_backend, standardize=True)
 plt.figure(figsize=(6, 6))
 plt.scatter(coords[:, 0], coords[:, 1], color='steelblue')
 plt.title("PCA of Genus-Level Abundances")
-plt.xlabel(f"PC1 ({pca.explained_variance_ratio_[0]*100:.1f}% var)")
-plt.ylabel(f"PC2 ({pca.explained_variance_ratio_[1]*100:.1f}% var)")
+plt.xlabel(f"PC1 ({pca_var_ratio[0]*100:.1f}% var)")
+plt.ylabel(f"PC2 ({pca_var_ratio[1]*100:.1f}% var)")
 plt.grid(True)
 save_fig("pca_beta_diversity")
 
@@ -178,7 +195,8 @@ print("📁 Saved: heatmap_clustermap.png")
 # ---------------------------------------------------------------------
 # Bray–Curtis PCoA
 # ---------------------------------------------------------------------
-bc = beta_diversity("braycurtis", df.T.values, ids=df.columns)
+bc = distance_matrix(df.T, "braycurtis", cache_dir=os.path.join(out_dir, "distance_cache"),
+                     workers=distance_workers)
 pcoa_res = pcoa(bc)
 plt.figure(figsize=(6, 6))
 plt.scatter(pcoa_res.samples['PC1'], pcoa_res.samples['PC2'], color='purple')
@@ -191,22 +209,22 @@ save_fig("pcoa_braycurtis")
 # ---------------------------------------------------------------------
 # Co-occurrence network (safe)
 # ---------------------------------------------------------------------
-corr = df.T.corr()
-corr.columns = [f"Sample_{i}" for i in range(corr.shape[1])]
-corr.index = corr.columns
-
-edges = corr.stack().reset_index()
-edges.columns = ['Taxon1', 'Taxon2', 'Correlation']
-edges = edges.query("0.7 < Correlation < 1 and Taxon1 != Taxon2")
+edges = cooccurrence_edges(df, method=network_method, threshold=network_threshold,
+                           permutations=network_permutations, workers=network_workers)
+if network_permutations > 0:
+    edges = edges[edges["q_value"] < network_max_q]
+print(f"Co-occurrence edges ({network_method}, r > {network_threshold}): {len(edges)}")
 
 if not edges.empty:
-    G = nx.from_pandas_edgelist(edges, 'Taxon1', 'Taxon2', ['Correlation'])
+    G = write_network(edges, os.path.join(out_dir, "cooccurrence_network.graphml"),
+                      os.path.join(out_dir, "cooccurrence_edges.tsv"),
+                      node_attrs={"mean_abundance": mean_abundance})
     plt.figure(figsize=(8, 8))
     nx.draw_networkx(G, node_size=100, with_labels=False)
-    plt.title("Co-occurrence Network (r > 0.7)")
+    plt.title(f"Co-occurrence Network ({network_method} r > {network_threshold})")
     save_fig("cooccurrence_network")
 else:
-    print("⚠️ No strong correlations found (r > 0.7) — skipping network plot.")
+    print(f"⚠️ No strong correlations found (r > {network_threshold}) — skipping network plot.")
 
 # ---------------------------------------------------------------------
 # Summary metrics
@@ -216,6 +234,6 @@ print(f"Number of samples: {df.shape[1]}")
 print(f"Number of genera: {df.shape[0]}")
 print(f"Average richness (genera/sample): {richness.mean():.1f} ± {richness.std():.1f}")
 print(f"Average Shannon diversity (sample): {shannon.mean():.2f} ± {shannon.std():.2f}")
-print(f"Explained variance by PC1+PC2: {pca.explained_variance_ratio_[:2].sum()*100:.1f}%")
+print(f"Explained variance by PC1+PC2: {pca_var_ratio[:2].sum()*100:.1f}%")
 print("\n🎉 Exploratory analysis complete!")
 print(f"All figures saved in: {out_dir}")
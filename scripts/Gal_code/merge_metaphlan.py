@@ -1,106 +1,30 @@
 import os
-import pandas as pd
-import re
+import argparse
+from taxonomy_levels import merge_profiles, split_taxonomic_levels, write_level_tables
 
 # --------------------------------------------------
 # 1️⃣ Define directories
 # --------------------------------------------------
 input_dir = r"C:\Users\hadis\OneDrive\Documents\Project\Ga_output\MetaphlanOutput.rocrate\relative_abundances"
-output_base = os.path.join(input_dir, "merged_metaphlan_outputs_all_levels")
-
-# --------------------------------------------------
-# 2️⃣ Find all MetaPhlAn output files
-# --------------------------------------------------
-files = [f for f in os.listdir(input_dir) if f.endswith((".tabular", ".txt", ".tsv"))]
-if not files:
-    raise FileNotFoundError("❌ No MetaPhlAn output files found in input directory!")
 
-print(f"🔍 Found {len(files)} MetaPhlAn files to merge...\n")
-
-# --------------------------------------------------
-# 3️⃣ Merge all MetaPhlAn outputs
-# --------------------------------------------------
-merged_df = pd.DataFrame()
+parser = argparse.ArgumentParser(description="Merge MetaPhlAn outputs and extract exact per-level tables")
+parser.add_argument("--input-dir", default=input_dir, help="Directory with MetaPhlAn outputs")
+args = parser.parse_args()
 
-for file in files:
-    file_path = os.path.join(input_dir, file)
-    try:
-        df = pd.read_csv(file_path, sep="\t", comment="#", header=None)
-    except Exception as e:
-        print(f"⚠️ Skipping {file} (read error: {e})")
-        continue
-
-    if df.shape[1] < 2:
-        print(f"⚠️ Skipping {file}: not enough columns.")
-        continue
-
-    # Select clade_name and relative_abundance columns
-    df = df.iloc[:, [0, 2]] if df.shape[1] >= 3 else df.iloc[:, [0, 1]]
-    df.columns = ["clade_name", "relative_abundance"]
-
-    # Extract sample ID like GUAN_049 from filename
-    match = re.search(r"([A-Z]{2,5}_\d{3})", file)
-    sample_id = match.group(1) if match else os.path.splitext(file)[0]
-
-    df = df.rename(columns={"relative_abundance": sample_id})
-
-    # Merge into master table
-    merged_df = df if merged_df.empty else pd.merge(merged_df, df, on="clade_name", how="outer")
+input_dir = args.input_dir
+output_base = os.path.join(input_dir, "merged_metaphlan_outputs_all_levels")
 
 # --------------------------------------------------
-# 4️⃣ Clean merged data
+# 2️⃣ Merge all MetaPhlAn outputs
 # --------------------------------------------------
-merged_df = merged_df.fillna(0)
-merged_df = merged_df.sort_values("clade_name")
+merged_df = merge_profiles(input_dir)
 merged_df.to_csv(f"{output_base}.tsv", sep="\t", index=False)
 print(f"✅ Saved merged file: {output_base}.tsv")
 
 # --------------------------------------------------
-# 5️⃣ Split and extract exact taxonomic levels
+# 3️⃣ Extract data by exact level (no aggregation)
 # --------------------------------------------------
-taxa_levels = ["kingdom", "phylum", "class", "order", "family", "genus", "species", "strain"]
-split_cols = merged_df["clade_name"].str.split("|", expand=True)
-split_cols.columns = taxa_levels[:split_cols.shape[1]]
-df = pd.concat([merged_df, split_cols], axis=1)
-
-sample_cols = [c for c in df.columns if c not in ["clade_name"] + taxa_levels]
-df[sample_cols] = df[sample_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
-
-output_dir = os.path.join(input_dir, "merged_by_taxonomic_level")
-os.makedirs(output_dir, exist_ok=True)
-
-# --------------------------------------------------
-# 6️⃣ Extract data by level (no aggregation)
-# --------------------------------------------------
-for level in taxa_levels:
-    if level not in df.columns:
-        continue
-
-    # Keep only rows where this level is the last defined (exact level)
-    level_idx = taxa_levels.index(level)
-    mask = df[taxa_levels[level_idx + 1:]].isna().all(axis=1)
-    sub_df = df[mask].copy()
-
-    if sub_df.empty:
-        continue
-
-    # Create taxonomy_path up to this level
-    sub_df["taxonomy_path"] = sub_df[taxa_levels[: level_idx + 1]].apply(
-        lambda r: "|".join([x for x in r if pd.notna(x)]), axis=1
-    )
-
-    # Reorder columns: taxonomy_path + samples
-    out_df = sub_df[["taxonomy_path"] + sample_cols]
-
-    # Add total column (sum across all samples)
-    out_df.insert(1, "merged_metaphlan_outputs_all_levels", out_df[sample_cols].sum(axis=1))
-
-    # Save TSV file
-    out_path = os.path.join(output_dir, f"merged_{level}_level.tsv")
-    out_df.to_csv(out_path, sep="\t", index=False)
-
-    print(f"✅ Saved exact {level}-level file: {out_path}")
-    print(f"📊 Shape: {out_df.shape[0]} taxa × {out_df.shape[1]-1} samples\n")
+tables = split_taxonomic_levels(merged_df, total_column="merged_metaphlan_outputs_all_levels")
+write_level_tables(tables, os.path.join(input_dir, "merged_by_taxonomic_level"))
 
 print("🎉 Done! Extracted exact per-level MetaPhlAn abundance tables.")
-
@@ -1,126 +1,174 @@
 import os
+import argparse
 import pandas as pd
 import plotly.express as px
+from plotly.offline import get_plotlyjs
 from plotly.subplots import make_subplots
+from concurrent.futures import ProcessPoolExecutor
+from taxonomy_levels import PROFILE_EXTENSIONS, read_profile
+
+SUNBURST_RANKS = ["Kingdom", "Phylum", "Class", "Order", "Family", "Genus"]
+PLOTLY_BUNDLE = "plotly.min.js"
+
 
 # ==============================================================
-# Function: Generate combined Sunburst plots for one MetaPhlAn output
+# Aggregation: one bottom-up pass per profile
 # ==============================================================
-def generate_metaphlan_sunburst(input_path, output_dir):
-    # Extract sample ID from file name (last 8 chars before extension)
-    base_name = os.path.basename(input_path)
-    sample_id = os.path.splitext(base_name)[0][-8:]
-    output_path = os.path.join(output_dir, f"{sample_id}_sunburst.html")
+def load_taxonomy(input_path, sample_id):
+    """
+    Leaf rows (up to genus) of one MetaPhlAn output, split into rank columns.
+
+    Each clade keeps only the part of its abundance not already covered by
+    its child rows: a clade without children (e.g. UNCLASSIFIED or a class
+    with no genus below it) is kept whole, and a clade whose children sum to
+    less than it keeps the remainder as an "Unclassified" child. Summing the
+    leaves therefore reproduces every clade's total in the profile without
+    counting it twice. Returns None for empty/unreadable files.
+    """
+    s = read_profile(input_path, sample_id)
+    if s is None or s.empty:
+        return None
+
+    clades = s.index.to_series().astype(str)
+    depth = clades.str.count(r"\|")
+    deepest = min(depth.max(), len(SUNBURST_RANKS) - 1)
+    keep = (depth <= deepest).to_numpy()
+    clades, depth = clades[keep], depth[keep]
+    values = pd.to_numeric(s[keep], errors="coerce").fillna(0)
+    values.index = clades.to_numpy()
+
+    # Abundance left over after the direct children's share
+    parents = clades[depth > 0].str.rsplit("|", n=1).str[0]
+    covered = values[depth > 0].groupby(parents.to_numpy()).sum()
+    remainder = (values - covered.reindex(values.index).fillna(0)).clip(lower=0)
+    leaves = remainder > 1e-9 * max(values.max(), 1)
+    clades, remainder = clades[leaves.to_numpy()], remainder[leaves]
+
+    # Clean prefixes (k__, p__, etc.) in one pass over the kept rows only
+    tax_split = clades.str.replace(r"(^|\|)[a-z]__", r"\1", regex=True).str.split("|", expand=True)
+    tax_split = tax_split.reindex(columns=range(deepest + 1))
+    tax_split.columns = SUNBURST_RANKS[:deepest + 1]
+    tax_split = tax_split.replace("", "Unclassified").fillna("Unclassified")
+    tax_split["relative_abundance"] = remainder.to_numpy()
+    return tax_split.reset_index(drop=True)
+
+
+def aggregate_levels(tax_df):
+    """
+    {level: DataFrame(Kingdom..level, relative_abundance)} for Phylum..Genus.
+
+    The deepest level is summed once and every shallower level is rolled up
+    from the table of the level below it.
+    """
+    ranks = [r for r in SUNBURST_RANKS if r in tax_df.columns]
+    aggregates = {}
+    agg = tax_df.groupby(ranks, as_index=False, sort=False)["relative_abundance"].sum()
+    for depth in range(len(ranks), 1, -1):
+        if depth < len(ranks):
+            agg = agg.groupby(ranks[:depth], as_index=False, sort=False)["relative_abundance"].sum()
+        aggregates[ranks[depth - 1]] = agg
+    return {level: aggregates[level] for level in SUNBURST_RANKS[1:] if level in aggregates}
 
-    print(f"🔹 Processing: {base_name}  →  {output_path}")
 
-    # --------------------------------------------------
-    # 1️⃣ Load MetaPhlAn output
-    # --------------------------------------------------
-    df = pd.read_csv(
-        input_path,
-        sep="\t",
-        comment="#",
-        header=None,
-        names=["clade_name", "NCBI_tax_id", "relative_abundance", "additional_species"]
-    )
-
-    if df.empty:
-        print(f"⚠️ Skipping empty file: {input_path}")
-        return
-
-    # --------------------------------------------------
-    # 2️⃣ Split hierarchical taxonomy and ensure all columns exist
-    # --------------------------------------------------
-    tax_split = df["clade_name"].str.split("|", expand=True)
-    all_levels = ["Kingdom", "Phylum", "Class", "Order", "Family", "Genus", "Species", "t"]
-
-    # If fewer columns exist, fill missing with "Unclassified"
-    if tax_split.shape[1] < len(all_levels):
-        for _ in range(len(all_levels) - tax_split.shape[1]):
-            tax_split[tax_split.shape[1]] = "Unclassified"
-
-    tax_split.columns = all_levels
-
-    # Clean prefixes (k__, p__, etc.)
-    for c in tax_split.columns:
-        tax_split[c] = tax_split[c].str.replace(r"^[a-z]__", "", regex=True).fillna("Unclassified")
-
-    # Merge with abundance
-    df = pd.concat([tax_split, df["relative_abundance"]], axis=1)
-    df["relative_abundance"] = pd.to_numeric(df["relative_abundance"], errors="coerce").fillna(0)
-
-    # --------------------------------------------------
-    # 3️⃣ Define taxonomic levels to visualize
-    # --------------------------------------------------
-    levels = {
-        "Phylum": ["Kingdom", "Phylum"],
-        "Class": ["Kingdom", "Phylum", "Class"],
-        "Order": ["Kingdom", "Phylum", "Class", "Order"],
-        "Family": ["Kingdom", "Phylum", "Class", "Order", "Family"],
-        "Genus": ["Kingdom", "Phylum", "Class", "Order", "Family", "Genus"]
-    }
-
-    # --------------------------------------------------
-    # 4️⃣ Create subplot grid
-    # --------------------------------------------------
+# ==============================================================
+# Rendering
+# ==============================================================
+def render_sunburst(sample_id, aggregates, output_path, include_plotlyjs=True):
+    """Write the Phylum→Genus sunburst subplots for one sample to output_path."""
+    levels = SUNBURST_RANKS[1:]
     rows = len(levels)
     fig = make_subplots(
         rows=rows,
         cols=1,
         specs=[[{"type": "domain"}] for _ in range(rows)],
-        subplot_titles=[f"{level} Level" for level in levels.keys()]
+        subplot_titles=[f"{level} Level" for level in levels]
     )
 
-    # --------------------------------------------------
-    # 5️⃣ Generate Sunburst plots for each level safely
-    # --------------------------------------------------
     row_idx = 1
-    for level_name, path in levels.items():
-        valid_cols = [col for col in path if col in df.columns]
-        if len(valid_cols) < 2:
+    for level_name in levels:
+        if level_name not in aggregates:
             print(f"⚠️ Skipping {level_name} (not enough taxonomic levels in {sample_id})")
             continue
-
-        df_level = df.groupby(valid_cols, as_index=False)["relative_abundance"].sum()
+        df_level = aggregates[level_name]
+        valid_cols = [c for c in SUNBURST_RANKS if c in df_level.columns]
 
         sun = px.sunburst(
             df_level,
             path=valid_cols,
             values="relative_abundance",
-            color="Phylum"
-            if "Phylum" in valid_cols else valid_cols[1],  # color by Phylum or next available level
-            title=f"{level_name} Level",    
+            color="Phylum",  # every aggregate has at least Kingdom, Phylum
+            title=f"{level_name} Level",
         )
 
         for trace in sun.data:
             fig.add_trace(trace, row=row_idx, col=1)
         row_idx += 1
 
-    # --------------------------------------------------
-    # 6️⃣ Save to HTML
-    # --------------------------------------------------
     fig.update_layout(
         title_text=f"MetaPhlAn Taxonomic Composition — {sample_id}",
         height=3000,
         showlegend=False,
     )
+    fig.write_html(output_path, include_plotlyjs=include_plotlyjs)
+
+
+# ==============================================================
+# Function: Generate combined Sunburst plots for one MetaPhlAn output
+# ==============================================================
+def generate_metaphlan_sunburst(input_path, output_dir, include_plotlyjs=True):
+    # Extract sample ID from file name (last 8 chars before extension)
+    base_name = os.path.basename(input_path)
+    sample_id = os.path.splitext(base_name)[0][-8:]
+    output_path = os.path.join(output_dir, f"{sample_id}_sunburst.html")
+
+    print(f"🔹 Processing: {base_name}  →  {output_path}")
+
+    tax_df = load_taxonomy(input_path, sample_id)
+    if tax_df is None:
+        print(f"⚠️ Skipping empty file: {input_path}")
+        return None
 
     os.makedirs(output_dir, exist_ok=True)
-    fig.write_html(output_path)
+    render_sunburst(sample_id, aggregate_levels(tax_df), output_path, include_plotlyjs)
     print(f"✅ Saved: {output_path}\n")
+    return output_path
+
+
+def generate_sunburst_batch(input_paths, output_dir, workers=1):
+    """
+    Render many samples on a process pool.
+
+    Every HTML references one shared plotly.min.js in output_dir (written
+    once here) instead of embedding its own ~3.5 MB copy.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    bundle = os.path.join(output_dir, PLOTLY_BUNDLE)
+    if not os.path.exists(bundle):
+        with open(bundle, "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+
+    args = [(path, output_dir, "directory") for path in input_paths]
+    if workers <= 1:
+        return [generate_metaphlan_sunburst(*a) for a in args]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(generate_metaphlan_sunburst, *zip(*args)))
 
 
 # ==============================================================
 # Batch process all MetaPhlAn outputs in a folder
 # ==============================================================
-input_dir = r"C:\Users\hadis\OneDrive\Documents\Project\Ga_output\MetaphlanOutput.rocrate\relative_abundances"
-output_dir = r"C:\Users\hadis\OneDrive\Documents\Project\Soil_Pipeline\soil-pipeline\Metaphlan_sunburst_all_levels"
+if __name__ == "__main__":
+    input_dir = r"C:\Users\hadis\OneDrive\Documents\Project\Ga_output\MetaphlanOutput.rocrate\relative_abundances"
+    output_dir = r"C:\Users\hadis\OneDrive\Documents\Project\Soil_Pipeline\soil-pipeline\Metaphlan_sunburst_all_levels"
 
-for file in os.listdir(input_dir):
-    if file.endswith(".tabular") or file.endswith(".txt") or file.endswith(".tsv"):
-        input_path = os.path.join(input_dir, file)
-        generate_metaphlan_sunburst(input_path, output_dir)
+    parser = argparse.ArgumentParser(description="Batch MetaPhlAn sunburst HTML reports")
+    parser.add_argument("--input-dir", default=input_dir, help="Directory with MetaPhlAn outputs")
+    parser.add_argument("--output-dir", default=output_dir, help="Directory for the HTML reports")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    args = parser.parse_args()
 
-print("🎉 All Sunburst plots generated successfully!")
-# ==============================================================
\ No newline at end of file
+    files = sorted(f for f in os.listdir(args.input_dir) if f.endswith(PROFILE_EXTENSIONS))
+    generate_sunburst_batch([os.path.join(args.input_dir, f) for f in files], args.output_dir, args.workers)
+
+    print("🎉 All Sunburst plots generated successfully!")
+# ==============================================================
@@ -0,0 +1,276 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from plotly.offline import get_plotlyjs
+from concurrent.futures import ProcessPoolExecutor
+from taxonomy_levels import PROFILE_EXTENSIONS, sample_id_from_filename
+from metaphlan_visualize_html import PLOTLY_BUNDLE, SUNBURST_RANKS, load_taxonomy
+
+# ==============================================================
+# Cohort taxonomy explorer: one HTML for all samples
+# ==============================================================
+# Per level (Phylum..Genus) the artifact stores the unique lineages once
+# and each sample's non-zero abundances as (taxon index, value) pairs, in
+# a <script type="application/json"> block that the page only parses when
+# that level is first shown. Size therefore grows with unique taxa and
+# non-zero entries, not with samples x plotly figure payload.
+ROUND_DIGITS = 5
+
+
+def _load_sample(path):
+    sample_id = sample_id_from_filename(os.path.basename(path))
+    tax_df = load_taxonomy(path, sample_id)
+    if tax_df is None:
+        print(f"⚠️ Skipping empty file: {path}")
+        return sample_id, None
+    return sample_id, tax_df
+
+
+def cohort_level_tables(input_paths, workers=1):
+    """
+    {level: DataFrame(lineage x samples)} for Phylum..Genus over the cohort.
+
+    Samples are parsed on a process pool; the deepest level is summed once
+    for all samples and shallower levels are rolled up from the level below.
+    Files that map to the same sample ID are an error rather than being
+    summed into one column.
+    """
+    files_by_id = {}
+    for path in input_paths:
+        files_by_id.setdefault(sample_id_from_filename(os.path.basename(path)), []).append(path)
+    duplicated = {sid: paths for sid, paths in files_by_id.items() if len(paths) > 1}
+    if duplicated:
+        raise ValueError(f"Several files map to the same sample ID: {duplicated}")
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            loaded = list(pool.map(_load_sample, input_paths))
+    else:
+        loaded = [_load_sample(p) for p in input_paths]
+
+    frames = []
+    for sample_id, tax_df in loaded:
+        if tax_df is not None:
+            frames.append(tax_df.assign(sample=sample_id))
+    if not frames:
+        raise ValueError("No non-empty MetaPhlAn profiles found")
+    long_df = pd.concat(frames, ignore_index=True)
+    ranks = [r for r in SUNBURST_RANKS if r in long_df.columns]
+    long_df[ranks] = long_df[ranks].fillna("Unclassified")
+    samples = list(dict.fromkeys(s for s, t in loaded if t is not None))
+
+    tables = {}
+    table = long_df.pivot_table(index=ranks, columns="sample", values="relative_abundance",
+                                aggfunc="sum", fill_value=0.0)
+    for depth in range(len(ranks), 1, -1):
+        if depth < len(ranks):
+            table = table.groupby(level=list(range(depth))).sum()
+        tables[ranks[depth - 1]] = table.reindex(columns=samples, fill_value=0.0)
+    return {level: tables[level] for level in SUNBURST_RANKS[1:] if level in tables}
+
+
+def level_payload(table):
+    """Compact JSON-ready arrays for one level: lineages plus sparse per-sample values"""
+    lineages = ["|".join(map(str, idx)) for idx in table.index]
+    values = np.round(table.to_numpy(dtype=np.float64), ROUND_DIGITS)
+    payload = {"taxa": lineages, "samples": []}
+    for j in range(values.shape[1]):
+        nz = np.flatnonzero(values[:, j])
+        payload["samples"].append([nz.tolist(), values[nz, j].tolist()])
+    return payload
+
+
+def site_of(sample_id):
+    """NEON site code of a sample ID such as SCBI_012"""
+    return sample_id.split("_")[0]
+
+
+def build_explorer(tables, output_path, plotlyjs="inline", title="MetaPhlAn cohort taxonomy explorer"):
+    """Write the single-file explorer HTML from cohort_level_tables output."""
+    levels = list(tables)
+    samples = list(next(iter(tables.values())).columns)
+    meta = {"levels": levels, "samples": samples, "sites": [site_of(s) for s in samples]}
+
+    level_blocks = "\n".join(
+        f'<script type="application/json" id="level-{level}">'
+        f'{json.dumps(level_payload(table), separators=(",", ":"))}</script>'
+        for level, table in tables.items()
+    )
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if plotlyjs == "directory":
+        plotly_tag = f'<script src="{PLOTLY_BUNDLE}"></script>'
+        bundle = os.path.join(os.path.dirname(output_path) or ".", PLOTLY_BUNDLE)
+        if not os.path.exists(bundle):
+            with open(bundle, "w", encoding="utf-8") as f:
+                f.write(get_plotlyjs())
+    else:
+        plotly_tag = f"<script>{get_plotlyjs()}</script>"
+
+    html = (EXPLORER_TEMPLATE
+            .replace("__TITLE__", title)
+            .replace("__PLOTLY__", plotly_tag)
+            .replace("__LEVELS__", level_blocks)
+            .replace("__META__", json.dumps(meta, separators=(",", ":"))))
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return output_path
+
+
+EXPLORER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+__PLOTLY__
+<style>
+  body { font-family: sans-serif; margin: 16px; }
+  #controls { display: flex; gap: 16px; align-items: flex-start; margin-bottom: 12px; }
+  #controls label { display: block; font-weight: bold; margin-bottom: 4px; }
+  #samples { min-width: 180px; height: 140px; }
+  #views { display: flex; flex-wrap: wrap; }
+  #sunburst { width: 600px; height: 600px; }
+  #bars { flex: 1; min-width: 600px; height: 600px; }
+</style>
+</head>
+<body>
+<h2>__TITLE__</h2>
+<div id="controls">
+  <div><label for="level">Level</label><select id="level"></select></div>
+  <div><label for="site">Site</label><select id="site"></select></div>
+  <div><label for="samples">Samples (none selected = whole site)</label><select id="samples" multiple></select></div>
+  <div><label for="topn">Top taxa in bars</label><input id="topn" type="number" value="15" min="1" max="100"></div>
+</div>
+<div id="views"><div id="sunburst"></div><div id="bars"></div></div>
+__LEVELS__
+<script>
+const META = __META__;
+const cache = {};
+
+// Levels are parsed from their JSON block the first time they are shown
+function levelData(name) {
+  if (!cache[name]) {
+    cache[name] = JSON.parse(document.getElementById("level-" + name).textContent);
+  }
+  return cache[name];
+}
+
+function fillSelect(el, values, labels) {
+  el.innerHTML = "";
+  values.forEach((v, i) => {
+    const opt = document.createElement("option");
+    opt.value = v;
+    opt.textContent = labels ? labels[i] : v;
+    el.appendChild(opt);
+  });
+}
+
+function selectedSamples() {
+  const picked = Array.from(document.getElementById("samples").selectedOptions).map(o => +o.value);
+  if (picked.length) return picked;
+  const site = document.getElementById("site").value;
+  return META.samples.map((s, i) => i).filter(i => site === "All sites" || META.sites[i] === site);
+}
+
+function refreshSamples() {
+  const site = document.getElementById("site").value;
+  const idx = META.samples.map((s, i) => i).filter(i => site === "All sites" || META.sites[i] === site);
+  fillSelect(document.getElementById("samples"), idx, idx.map(i => META.samples[i]));
+}
+
+function meanAbundance(data, sel) {
+  const mean = new Float64Array(data.taxa.length);
+  sel.forEach(j => {
+    const [idx, val] = data.samples[j];
+    for (let k = 0; k < idx.length; k++) mean[idx[k]] += val[k] / sel.length;
+  });
+  return mean;
+}
+
+function drawSunburst(data, mean, title) {
+  // Every lineage prefix becomes a node; parents hold the sum of children
+  const totals = new Map();
+  data.taxa.forEach((lineage, t) => {
+    if (!mean[t]) return;
+    const parts = lineage.split("|");
+    for (let d = 1; d <= parts.length; d++) {
+      const id = parts.slice(0, d).join("|");
+      totals.set(id, (totals.get(id) || 0) + mean[t]);
+    }
+  });
+  const ids = Array.from(totals.keys());
+  Plotly.react("sunburst", [{
+    type: "sunburst", branchvalues: "total", ids: ids,
+    labels: ids.map(id => id.split("|").pop()),
+    parents: ids.map(id => id.includes("|") ? id.slice(0, id.lastIndexOf("|")) : ""),
+    values: ids.map(id => totals.get(id)),
+  }], {title: title, margin: {t: 40, l: 0, r: 0, b: 0}});
+}
+
+function drawBars(data, sel, mean, topn) {
+  const top = Array.from(mean.keys()).filter(t => mean[t] > 0)
+    .sort((a, b) => mean[b] - mean[a]).slice(0, topn);
+  const names = sel.map(j => META.samples[j]);
+  const traces = top.map(t => ({type: "bar", name: data.taxa[t].split("|").pop(), x: names, y: sel.map(() => 0)}));
+  const other = {type: "bar", name: "Other", x: names, y: sel.map(() => 0), marker: {color: "#cccccc"}};
+  const slot = new Map(top.map((t, i) => [t, i]));
+  sel.forEach((j, col) => {
+    const [idx, val] = data.samples[j];
+    for (let k = 0; k < idx.length; k++) {
+      if (slot.has(idx[k])) traces[slot.get(idx[k])].y[col] += val[k];
+      else other.y[col] += val[k];
+    }
+  });
+  Plotly.react("bars", traces.concat([other]), {
+    barmode: "stack", title: "Per-sample composition", yaxis: {title: "Relative abundance (%)"},
+    margin: {t: 40}, legend: {font: {size: 10}},
+  });
+}
+
+function update() {
+  const level = document.getElementById("level").value;
+  const data = levelData(level);
+  const sel = selectedSamples();
+  if (!sel.length) return;
+  const mean = meanAbundance(data, sel);
+  const label = sel.length === 1 ? META.samples[sel[0]] : `mean of ${sel.length} samples`;
+  drawSunburst(data, mean, `${level} level: ${label}`);
+  drawBars(data, sel, mean, +document.getElementById("topn").value || 15);
+}
+
+fillSelect(document.getElementById("level"), META.levels);
+fillSelect(document.getElementById("site"), ["All sites"].concat(Array.from(new Set(META.sites)).sort()));
+document.getElementById("level").value = META.levels.includes("Phylum") ? "Phylum" : META.levels[0];
+refreshSamples();
+document.getElementById("level").onchange = update;
+document.getElementById("site").onchange = () => { refreshSamples(); update(); };
+document.getElementById("samples").onchange = update;
+document.getElementById("topn").onchange = update;
+update();
+</script>
+</body>
+</html>
+"""
+
+
+# ==============================================================
+# Build the explorer for all MetaPhlAn outputs in a folder
+# ==============================================================
+if __name__ == "__main__":
+    input_dir = r"C:\Users\hadis\OneDrive\Documents\Project\Ga_output\MetaphlanOutput.rocrate\relative_abundances"
+    output_path = r"C:\Users\hadis\OneDrive\Documents\Project\Soil_Pipeline\soil-pipeline\Metaphlan_cohort_explorer.html"
+
+    parser = argparse.ArgumentParser(description="Single-file cohort MetaPhlAn taxonomy explorer")
+    parser.add_argument("--input-dir", default=input_dir, help="Directory with MetaPhlAn outputs")
+    parser.add_argument("--output", default=output_path, help="Explorer HTML file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes for parsing")
+    parser.add_argument("--plotlyjs", choices=["inline", "directory"], default="inline",
+                        help="Embed plotly.js once, or reference plotly.min.js next to the HTML")
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.input_dir) if f.endswith(PROFILE_EXTENSIONS))
+    tables = cohort_level_tables([os.path.join(args.input_dir, f) for f in files], args.workers)
+    build_explorer(tables, args.output, args.plotlyjs)
+    n_samples = len(next(iter(tables.values())).columns)
+    print(f"✅ Saved explorer for {n_samples} samples: {args.output}")
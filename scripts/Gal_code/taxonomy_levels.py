@@ -0,0 +1,141 @@
+import os
+import re
+import pandas as pd
+
+# ==============================================================
+# Shared MetaPhlAn merge / taxonomic-level splitting helpers
+# used by merge_metaphlan.py, seprate_full_name.py and
+# merge_file_taxonomic_level.py
+# ==============================================================
+
+TAXA_LEVELS = ["kingdom", "phylum", "class", "order", "family", "genus", "species", "strain"]
+SAMPLE_ID_PATTERN = r"([A-Z]{2,5}_\d{3})"
+PROFILE_EXTENSIONS = (".tabular", ".txt", ".tsv")
+
+
+def find_profiles(input_dir):
+    """List MetaPhlAn output files in input_dir (raises if there are none)."""
+    files = [f for f in os.listdir(input_dir) if f.endswith(PROFILE_EXTENSIONS)]
+    if not files:
+        raise FileNotFoundError("❌ No MetaPhlAn output files found in input directory!")
+    return files
+
+
+def sample_id_from_filename(file, pattern=SAMPLE_ID_PATTERN):
+    """Sample ID such as GUAN_049 from a file name, else the name without extension."""
+    match = re.search(pattern, file) if pattern else None
+    return match.group(1) if match else os.path.splitext(file)[0]
+
+
+def profile_header(file_path):
+    """Column names from the '#clade_name ...' comment line of a MetaPhlAn table, or None."""
+    header = None
+    with open(file_path) as f:
+        for line in f:
+            if not line.startswith("#"):
+                break
+            if "clade_name" in line:
+                header = line.lstrip("#").rstrip("\n").split("\t")
+    return header
+
+
+def read_profile(file_path, sample_id, abundance_col=None):
+    """
+    Read one MetaPhlAn table as a Series of abundances indexed by clade_name.
+
+    abundance_col may be a column name from the '#clade_name ...' header
+    (files without it are skipped) or a position. None picks
+    relative_abundance from the header when present, else the third column
+    (clade, taxid, abundance) or the second. Returns None for unreadable files.
+    """
+    file = os.path.basename(file_path)
+    try:
+        header = profile_header(file_path)
+        df = pd.read_csv(file_path, sep="\t", comment="#", header=None)
+    except Exception as e:
+        print(f"⚠️ Skipping {file} (read error: {e})")
+        return None
+
+    if df.shape[1] < 2:
+        print(f"⚠️ Skipping {file}: not enough columns.")
+        return None
+
+    if abundance_col is None and header and "relative_abundance" in header:
+        abundance_col = "relative_abundance"
+    if isinstance(abundance_col, str):
+        if not header or abundance_col not in header or header.index(abundance_col) >= df.shape[1]:
+            print(f"⚠️ Skipping {file}: no '{abundance_col}' column in its header.")
+            return None
+        abundance_col = header.index(abundance_col)
+    elif abundance_col is None:
+        abundance_col = 2 if df.shape[1] >= 3 else 1
+    s = pd.Series(df.iloc[:, abundance_col].to_numpy(), index=df.iloc[:, 0].to_numpy(), name=sample_id)
+    s.index.name = "clade_name"
+    return s[~s.index.duplicated()]
+
+
+def merge_profiles(input_dir, abundance_col=None, sample_pattern=SAMPLE_ID_PATTERN):
+    """
+    Merge every MetaPhlAn table in input_dir into one clade_name x sample table.
+
+    All profiles are aligned in a single concat instead of a pd.merge loop.
+    The result is sorted by clade_name with missing abundances set to 0.
+    """
+    files = find_profiles(input_dir)
+    print(f"🔍 Found {len(files)} MetaPhlAn files to merge...\n")
+
+    profiles = []
+    for file in files:
+        s = read_profile(os.path.join(input_dir, file), sample_id_from_filename(file, sample_pattern), abundance_col)
+        if s is not None:
+            profiles.append(s)
+    if not profiles:
+        raise ValueError(f"❌ None of the {len(files)} MetaPhlAn files in {input_dir} could be read!")
+
+    merged_df = pd.concat(profiles, axis=1, join="outer", sort=False)
+    merged_df = merged_df.apply(pd.to_numeric, errors="coerce").fillna(0)
+    merged_df = merged_df.sort_index().reset_index()
+    return merged_df
+
+
+def split_taxonomic_levels(merged_df, exact_prefix=False, collapse=False, total_column="total_abundance"):
+    """
+    Split a merged table into one exact-level table per taxonomic level.
+
+    Each clade is assigned to the level of its last component in one pass
+    (the count of "|" separators), so the taxonomy_path of a row is simply its
+    clade_name. exact_prefix additionally keeps only rows whose path contains
+    the level's "|x__" prefix, and collapse sums rows sharing a path.
+
+    Returns {level: DataFrame(taxonomy_path, total_column, samples...)}.
+    """
+    sample_cols = [c for c in merged_df.columns if c != "clade_name"]
+    clades = merged_df["clade_name"].astype(str)
+    depth = clades.str.count(r"\|").to_numpy()
+    values = merged_df[sample_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
+
+    tables = {}
+    for level_idx, level in enumerate(TAXA_LEVELS):
+        mask = depth == level_idx
+        if exact_prefix and level_idx > 0:
+            mask &= clades.str.contains(rf"\|{level[0]}__", regex=True).to_numpy()
+        if not mask.any():
+            continue
+
+        out_df = values[mask].copy()
+        out_df.insert(0, "taxonomy_path", clades[mask].to_numpy())
+        if collapse:
+            out_df = out_df.groupby("taxonomy_path", as_index=False)[sample_cols].sum()
+        out_df.insert(1, total_column, out_df[sample_cols].to_numpy().sum(axis=1))
+        tables[level] = out_df.reset_index(drop=True)
+    return tables
+
+
+def write_level_tables(tables, output_dir):
+    """Write merged_<level>_level.tsv for each table from split_taxonomic_levels."""
+    os.makedirs(output_dir, exist_ok=True)
+    for level, out_df in tables.items():
+        out_path = os.path.join(output_dir, f"merged_{level}_level.tsv")
+        out_df.to_csv(out_path, sep="\t", index=False)
+        print(f"✅ Saved exact {level}-level file: {out_path}")
+        print(f"📊 {out_df.shape[0]} taxa × {out_df.shape[1] - 2} samples\n")
@@ -1,128 +1,323 @@
 from bioblend.galaxy import GalaxyInstance
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import argparse
 import glob
+import json
 import os
+import threading
 import time
 import re
 
 # ------------------------------
-# 1. Connect to Galaxy
+# 1. Galaxy connection settings
 # ------------------------------
-GALAXY_URL = "https://usegalaxy.eu/"
-API_KEY = "5f59788da0ca1fe9a3888de0beade579"  
+# The API key is read from the environment (never commit it):
+#   export GALAXY_API_KEY=...
+GALAXY_URL = os.environ.get("GALAXY_URL", "https://usegalaxy.eu/")
+
+# History states that mean Galaxy is still working on a dataset
+ACTIVE_STATES = ("new", "upload", "queued", "running", "setting_metadata")
+# Job states that end a job without usable outputs
+FAILED_JOB_STATES = ("error", "deleted", "deleted_new", "failed", "paused", "skipped")
+
+# Per-sample stages recorded in the state file
+UPLOADING, RUNNING, DOWNLOADING, DONE, FAILED = "uploading", "running", "downloading", "done", "failed"
+
+
+def connect(url=GALAXY_URL, api_key=None):
+    api_key = api_key or os.environ.get("GALAXY_API_KEY")
+    if not api_key:
+        raise RuntimeError("❌ Set GALAXY_API_KEY to your Galaxy API key.")
+    return GalaxyInstance(url, key=api_key)
 
-gi = GalaxyInstance(GALAXY_URL, key=API_KEY)
 
 # ------------------------------
-# 2. Set directories
+# 2. Find FASTQ pairs
 # ------------------------------
-raw_dir = "/project/def-yuezhang/hazad25/project/raw_sample"
-output_dir = "/project/def-yuezhang/hazad25/project/results/metaphlan_output"
-os.makedirs(output_dir, exist_ok=True)
+def find_pairs(raw_dir):
+    """{sample: {"R1": path, "R2": path}} for the *_R1/_R2.fastq files in raw_dir"""
+    fastqs = sorted(glob.glob(os.path.join(raw_dir, "*.fastq")))
+    pairs = {}
+
+    for f in fastqs:
+        # Extract sample name (everything before _R1 or _R2)
+        base = re.sub(r"_R[12]\.fastq$", "", os.path.basename(f))
+        if base not in pairs:
+            pairs[base] = {"R1": None, "R2": None}
+        if "_R1" in f:
+            pairs[base]["R1"] = f
+        elif "_R2" in f:
+            pairs[base]["R2"] = f
+    return pairs
+
 
 # ------------------------------
-# 3. Find FASTQ pairs
+# 3. Find MetaPhlAn Tool
 # ------------------------------
-fastqs = sorted(glob.glob(os.path.join(raw_dir, "*.fastq")))
-pairs = {}
+def find_metaphlan_tool(gi):
+    print("🔍 Searching for MetaPhlAn tool...")
+    tools = gi.tools.get_tools(name="MetaPhlAn")
+    if not tools:
+        raise ValueError("❌ MetaPhlAn tool not found on this Galaxy instance.")
+    print(f"⚙️ Using tool: {tools[0]['name']} ({tools[0]['id']})")
+    return tools[0]["id"]
 
-for f in fastqs:
-    # Extract sample name (everything before _R1 or _R2)
-    base = re.sub(r"_R[12]\.fastq$", "", os.path.basename(f))
-    if base not in pairs:
-        pairs[base] = {"R1": None, "R2": None}
-    if "_R1" in f:
-        pairs[base]["R1"] = f
-    elif "_R2" in f:
-        pairs[base]["R2"] = f
-
-print(f"🧾 Found {len(pairs)} paired samples: {list(pairs.keys())}")
 
 # ------------------------------
-# 4. Find MetaPhlAn Tool
+# 4. Persistent run state
 # ------------------------------
-print("🔍 Searching for MetaPhlAn tool...")
-tools = gi.tools.get_tools(name="MetaPhlAn")
-if not tools:
-    raise ValueError("❌ MetaPhlAn tool not found on this Galaxy instance.")
-metaphlan_tool_id = tools[0]["id"]
-print(f"⚙️ Using tool: {tools[0]['name']} ({metaphlan_tool_id})")
+class RunState:
+    """
+    Per-sample progress in a JSON file, rewritten atomically on every change,
+    so a restarted run resumes (polls / downloads) instead of resubmitting.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.samples = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.samples = json.load(f)
+
+    def get(self, sample):
+        with self.lock:
+            return dict(self.samples.get(sample, {}))
+
+    def update(self, sample, **fields):
+        with self.lock:
+            self.samples.setdefault(sample, {}).update(fields)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self.samples, f, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+
 
 # ------------------------------
-# 5. Define monitoring function
+# 5. Orchestrator
 # ------------------------------
-def monitor_history(gi, history_id, sample_name):
-    """Wait until all datasets in a history are complete."""
-    print(f"⏳ Monitoring MetaPhlAn job for {sample_name}...")
-    while True:
-        datasets = gi.histories.show_history(history_id, contents=True)
-        states = [d["state"] for d in datasets]
-        if all(s in ["ok", "error"] for s in states):
-            break
-        print(f"  Current dataset states: {states}")
-        time.sleep(60)
-    print(f"✅ MetaPhlAn job finished for {sample_name}")
+class MetaPhlAnOrchestrator:
+    """
+    Keep up to `in_flight` samples between upload and download at once.
+
+    Uploads (R1 and R2 in parallel) and downloads run on thread pools, while
+    the main loop polls every running history with one lightweight
+    show_history call per round. The poll interval doubles from poll_min to
+    poll_max while nothing changes and resets whenever a history finishes;
+    finished uploads/downloads wake the loop immediately.
+    """
+
+    def __init__(self, gi, tool_id, output_dir, state, in_flight=4, transfer_workers=4,
+                 poll_min=10, poll_max=300):
+        self.gi = gi
+        self.tool_id = tool_id
+        self.output_dir = output_dir
+        self.state = state
+        self.in_flight = in_flight
+        self.transfer_workers = transfer_workers
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+
+    # --- stages (run on the transfer pool) ---
+    def _upload_and_submit(self, sample, files, pool):
+        # Anything left in an earlier history was never submitted (no job_id),
+        # so start over in a fresh one rather than stacking uploads on it
+        stale_id = self.state.get(sample).get("history_id")
+        if stale_id:
+            print(f"🗑️ Discarding unfinished history {stale_id} of {sample}")
+            try:
+                self.gi.histories.delete_history(stale_id, purge=True)
+            except Exception as e:
+                print(f"⚠️ Could not delete history {stale_id} ({e}); leaving it in place")
+        history = self.gi.histories.create_history(name=f"{sample}_MetaPhlAn")
+        history_id = history["id"]
+        self.state.update(sample, stage=UPLOADING, history_id=history_id,
+                          r1_id=None, r2_id=None, job_id=None)
+        print(f"🧬 Created history: {history['name']} ({history_id})")
+
+        print(f"📤 Uploading {files['R1']} and {files['R2']}")
+        uploads = [pool.submit(self.gi.tools.upload_file, files[r], history_id) for r in ("R1", "R2")]
+        r1_id, r2_id = (u.result()["outputs"][0]["id"] for u in uploads)
+
+        # Adjust parameter names to match tool definition on your Galaxy instance
+        inputs = {
+            "input_reads": [
+                {"src": "hda", "id": r1_id},
+                {"src": "hda", "id": r2_id}
+            ],
+            # Optional: add params like number of threads or database version here
+            # "nproc": "8",
+            # "database": "mpa_vJan21_CHOCOPhlAnSGB_202103"
+        }
+        run = self.gi.tools.run_tool(history_id, self.tool_id, inputs)
+        job_id = run["jobs"][0]["id"]
+        self.state.update(sample, stage=RUNNING, r1_id=r1_id, r2_id=r2_id, job_id=job_id)
+        print(f"🧠 Submitted MetaPhlAn job {job_id} for {sample}")
+
+    def _download(self, sample, dataset):
+        sample_outdir = os.path.join(self.output_dir, sample)
+        os.makedirs(sample_outdir, exist_ok=True)
+        safe_name = dataset["name"].replace(" ", "_").replace("/", "_")
+        output_path = os.path.join(sample_outdir, f"{safe_name}.dat")
+        if os.path.exists(output_path):
+            return output_path
+        print(f"   ⬇️ {dataset['name']} → {output_path}")
+        self.gi.datasets.download_dataset(
+            dataset["id"],
+            file_path=output_path + ".part",
+            use_default_filename=False,
+            wait_for_completion=True
+        )
+        os.replace(output_path + ".part", output_path)
+        return output_path
+
+    # --- polling (main loop) ---
+    def _history_finished(self, history_id):
+        details = self.gi.histories.show_history(history_id).get("state_details", {})
+        return sum(details.get(s, 0) for s in ACTIVE_STATES) == 0
+
+    def _job_outputs(self, sample):
+        """
+        (datasets, error) for the sample's finished MetaPhlAn job: its output
+        datasets, or the reason it failed. (None, None) while it is still going.
+        """
+        job = self.gi.jobs.show_job(self.state.get(sample)["job_id"])
+        if job["state"] in FAILED_JOB_STATES:
+            return None, f"job {job['id']} ended in state {job['state']!r}"
+        if job["state"] != "ok":
+            return None, None
+        datasets = [self.gi.datasets.show_dataset(out["id"]) for out in job.get("outputs", {}).values()]
+        errored = [ds["name"] for ds in datasets if ds["state"] != "ok"]
+        if errored:
+            return None, f"job {job['id']} outputs not ok: {errored}"
+        return [ds for ds in datasets if not ds.get("deleted")], None
+
+    def run(self, pairs):
+        todo = []
+        for sample, files in pairs.items():
+            if not files["R1"] or not files["R2"]:
+                print(f"⚠️ Skipping {sample} — missing R1 or R2")
+                continue
+            if self.state.get(sample).get("stage") == DONE:
+                print(f"✔️ {sample} already done — skipping")
+                continue
+            todo.append(sample)
+
+        active = {}       # sample -> stage while in flight
+        futures = {}      # future -> (sample, kind)
+        downloads = {}    # sample -> outstanding download count
+        interval = self.poll_min
+        next_poll = 0.0
+
+        with ThreadPoolExecutor(max_workers=self.transfer_workers) as transfers, \
+                ThreadPoolExecutor(max_workers=self.in_flight) as stages:
+            while todo or active:
+                # Admit samples, resuming from the stage recorded in the state file
+                while todo and len(active) < self.in_flight:
+                    sample = todo.pop(0)
+                    st = self.state.get(sample)
+                    if st.get("job_id"):
+                        # Submitted before: poll and download, never resubmit
+                        print(f"🔁 Resuming {sample} ({st.get('stage')})")
+                        active[sample] = RUNNING
+                        next_poll = 0.0
+                    else:
+                        print(f"\n🚀 Processing sample: {sample}")
+                        future = stages.submit(self._upload_and_submit, sample, pairs[sample], transfers)
+                        futures[future] = (sample, "upload")
+                        active[sample] = UPLOADING
+
+                # Poll every running history in one pass
+                if time.monotonic() >= next_poll:
+                    changed = False
+                    for sample in [s for s, stage in active.items() if stage == RUNNING]:
+                        try:
+                            if not self._history_finished(self.state.get(sample)["history_id"]):
+                                continue
+                            datasets, error = self._job_outputs(sample)
+                        except Exception as e:
+                            print(f"⚠️ Polling {sample} failed ({e}); retrying next round")
+                            continue
+                        if error:
+                            # Forget the job so the next run resubmits in a fresh history
+                            print(f"❌ {sample}: {error}")
+                            self.state.update(sample, stage=FAILED, error=error, job_id=None)
+                            active.pop(sample, None)
+                            changed = True
+                            continue
+                        if datasets is None:
+                            continue
+                        changed = True
+                        print(f"✅ MetaPhlAn job finished for {sample}")
+                        self.state.update(sample, stage=DOWNLOADING)
+                        active[sample] = DOWNLOADING
+                        downloads[sample] = len(datasets)
+                        for ds in datasets:
+                            futures[transfers.submit(self._download, sample, ds)] = (sample, "download")
+                        if not datasets:
+                            self._finish(sample, active, downloads)
+                    interval = self.poll_min if changed else min(interval * 2, self.poll_max)
+                    next_poll = time.monotonic() + interval
+
+                # Sleep until the next poll, waking early when a transfer finishes
+                timeout = max(0.0, next_poll - time.monotonic())
+                if not futures:
+                    if active:
+                        time.sleep(timeout)
+                    continue
+                done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sample, kind = futures.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"❌ {sample}: {kind} failed ({e})")
+                        self.state.update(sample, stage=FAILED, error=f"{kind}: {e}")
+                        active.pop(sample, None)
+                        continue
+                    if kind == "upload" and sample in active:
+                        active[sample] = RUNNING
+                    elif kind == "download" and sample in active:
+                        downloads[sample] -= 1
+                        if downloads[sample] == 0:
+                            self._finish(sample, active, downloads)
+
+    def _finish(self, sample, active, downloads):
+        self.state.update(sample, stage=DONE, error=None)
+        active.pop(sample, None)
+        downloads.pop(sample, None)
+        print(f"📁 Results saved in: {os.path.join(self.output_dir, sample)}")
+
 
 # ------------------------------
-# 6. Run MetaPhlAn for each sample pair
+# 6. Run MetaPhlAn for every sample pair
 # ------------------------------
-for sample, files in pairs.items():
-    if not files["R1"] or not files["R2"]:
-        print(f"⚠️ Skipping {sample} — missing R1 or R2")
-        continue
-
-    print(f"\n🚀 Processing sample: {sample}")
-
-    # Create new history per sample
-    history = gi.histories.create_history(name=f"{sample}_MetaPhlAn")
-    print(f"🧬 Created history: {history['name']} ({history['id']})")
-
-    # Upload both reads
-    print(f"📤 Uploading {files['R1']} and {files['R2']}")
-    up_R1 = gi.tools.upload_file(files["R1"], history["id"])
-    up_R2 = gi.tools.upload_file(files["R2"], history["id"])
-    r1_id = up_R1["outputs"][0]["id"]
-    r2_id = up_R2["outputs"][0]["id"]
-
-    # Prepare MetaPhlAn input
-    # Adjust parameter names to match tool definition on your Galaxy instance
-    inputs = {
-        "input_reads": [
-            {"src": "hda", "id": r1_id},
-            {"src": "hda", "id": r2_id}
-        ],
-        # Optional: add params like number of threads or database version here
-        # "nproc": "8",
-        # "database": "mpa_vJan21_CHOCOPhlAnSGB_202103"
-    }
-
-    # Run MetaPhlAn
-    print(f"🧩 Running MetaPhlAn on sample: {sample}")
-    run = gi.tools.run_tool(history["id"], metaphlan_tool_id, inputs)
-    job_id = run["jobs"][0]["id"]
-    print(f"🧠 Submitted job ID: {job_id}")
-
-    # Monitor job completion
-    monitor_history(gi, history["id"], sample)
-
-    # Download results
-    print(f"⬇️ Downloading results for {sample}")
-    datasets = gi.histories.show_history(history["id"], contents=True)
-    sample_outdir = os.path.join(output_dir, sample)
-    os.makedirs(sample_outdir, exist_ok=True)
-
-    for ds in datasets:
-        if ds["state"] == "ok":
-            safe_name = ds["name"].replace(" ", "_").replace("/", "_")
-            output_path = os.path.join(sample_outdir, f"{safe_name}.dat")
-            print(f"   ⬇️ {ds['name']} → {output_path}")
-            gi.datasets.download_dataset(
-                ds["id"],
-                file_path=output_path,
-                use_default_filename=False,
-                wait_for_completion=True
-            )
-
-    print(f"📁 Results saved in: {sample_outdir}")
-
-print("\n🎉 All MetaPhlAn jobs completed successfully!")
-print(f"Results directory: {output_dir}")
+if __name__ == "__main__":
+    raw_dir = "/project/def-yuezhang/hazad25/project/raw_sample"
+    output_dir = "/project/def-yuezhang/hazad25/project/results/metaphlan_output"
+
+    parser = argparse.ArgumentParser(description="Run MetaPhlAn on Galaxy for all FASTQ pairs")
+    parser.add_argument("--raw-dir", default=raw_dir, help="Directory with *_R1.fastq / *_R2.fastq")
+    parser.add_argument("--output-dir", default=output_dir, help="Directory for downloaded results")
+    parser.add_argument("--in-flight", type=int, default=4, help="Samples between upload and download at once")
+    parser.add_argument("--transfer-workers", type=int, default=4, help="Concurrent uploads/downloads")
+    parser.add_argument("--state", help="Resume state file (default: <output-dir>/galaxy_run_state.json)")
+    parser.add_argument("--poll-min", type=float, default=10, help="Shortest history poll interval (s)")
+    parser.add_argument("--poll-max", type=float, default=300, help="Longest history poll interval (s)")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    gi = connect()
+    pairs = find_pairs(args.raw_dir)
+    print(f"🧾 Found {len(pairs)} paired samples: {list(pairs.keys())}")
+
+    state = RunState(args.state or os.path.join(args.output_dir, "galaxy_run_state.json"))
+    orchestrator = MetaPhlAnOrchestrator(gi, find_metaphlan_tool(gi), args.output_dir, state,
+                                         in_flight=args.in_flight, transfer_workers=args.transfer_workers,
+                                         poll_min=args.poll_min, poll_max=args.poll_max)
+    orchestrator.run(pairs)
+
+    failed = [s for s, st in state.samples.items() if st.get("stage") == FAILED]
+    if failed:
+        print(f"\n⚠️ {len(failed)} samples failed (see the state file): {failed}")
+    print("\n🎉 All MetaPhlAn jobs completed!")
+    print(f"Results directory: {args.output_dir}")
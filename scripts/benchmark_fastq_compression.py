@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+
+def compress(src, dst, level, threads):
+    """gzip src into dst with pigz when available (else stdlib gzip); return seconds."""
+    start = time.time()
+    if shutil.which("pigz"):
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            subprocess.run(["pigz", "-c", f"-{level}", "-p", str(threads)], stdin=fin, stdout=fout, check=True)
+    else:
+        with open(src, "rb") as fin, gzip.open(dst, "wb", compresslevel=level) as fout:
+            shutil.copyfileobj(fin, fout, 4 * 1024 * 1024)
+    return time.time() - start
+
+
+def decompress_time(path):
+    """Seconds to stream-decompress path, as a downstream rule reading it would."""
+    start = time.time()
+    with gzip.open(path, "rb") as f:
+        while f.read(4 * 1024 * 1024):
+            pass
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wall-clock vs disk-footprint trade-off of gzip levels on a FASTQ")
+    parser.add_argument("fastq", help="Uncompressed sample FASTQ")
+    parser.add_argument("--levels", nargs="+", type=int, default=[1, 4, 6, 9], help="gzip levels to test")
+    parser.add_argument("--threads", type=int, default=4, help="Compression threads (pigz)")
+    parser.add_argument("--output", help="Optional TSV for the results table")
+    args = parser.parse_args()
+
+    raw_size = os.path.getsize(args.fastq)
+    start = time.time()
+    with open(args.fastq, "rb") as f:
+        while f.read(4 * 1024 * 1024):
+            pass
+    raw_read = time.time() - start
+
+    rows = [("none", raw_size, 1.0, 0.0, raw_read)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for level in args.levels:
+            dst = os.path.join(tmp, f"level{level}.fastq.gz")
+            write_s = compress(args.fastq, dst, level, args.threads)
+            size = os.path.getsize(dst)
+            rows.append((str(level), size, raw_size / size, write_s, decompress_time(dst)))
+
+    lines = ["level\tbytes\tratio\twrite_seconds\tread_seconds"]
+    lines += [f"{lvl}\t{size}\t{ratio:.2f}\t{w:.2f}\t{r:.2f}" for lvl, size, ratio, w, r in rows]
+    print("\n".join(lines))
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    main()
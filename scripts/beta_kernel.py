@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from scipy import sparse
+from scipy.spatial.distance import cdist
+
+# Blocked pairwise dissimilarities for large cohorts.
+#
+# Rows are processed in tiles (i-block x j-block, j <= i) so only two dense
+# row blocks are ever materialized, sparse input included. Every tile is
+# computed with scipy's cdist, the same C kernels skbio's beta_diversity
+# reaches through pdist, and written straight into a memory-mapped
+# condensed vector in lower-triangle row order: entry (i, j), i > j, sits
+# at i * (i - 1) / 2 + j, so appending samples only appends rows.
+#
+# Tile height is capped by a byte budget rather than fixed: every in-flight
+# task carries two dense float64 blocks of tile x n_features, so on wide
+# gene-family tables the tile shrinks to keep 2 * workers tasks in budget.
+METRICS = ["braycurtis", "jaccard", "aitchison"]
+TILE_MEMORY = 512 * 1024 ** 2
+
+def condensed_size(n):
+    return n * (n - 1) // 2
+
+def _dense_rows(X, start, stop):
+    block = X[start:stop]
+    return block.toarray() if sparse.issparse(block) else np.asarray(block, dtype=np.float64)
+
+def _clr_rows(block, pseudocount):
+    logs = np.log(block + pseudocount)
+    return logs - logs.mean(axis=1, keepdims=True)
+
+def _tile(block_i, block_j, metric, pseudocount):
+    """Distances between two dense row blocks"""
+    if metric == "aitchison":
+        return cdist(_clr_rows(block_i, pseudocount), _clr_rows(block_j, pseudocount), "euclidean")
+    return cdist(block_i, block_j, metric)
+
+def _write_tile(out_path, n, i0, j0, dist):
+    """Scatter one tile's lower-triangle entries into the memmapped condensed vector"""
+    out = np.load(out_path, mmap_mode="r+")
+    for r in range(dist.shape[0]):
+        i = i0 + r
+        width = min(dist.shape[1], i - j0)
+        if width <= 0:
+            continue
+        offset = i * (i - 1) // 2 + j0
+        out[offset:offset + width] = dist[r, :width]
+    out.flush()
+    del out
+
+def _run_tile(out_path, n, i0, j0, block_i, block_j, metric, pseudocount):
+    _write_tile(out_path, n, i0, j0, _tile(block_i, block_j, metric, pseudocount))
+
+def tile_rows(n_features, workers=1, tile=1024, memory=TILE_MEMORY):
+    """Rows per tile so that 2 * workers tasks of two float64 blocks fit in memory bytes"""
+    per_row = max(1, n_features) * np.dtype(np.float64).itemsize * 4 * max(1, workers)
+    return int(max(1, min(tile, memory // per_row)))
+
+def _tiles(n, start, tile):
+    """(i0, i1, j0, j1) tiles covering rows start..n-1 against all earlier rows"""
+    for i0 in range(start, n, tile):
+        i1 = min(i0 + tile, n)
+        for j0 in range(0, i1 - 1, tile):
+            yield i0, i1, j0, min(j0 + tile, i1 - 1)
+
+def pairwise_condensed(X, out_path, metric="braycurtis", start=0, tile=1024, workers=1,
+                       pseudocount=1.0, dtype=np.float64, memory=TILE_MEMORY):
+    """
+    Fill the condensed (lower-triangle order) distances of rows start..n-1 of X
+    into the .npy file at out_path, creating it when start == 0.
+
+    X is a samples x features ndarray or scipy sparse matrix. metric is
+    "braycurtis" or "jaccard" (as skbio/scipy on the raw values) or
+    "aitchison" (Euclidean distance of clr(x + pseudocount)). Tiles run on a
+    process pool when workers > 1, with at most 2 * workers tiles in flight;
+    tiles are at most `tile` rows and shrink so those fit in `memory` bytes.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unsupported metric {metric!r}; choose from {METRICS}")
+    if sparse.issparse(X):
+        X = X.tocsr()
+    n = X.shape[0]
+    tile = tile_rows(X.shape[1], workers, tile, memory)
+    if start == 0:
+        np.lib.format.open_memmap(out_path, mode="w+", dtype=dtype, shape=(condensed_size(n),)).flush()
+
+    if workers <= 1:
+        for i0, i1, j0, j1 in _tiles(n, start, tile):
+            _run_tile(out_path, n, i0, j0, _dense_rows(X, i0, i1), _dense_rows(X, j0, j1), metric, pseudocount)
+        return out_path
+
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i0, i1, j0, j1 in _tiles(n, start, tile):
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(pool.submit(_run_tile, out_path, n, i0, j0,
+                                    _dense_rows(X, i0, i1), _dense_rows(X, j0, j1), metric, pseudocount))
+        for future in pending:
+            future.result()
+    return out_path
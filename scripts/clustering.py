@@ -2,30 +2,37 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE
 from umap import UMAP
 from skbio.stats.ordination import nmds
+from distance_cache import distance_matrix
+from pca_backend import BACKENDS as PCA_BACKENDS, fit_pca
+from feature_matrix import build_feature_matrix, is_feature_matrix, open_feature_matrix
 import argparse
 import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from threadpoolctl import threadpool_limits
 
 def load_and_combine_data(file_list):
-    """Load and combine multiple normalized sample files"""
-    dfs = []
-    for f in file_list:
-        sample_name = os.path.basename(f).replace('_normalized.tsv', '')
-        df = pd.read_csv(f, sep='\t', index_col=0)
-        df.columns = [f"{sample_name}_{col}" for col in df.columns]
-        dfs.append(df.T)
-    
-    combined = pd.concat(dfs)
-    return combined.fillna(0)
+    """Load the combined samples x features matrix
+
+    A single feature-matrix store is memory-mapped directly; a list of
+    per-sample TSVs is first appended into a temporary store.
+    """
+    if len(file_list) == 1 and is_feature_matrix(file_list[0]):
+        return open_feature_matrix(file_list[0]).to_frame()
+    with tempfile.TemporaryDirectory() as tmp:
+        matrix = build_feature_matrix(file_list, os.path.join(tmp, 'combined.fmx'), suffix='_clr.tsv')
+        combined = pd.DataFrame(np.array(matrix.values), index=matrix.samples, columns=matrix.features)
+        del matrix
+    return combined
 
-def perform_pca(data, n_components=2):
-    """Perform PCA dimensionality reduction"""
-    pca = PCA(n_components=n_components)
-    pca_results = pca.fit_transform(data)
-    return pca_results, pca.explained_variance_ratio_
+def perform_pca(data, n_components=2, backend="full", batch_size=None):
+    """Perform PCA dimensionality reduction (full, randomized or incremental SVD)"""
+    return fit_pca(data, n_components=n_components, backend=backend, batch_size=batch_size)
 
 def perform_tsne(data, n_components=2, perplexity=30):
     """Perform t-SNE dimensionality reduction"""
@@ -37,16 +44,98 @@ def perform_umap(data, n_components=2, n_neighbors=15):
     umap = UMAP(n_components=n_components, n_neighbors=n_neighbors)
     return umap.fit_transform(data)
 
-def perform_nmds(data, n_components=2):
+def perform_nmds(data, n_components=2, workers=1):
     """Perform NMDS dimensionality reduction"""
-    # Convert to distance matrix (Bray-Curtis)
-    from skbio.diversity import beta_diversity
-    from skbio.stats.distance import DistanceMatrix
-    bc_dm = beta_diversity("braycurtis", data.values, ids=data.index)
+    # Convert to distance matrix (Bray-Curtis), reusing the on-disk cache;
+    # missing tiles are computed on `workers` processes
+    bc_dm = distance_matrix(data, "braycurtis", workers=workers)
     nmds_results = nmds(bc_dm, n_components=n_components)
     return nmds_results.samples.values
 
-def plot_results(results_dict, output_file):
+METHODS = {
+    'PCA': perform_pca,
+    't-SNE': perform_tsne,
+    'UMAP': perform_umap,
+    'NMDS': perform_nmds
+}
+
+def share_matrix(data, block_rows=1024):
+    """Copy a DataFrame's values into shared memory; return the block and a worker spec
+
+    Float matrices keep their dtype (the float32 feature-matrix store stays
+    float32) and are copied in row blocks, so a memory-mapped store is read
+    straight into the shared block without an intermediate in-RAM copy.
+    """
+    values = data.values
+    dtype = values.dtype if values.dtype.kind == 'f' else np.dtype(np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(values.shape[0] * values.shape[1] * dtype.itemsize, 1))
+    shared = np.ndarray(values.shape, dtype=dtype, buffer=shm.buf)
+    for start in range(0, values.shape[0], block_rows):
+        shared[start:start + block_rows] = values[start:start + block_rows]
+    del shared
+    spec = (shm.name, values.shape, dtype.str, list(data.index), list(data.columns))
+    return shm, spec
+
+def run_method(method, spec, options=None, blas_threads=1):
+    """Worker: attach to the shared matrix, run one embedding and time it
+
+    BLAS/OpenMP pools are capped at blas_threads so that the concurrent
+    workers together stay within the requested threads.
+    """
+    name, shape, dtype, index, columns = spec
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        values = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        data = pd.DataFrame(values, index=index, columns=columns, copy=False)
+        with threadpool_limits(blas_threads):
+            start = time.perf_counter()
+            result = METHODS[method](data, **(options or {}))
+            elapsed = time.perf_counter() - start
+        del data, values
+    finally:
+        shm.close()
+    return method, result, elapsed
+
+def split_threads(threads, n_methods):
+    """(worker processes, threads per worker) for running n_methods within threads"""
+    workers = max(1, min(threads, n_methods))
+    return workers, max(1, threads // workers)
+
+def run_methods(data, methods, threads=1, options=None):
+    """Run the selected embeddings concurrently on one shared copy of the matrix
+
+    options maps a method name to extra keyword arguments for its function.
+    """
+    shm, spec = share_matrix(data)
+    workers, blas_threads = split_threads(threads, len(methods))
+    results, timings = {}, {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_method, m, spec, (options or {}).get(m), blas_threads) for m in methods]
+            for future in as_completed(futures):
+                method, result, elapsed = future.result()
+                results[method] = result
+                timings[method] = elapsed
+    finally:
+        shm.close()
+        shm.unlink()
+    # Keep the requested method order for plotting
+    return {m: results[m] for m in methods}, {m: timings[m] for m in methods}
+
+def write_coordinates(results_dict, index, output_file):
+    """Write per-sample 2-D coordinates of every method in long format"""
+    frames = []
+    for method, data in results_dict.items():
+        coords = data[0] if isinstance(data, tuple) else data
+        frames.append(pd.DataFrame({
+            'sample': index,
+            'method': method,
+            'dim1': coords[:, 0],
+            'dim2': coords[:, 1]
+        }))
+    pd.concat(frames, ignore_index=True).to_csv(output_file, sep='\t', index=False)
+
+def plot_results(results_dict, output_file, timings=None):
     """Create multi-panel visualization of all clustering results"""
     methods = list(results_dict.keys())
     n_methods = len(methods)
@@ -68,7 +157,10 @@ def plot_results(results_dict, output_file):
             ax.set_xlabel(f'{method}1')
             ax.set_ylabel(f'{method}2')
         
-        ax.set_title(method.upper())
+        title = method.upper()
+        if timings and method in timings:
+            title += f' ({timings[method]:.1f} s)'
+        ax.set_title(title)
         ax.grid(True)
     
     plt.tight_layout()
@@ -77,23 +169,35 @@ def plot_results(results_dict, output_file):
 
 def main():
     parser = argparse.ArgumentParser(description='Perform clustering analysis')
-    parser.add_argument('--input', nargs='+', required=True, help='Input normalized TSV files')
+    parser.add_argument('--input', nargs='+', required=True, help='Feature-matrix store or per-sample normalized TSV files')
     parser.add_argument('--output', required=True, help='Output PDF file for plots')
+    parser.add_argument('--methods', nargs='+', choices=list(METHODS), default=list(METHODS),
+                        help='Embedding methods to run')
+    parser.add_argument('--threads', type=int, default=1, help='Worker processes (one method each)')
+    parser.add_argument('--pca-backend', choices=PCA_BACKENDS, default='full',
+                        help='PCA solver: exact SVD, randomized SVD or incremental row blocks')
+    parser.add_argument('--coords', help='Optional TSV of per-sample coordinates per method')
+    parser.add_argument('--timings', help='Optional TSV of per-method wall-clock seconds')
     args = parser.parse_args()
 
     # Load and combine data
     combined_data = load_and_combine_data(args.input)
     
-    # Perform all clustering methods
-    results = {
-        'PCA': perform_pca(combined_data),
-        't-SNE': perform_tsne(combined_data),
-        'UMAP': perform_umap(combined_data),
-        'NMDS': perform_nmds(combined_data)
-    }
+    # Perform the selected clustering methods concurrently
+    # NMDS gets its worker's share of the threads for its distance tiles
+    options = {'PCA': {'backend': args.pca_backend},
+               'NMDS': {'workers': split_threads(args.threads, len(args.methods))[1]}}
+    results, timings = run_methods(combined_data, args.methods, args.threads, options)
+    for method, seconds in timings.items():
+        print(f'{method}: {seconds:.2f} s')
     
     # Generate visualization
-    plot_results(results, args.output)
+    plot_results(results, args.output, timings)
+
+    if args.coords:
+        write_coordinates(results, combined_data.index, args.coords)
+    if args.timings:
+        pd.Series(timings, name='seconds').rename_axis('method').to_csv(args.timings, sep='\t')
 
 if __name__ == '__main__':
     main()
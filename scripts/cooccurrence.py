@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import numpy as np
+import pandas as pd
+import networkx as nx
+from concurrent.futures import ThreadPoolExecutor
+from scipy.stats import rankdata
+
+# Taxon co-occurrence networks without a dense taxa x taxa matrix.
+#
+# Taxa are processed in column blocks: each (i-block, j-block) tile,
+# j >= i, is computed with one matrix product and only the pairs passing
+# the threshold are kept, so memory is one tile plus the edge list.
+#   pearson    Pearson r of the abundances
+#   spearman   Pearson r of the per-taxon ranks
+#   sparcc     first-pass SparCC (Friedman & Alm 2012): correlations of the
+#              unobserved log basis abundances, estimated from the log-ratio
+#              variances without the iterative exclusion step
+# Permutation p-values shuffle every taxon independently across samples
+# and recompute only the retained pairs. NumPy matrix products release the
+# GIL, so tiles and permutations run on a thread pool (which also keeps
+# the module safe to call from scripts without a __main__ guard).
+METHODS = ["pearson", "spearman", "sparcc"]
+# |r| at or above this counts as a perfect correlation (duplicated taxa),
+# which the original network excluded with r < 1
+PERFECT = 1 - 1e-12
+
+def _standardize(values):
+    """Columns scaled so that U[:, i] @ U[:, j] is the Pearson r"""
+    centered = values - values.mean(axis=0)
+    norms = np.sqrt((centered ** 2).sum(axis=0))
+    norms[norms == 0] = np.inf  # constant taxa correlate with nothing
+    return centered / norms
+
+class _Prepared:
+    """Per-method transform of a samples x taxa matrix and its tile kernel"""
+
+    def __init__(self, values, method, pseudocount):
+        self.method = method
+        if method == "pearson":
+            self.U = _standardize(values)
+        elif method == "spearman":
+            self.U = _standardize(rankdata(values, axis=0))
+        elif method == "sparcc":
+            logs = np.log(values / values.sum(axis=1, keepdims=True) + pseudocount)
+            n, p = logs.shape
+            if p < 3:
+                raise ValueError("sparcc needs at least 3 taxa")
+            self.L = (logs - logs.mean(axis=0)) / np.sqrt(n - 1)
+            var = (self.L ** 2).sum(axis=0)
+            # Row sums of the variation matrix t_ij = var_i + var_j - 2 cov_ij
+            t = p * var + var.sum() - 2 * self.L.T @ self.L.sum(axis=1)
+            # Basis variances solve ((p - 2) I + 11') w2 = t
+            w2 = (t - t.sum() / (2 * p - 2)) / (p - 2)
+            self.var = var
+            self.w2 = np.maximum(w2, 1e-12)
+            self.w = np.sqrt(self.w2)
+        else:
+            raise ValueError(f"Unknown method {method!r}; choose from {METHODS}")
+
+    def tile(self, i0, i1, j0, j1):
+        if self.method != "sparcc":
+            return self.U[:, i0:i1].T @ self.U[:, j0:j1]
+        cov = self.L[:, i0:i1].T @ self.L[:, j0:j1]
+        t = self.var[i0:i1, None] + self.var[None, j0:j1] - 2 * cov
+        r = (self.w2[i0:i1, None] + self.w2[None, j0:j1] - t) / (2 * self.w[i0:i1, None] * self.w[None, j0:j1])
+        return np.clip(r, -1, 1)
+
+    def pairs(self, rows, cols, chunk=200000):
+        """Values for the given taxon pairs only"""
+        out = np.empty(len(rows))
+        for s in range(0, len(rows), chunk):
+            i, j = rows[s:s + chunk], cols[s:s + chunk]
+            if self.method != "sparcc":
+                out[s:s + chunk] = np.einsum("ne,ne->e", self.U[:, i], self.U[:, j])
+            else:
+                t = self.var[i] + self.var[j] - 2 * np.einsum("ne,ne->e", self.L[:, i], self.L[:, j])
+                out[s:s + chunk] = np.clip((self.w2[i] + self.w2[j] - t) / (2 * self.w[i] * self.w[j]), -1, 1)
+        return out
+
+def _tile_edges(prep, i0, i1, j0, j1, threshold, negative, exclude_perfect):
+    r = prep.tile(i0, i1, j0, j1)
+    strength = np.abs(r) if negative else r
+    keep = strength > threshold
+    if exclude_perfect:
+        keep &= strength < PERFECT
+    if i0 == j0:
+        keep &= np.triu(np.ones(keep.shape, dtype=bool), k=1)
+    rows, cols = np.nonzero(keep)
+    return rows + i0, cols + j0, r[rows, cols]
+
+def _null_exceedances(values, method, pseudocount, rows, cols, observed, n_perm, seed):
+    """Per-edge count of permutations with |r_null| >= |r_observed|"""
+    rng = np.random.default_rng(seed)
+    hits = np.zeros(len(rows), dtype=np.int64)
+    for _ in range(n_perm):
+        null = _Prepared(rng.permuted(values, axis=0), method, pseudocount)
+        hits += np.abs(null.pairs(rows, cols)) >= np.abs(observed)
+    return hits
+
+def benjamini_hochberg(p_values):
+    p = np.asarray(p_values, dtype=np.float64)
+    if len(p) == 0:
+        return p
+    order = np.argsort(p)
+    scaled = p[order] * len(p) / np.arange(1, len(p) + 1)
+    q = np.minimum.accumulate(scaled[::-1])[::-1]
+    out = np.empty_like(q)
+    out[order] = np.minimum(q, 1)
+    return out
+
+def cooccurrence_edges(abundance, method="pearson", threshold=0.7, negative=False, block=1024,
+                       permutations=0, workers=1, seed=0, pseudocount=None, exclude_perfect=True):
+    """
+    Sparse co-occurrence edge list of a taxa x samples abundance DataFrame.
+
+    Keeps pairs with threshold < r < 1 (|r| when negative=True); set
+    exclude_perfect=False to keep perfectly correlated pairs as well.
+    spearman, sparcc and permutations > 0 (two-sided permutation p-values
+    and BH q-values) are opt-in. Returns a DataFrame with source, target, weight[, p_value,
+    q_value], using the taxon names of the index.
+    """
+    taxa = list(abundance.index)
+    values = np.asarray(abundance.T, dtype=np.float64)
+    if pseudocount is None:
+        positive = values[values > 0]
+        rel_min = (positive.min() / values.sum(axis=1).max()) if positive.size else 1.0
+        pseudocount = rel_min / 2
+    prep = _Prepared(values, method, pseudocount)
+
+    p = len(taxa)
+    tiles = [(i0, min(i0 + block, p), j0, min(j0 + block, p))
+             for i0 in range(0, p, block) for j0 in range(i0, p, block)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        parts = list(pool.map(lambda t: _tile_edges(prep, *t, threshold, negative, exclude_perfect), tiles))
+    rows = np.concatenate([part[0] for part in parts]) if parts else np.empty(0, dtype=int)
+    cols = np.concatenate([part[1] for part in parts]) if parts else np.empty(0, dtype=int)
+    weights = np.concatenate([part[2] for part in parts]) if parts else np.empty(0)
+
+    edges = pd.DataFrame({
+        "source": [taxa[i] for i in rows],
+        "target": [taxa[j] for j in cols],
+        "weight": weights,
+    })
+    if permutations > 0 and len(edges):
+        n_workers = max(1, min(workers, permutations))
+        shares = [len(s) for s in np.array_split(np.arange(permutations), n_workers)]
+        seeds = np.random.SeedSequence(seed).spawn(n_workers)
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            hits = sum(pool.map(lambda a: _null_exceedances(values, method, pseudocount, rows, cols,
+                                                            weights, *a), zip(shares, seeds)))
+        edges["p_value"] = (1 + hits) / (1 + permutations)
+        edges["q_value"] = benjamini_hochberg(edges["p_value"])
+    return edges.sort_values("weight", ascending=False, key=np.abs, ignore_index=True)
+
+def build_network(edges, node_attrs=None):
+    """networkx Graph from an edge list; node_attrs maps attribute -> {taxon: value}"""
+    G = nx.from_pandas_edgelist(edges, "source", "target", [c for c in edges.columns
+                                                             if c not in ("source", "target")])
+    for node in G.nodes:
+        G.nodes[node]["label"] = str(node).split("|")[-1]
+    for name, values in (node_attrs or {}).items():
+        nx.set_node_attributes(G, {n: float(values[n]) for n in G.nodes if n in values}, name)
+    return G
+
+def write_network(edges, graphml_path, tsv_path=None, node_attrs=None):
+    """Write the edge list (TSV) and the network (GraphML); return the Graph"""
+    if tsv_path:
+        edges.to_csv(tsv_path, sep="\t", index=False)
+    G = build_network(edges, node_attrs)
+    nx.write_graphml(G, graphml_path)
+    return G
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from beta_kernel import condensed_size, pairwise_condensed
+
+# Condensed distance matrices are cached as float32 in *lower-triangle row
+# order* ((1,0), (2,0), (2,1), (3,0), ...), the layout beta_kernel writes,
+# so appending samples only appends new rows to the file. Each entry is
+# <key>.npy plus a <key>.json manifest with the metric, sample ids and
+# per-row content hashes.
+DEFAULT_CACHE_DIR = os.environ.get("SOIL_PIPELINE_DISTANCE_CACHE", "results/cache/distances")
+
+def _as_matrix(data):
+    """
+    samples x features matrix of a DataFrame without densifying or upcasting:
+    all-sparse frames become CSR and dense frames keep their dtype (float32
+    feature-matrix views stay float32). beta_kernel densifies one tile at a time.
+    """
+    if len(data.dtypes) and all(isinstance(dt, pd.SparseDtype) for dt in data.dtypes):
+        return sparse.csr_matrix(data.sparse.to_coo())
+    return data.to_numpy()
+
+def _row_hashes(X, block_rows=1024):
+    """SHA-1 of every sample row, hashed as float64 so dtype and sparsity do not change the key"""
+    hashes = []
+    for start in range(0, X.shape[0], block_rows):
+        block = X[start:start + block_rows]
+        block = block.toarray() if sparse.issparse(block) else block
+        hashes.extend(hashlib.sha1(row.tobytes()).hexdigest()
+                      for row in np.ascontiguousarray(block, dtype=np.float64))
+    return hashes
+
+def _cache_key(metric, columns_hash, row_hashes):
+    h = hashlib.sha1(f"{metric}:{columns_hash}".encode())
+    for rh in row_hashes:
+        h.update(rh.encode())
+    return h.hexdigest()
+
+def _save_manifest(cache_dir, key, manifest):
+    path = os.path.join(cache_dir, key + ".json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def _find_prefix_entry(cache_dir, metric, columns_hash, row_hashes):
+    """Largest cached entry whose rows are a prefix of row_hashes"""
+    best = None
+    if not os.path.isdir(cache_dir):
+        return None
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(cache_dir, name)) as f:
+            manifest = json.load(f)
+        n = len(manifest["row_hashes"])
+        if (manifest["metric"] == metric and manifest["columns_hash"] == columns_hash
+                and n <= len(row_hashes) and manifest["row_hashes"] == row_hashes[:n]
+                and (best is None or n > len(best[1]["row_hashes"]))):
+            best = (name[:-len(".json")], manifest)
+    return best
+
+def cached_distances(data, metric="braycurtis", cache_dir=DEFAULT_CACHE_DIR, workers=1, tile=1024):
+    """
+    Condensed (lower-triangle order) float32 distances between the rows of a
+    samples x features DataFrame, memory-mapped from the cache.
+
+    An exact hit is loaded directly; if a cached entry covers a prefix of the
+    samples, only the rows of the appended samples are computed. Misses are
+    filled tile by tile by beta_kernel.pairwise_condensed on `workers`
+    processes; sparse and float32 frames are passed through as they are.
+    """
+    values = _as_matrix(data)
+    columns_hash = hashlib.sha1("\t".join(map(str, data.columns)).encode()).hexdigest()
+    row_hashes = _row_hashes(values)
+    key = _cache_key(metric, columns_hash, row_hashes)
+    path = os.path.join(cache_dir, key + ".npy")
+
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        # Per-process name: another rule may be computing the same key; each
+        # publishes a complete file with os.replace
+        tmp_path = os.path.join(cache_dir, f"{key}.{os.getpid()}.tmp.npy")
+        prefix = _find_prefix_entry(cache_dir, metric, columns_hash, row_hashes)
+        start = 0
+        if prefix is not None:
+            start = len(prefix[1]["row_hashes"])
+            old = np.load(os.path.join(cache_dir, prefix[0] + ".npy"), mmap_mode="r")
+            out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32,
+                                            shape=(condensed_size(values.shape[0]),))
+            out[:len(old)] = old
+            out.flush()
+            del out, old
+        pairwise_condensed(values, tmp_path, metric=metric, start=start, tile=tile,
+                           workers=workers, dtype=np.float32)
+        os.replace(tmp_path, path)
+        _save_manifest(cache_dir, key, {"metric": metric, "columns_hash": columns_hash,
+                                        "ids": [str(i) for i in data.index], "row_hashes": row_hashes})
+
+    return np.load(path, mmap_mode="r"), list(data.index)
+
+def to_square(condensed, n):
+    """Square symmetric matrix from a lower-triangle condensed vector"""
+    square = np.zeros((n, n), dtype=np.float64)
+    rows, cols = np.tril_indices(n, -1)
+    square[rows, cols] = condensed
+    square[cols, rows] = condensed
+    return square
+
+def distance_matrix(data, metric="braycurtis", cache_dir=DEFAULT_CACHE_DIR, workers=1):
+    """Cached drop-in for skbio beta_diversity(metric, data.values, ids=data.index)"""
+    from skbio.stats.distance import DistanceMatrix
+    condensed, ids = cached_distances(data, metric, cache_dir, workers)
+    return DistanceMatrix(to_square(condensed, len(ids)), ids=[str(i) for i in ids])
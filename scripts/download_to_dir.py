@@ -1,6 +1,12 @@
 import pandas as pd
 import requests
 import os
+import argparse
+import hashlib
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # ------------------------------
 # Step 3: Download all files for sampled rows
@@ -8,44 +14,167 @@ import os
 
 # Path to sampled metadata CSV in $PROJECT
 sampled_metadata_file = "/home/hazad25/projects/sample_per_site.csv"
-df_sampled = pd.read_csv(sampled_metadata_file)
 
 # Directory to save downloaded files in $PROJECT
 download_neon_dir = "/project/def-yuezhang/hazad25/project/neon_data"
-os.makedirs(download_neon_dir, exist_ok=True)
 
-print(f"\n🔽 Starting downloads of {len(df_sampled)} files...")
+CHUNK_SIZE = 1024 * 1024
 
-for i, row in df_sampled.iterrows():
-    url = row["rawDataFilePath"]
+# Parallel transfers per allocated CPU (downloads are I/O bound)
+TRANSFERS_PER_CPU = 4
 
-    try:
-        sample_prefix = str(row["dnaSampleID"]).split("-")[0]
-        desc = str(row["rawDataFileDescription"])
-        if "R1" in desc:
-            read_suffix = "R1"
-        elif "R2" in desc:
-            read_suffix = "R2"
+
+def make_session(workers, retries=5):
+    """Create a requests session whose connection pool fits the worker count."""
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=2,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "HEAD"],
+    )
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def target_filename(row):
+    """Build <sample>_<R1|R2|UNK>.fastq.gz from a NEON raw-file metadata row."""
+    sample_prefix = str(row["dnaSampleID"]).split("-")[0]
+    desc = str(row["rawDataFileDescription"])
+    if "R1" in desc:
+        read_suffix = "R1"
+    elif "R2" in desc:
+        read_suffix = "R2"
+    else:
+        read_suffix = "UNK"
+    return f"{sample_prefix}_{read_suffix}.fastq.gz"
+
+
+def file_md5(path):
+    """MD5 of a file on disk, read in CHUNK_SIZE blocks."""
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def expected_total_size(response, offset):
+    """Total file size from Content-Range (206) or Content-Length (200), or None."""
+    content_range = response.headers.get("Content-Range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    if length is None:
+        return None
+    return int(length) + (offset if response.status_code == 206 else 0)
+
+
+def download_file(session, url, save_path, md5=None, timeout=60):
+    """
+    Download url to save_path through a .part file.
+
+    An existing .part file is resumed with an HTTP Range request. The file is
+    only renamed into place once its size (and md5, when known) checks out.
+    """
+    part_path = save_path + ".part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    with session.get(url, stream=True, headers=headers, timeout=timeout) as response:
+        if offset and response.status_code == 416:
+            # Complete only if the server's "Content-Range: bytes */N" says so;
+            # an oversized (or unverifiable) .part file is discarded
+            content_range = response.headers.get("Content-Range", "")
+            total = expected_total_size(response, offset) if "/" in content_range else None
+            restart = total != offset
         else:
-            read_suffix = "UNK"
+            restart = False
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                # Server ignored the Range header; start over
+                offset = 0
+            total = expected_total_size(response, offset)
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+
+    if restart:
+        os.remove(part_path)
+        return download_file(session, url, save_path, md5=md5, timeout=timeout)
+
+    size = os.path.getsize(part_path)
+    if total is not None and size != total:
+        raise IOError(f"size mismatch for {os.path.basename(save_path)}: got {size}, expected {total}")
+    if md5 and file_md5(part_path) != md5.lower():
+        os.remove(part_path)
+        raise IOError(f"md5 mismatch for {os.path.basename(save_path)}")
+
+    os.replace(part_path, save_path)
+    return size
 
-        filename = f"{sample_prefix}_{read_suffix}.fastq.gz"
-        save_path = os.path.join(download_neon_dir, filename)
 
+def download_all(df_sampled, out_dir, workers=8, md5_column="checksum"):
+    """Download every rawDataFilePath in df_sampled with a bounded thread pool."""
+    os.makedirs(out_dir, exist_ok=True)
+    has_md5 = md5_column in df_sampled.columns
+
+    jobs = {}
+    for _, row in df_sampled.iterrows():
+        filename = target_filename(row)
+        save_path = os.path.join(out_dir, filename)
         if os.path.exists(save_path):
             print(f"⏩ Skipping (already exists): {filename}")
             continue
+        md5 = row[md5_column] if has_md5 and pd.notna(row[md5_column]) else None
+        jobs[save_path] = (row["rawDataFilePath"], md5)
+
+    print(f"\n🔽 Starting downloads of {len(jobs)} files with {workers} workers...")
+
+    session = make_session(workers)
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(download_file, session, url, save_path, md5): (url, save_path)
+            for save_path, (url, md5) in jobs.items()
+        }
+        for future in as_completed(futures):
+            url, save_path = futures[future]
+            filename = os.path.basename(save_path)
+            try:
+                size = future.result()
+                print(f"✅ Downloaded: {filename} ({size / 1e6:.1f} MB)")
+            except Exception as e:
+                failed.append(url)
+                print(f"❌ Failed to download {url}: {e}")
+    return failed
+
 
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
+def main():
+    parser = argparse.ArgumentParser(description="Download NEON raw FASTQ files in parallel")
+    parser.add_argument("--metadata", default=sampled_metadata_file, help="sample_per_site.csv")
+    parser.add_argument("--outdir", default=download_neon_dir, help="Download directory")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("SLURM_CPUS_PER_TASK") or 1) * TRANSFERS_PER_CPU,
+                        help="Number of parallel transfers")
+    parser.add_argument("--md5-column", default="checksum",
+                        help="Metadata column holding the expected MD5 (skipped if absent)")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
 
-        with open(save_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+    df_sampled = pd.read_csv(args.metadata)
+    failed = download_all(df_sampled, args.outdir, workers=args.workers, md5_column=args.md5_column)
 
-        print(f"✅ Downloaded: {filename}")
+    if failed:
+        print(f"⚠️ {len(failed)} downloads failed; rerun to resume their .part files.")
+        sys.exit(1)
+    else:
+        print("🎉 All downloads complete.")
 
-    except Exception as e:
-        print(f"❌ Failed to download {url}: {e}")
 
-print("🎉 All downloads complete.")
+if __name__ == "__main__":
+    main()
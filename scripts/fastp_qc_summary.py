@@ -4,55 +4,164 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import hashlib
+import sqlite3
 
-# Input JSON files from Snakemake
-json_files = snakemake.input.jsons
+# ------------------------------
+# Persistent QC record store
+# ------------------------------
+# One row per sample, keyed by the fastp JSON's mtime/size and SHA-1, so
+# only new or changed reports are parsed on each run. Per-cycle quality
+# and base-content curves are kept alongside the summary numbers.
 
-records = []
-for filepath in json_files:
+CURVE_SECTIONS = ["read1_before_filtering", "read2_before_filtering",
+                  "read1_after_filtering", "read2_after_filtering"]
+
+
+def open_store(path):
+    """Open (and create if needed) the sqlite QC record store."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    con = sqlite3.connect(path)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS qc_records (
+            sample  TEXT PRIMARY KEY,
+            path    TEXT,
+            mtime   REAL,
+            size    INTEGER,
+            sha1    TEXT,
+            summary TEXT,
+            curves  TEXT
+        )
+    """)
+    return con
+
+
+def sample_name(filepath):
+    """Sample name from results/fastp/{sample}.json (or {sample}_fastp.json)."""
+    name = os.path.basename(filepath)
+    for suffix in ("_fastp.json", ".json"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def file_sha1(filepath):
+    sha1 = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def parse_report(filepath):
+    """Summary numbers and per-cycle curves from one fastp JSON report."""
     with open(filepath) as f:
         data = json.load(f)
-        sample = os.path.basename(filepath).replace("_fastp.json", "")
-        before = data["summary"]["before_filtering"]
-        after = data["summary"]["after_filtering"]
-
-        records.append({
-            "sample": sample,
-            "bases_before": before["total_bases"],
-            "bases_after": after["total_bases"],
-            "q20_before": before["q20_rate"] * 100,
-            "q30_before": before["q30_rate"] * 100,
-            "q20_after": after["q20_rate"] * 100,
-            "q30_after": after["q30_rate"] * 100,
-        })
-
-df = pd.DataFrame(records)
-df_sorted = df.sort_values("bases_before", ascending=False)
-df.to_csv(snakemake.output.csv, index=False)
-
-# Plot 1: Stacked base pair bar plot
-plt.figure(figsize=(10, 6))
-plt.barh(df_sorted["sample"], df_sorted["bases_before"], color="#00BCD4", label="Pre-filtering")
-plt.barh(df_sorted["sample"], df_sorted["bases_after"], color="#F44336", label="Post-filtering")
-plt.xlabel("Base pairs")
-plt.ylabel("Sample")
-plt.title("Raw read QC summary stacked bar plot")
-plt.legend()
-plt.tight_layout()
-plt.savefig(snakemake.output.plot1)
-
-# Plot 2: Q20/Q30 KDEs
-fig, axs = plt.subplots(2, 1, figsize=(10, 6), sharex=True)
-sns.kdeplot(df["q30_before"], fill=True, ax=axs[0], label="Q30", color="gray")
-sns.kdeplot(df["q20_before"], fill=True, ax=axs[0], label="Q20", color="black")
-axs[0].set_title("Base Quality (Pre-filter)")
-axs[0].legend()
-
-sns.kdeplot(df["q30_after"], fill=True, ax=axs[1], label="Q30", color="gray")
-sns.kdeplot(df["q20_after"], fill=True, ax=axs[1], label="Q20", color="black")
-axs[1].set_title("Base Quality (Post-filter)")
-axs[1].set_xlabel("Percentage of high-quality bases")
-axs[1].legend()
-
-plt.tight_layout()
-plt.savefig(snakemake.output.plot2)
\ No newline at end of file
+    before = data["summary"]["before_filtering"]
+    after = data["summary"]["after_filtering"]
+    summary = {
+        "bases_before": before["total_bases"],
+        "bases_after": after["total_bases"],
+        "q20_before": before["q20_rate"] * 100,
+        "q30_before": before["q30_rate"] * 100,
+        "q20_after": after["q20_rate"] * 100,
+        "q30_after": after["q30_rate"] * 100,
+    }
+    curves = {
+        section: {
+            "quality_curves": data[section].get("quality_curves", {}),
+            "content_curves": data[section].get("content_curves", {}),
+        }
+        for section in CURVE_SECTIONS if section in data
+    }
+    return summary, curves
+
+
+def update_store(con, json_files):
+    """Parse only new or changed reports into the store; return how many were parsed."""
+    known = {row[0]: row[1:] for row in con.execute("SELECT sample, mtime, size, sha1 FROM qc_records")}
+    parsed = 0
+    for filepath in json_files:
+        sample = sample_name(filepath)
+        stat = os.stat(filepath)
+        if sample in known and known[sample][:2] == (stat.st_mtime, stat.st_size):
+            continue
+        sha1 = file_sha1(filepath)
+        if sample in known and known[sample][2] == sha1:
+            con.execute("UPDATE qc_records SET path = ?, mtime = ?, size = ? WHERE sample = ?",
+                        (filepath, stat.st_mtime, stat.st_size, sample))
+            continue
+        summary, curves = parse_report(filepath)
+        con.execute("INSERT OR REPLACE INTO qc_records VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (sample, filepath, stat.st_mtime, stat.st_size, sha1,
+                     json.dumps(summary), json.dumps(curves)))
+        parsed += 1
+    con.commit()
+    return parsed
+
+
+def load_summaries(con, samples):
+    """Summary table for the given samples, in the given order."""
+    rows = dict(con.execute("SELECT sample, summary FROM qc_records"))
+    return pd.DataFrame([{"sample": s, **json.loads(rows[s])} for s in samples])
+
+
+def load_curves(con, sample):
+    """Per-cycle quality/content curves stored for one sample."""
+    row = con.execute("SELECT curves FROM qc_records WHERE sample = ?", (sample,)).fetchone()
+    return json.loads(row[0]) if row else {}
+
+
+def summarize(json_files, store_path):
+    """Refresh the store from json_files and return their summary table (input order)."""
+    with open_store(store_path) as con:
+        n_parsed = update_store(con, json_files)
+        df = load_summaries(con, [sample_name(f) for f in json_files])
+    con.close()
+    print(f"Parsed {n_parsed} new/changed fastp reports; {len(df)} samples in summary")
+    return df
+
+
+def plot_summary(df, plot1, plot2):
+    df_sorted = df.sort_values("bases_before", ascending=False)
+
+    # Plot 1: Stacked base pair bar plot
+    plt.figure(figsize=(10, 6))
+    plt.barh(df_sorted["sample"], df_sorted["bases_before"], color="#00BCD4", label="Pre-filtering")
+    plt.barh(df_sorted["sample"], df_sorted["bases_after"], color="#F44336", label="Post-filtering")
+    plt.xlabel("Base pairs")
+    plt.ylabel("Sample")
+    plt.title("Raw read QC summary stacked bar plot")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(plot1)
+
+    # Plot 2: Q20/Q30 KDEs
+    fig, axs = plt.subplots(2, 1, figsize=(10, 6), sharex=True)
+    sns.kdeplot(df["q30_before"], fill=True, ax=axs[0], label="Q30", color="gray")
+    sns.kdeplot(df["q20_before"], fill=True, ax=axs[0], label="Q20", color="black")
+    axs[0].set_title("Base Quality (Pre-filter)")
+    axs[0].legend()
+
+    sns.kdeplot(df["q30_after"], fill=True, ax=axs[1], label="Q30", color="gray")
+    sns.kdeplot(df["q20_after"], fill=True, ax=axs[1], label="Q20", color="black")
+    axs[1].set_title("Base Quality (Post-filter)")
+    axs[1].set_xlabel("Percentage of high-quality bases")
+    axs[1].legend()
+
+    plt.tight_layout()
+    plt.savefig(plot2)
+
+
+def main():
+    # Input JSON files from Snakemake
+    json_files = snakemake.input.jsons
+    store_path = snakemake.params.get("store", os.path.join(os.path.dirname(snakemake.output.csv),
+                                                            "fastp_qc_store.sqlite"))
+    df = summarize(json_files, store_path)
+    df.to_csv(snakemake.output.csv, index=False)
+    plot_summary(df, snakemake.output.plot1, snakemake.output.plot2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Binary samples x features matrix shared by the clustering, indicator-species
+# and supervised-learning rules. A store is a directory:
+#   values.npy    float32 samples x features, read memory-mapped
+#   samples.tsv   one sample id per line (row order)
+#   features.tsv  one feature id per line (column order)
+#   segments/     samples appended since the last compaction
+# New features are only ever added at the end of the feature index, so an
+# appended segment is a dense block over the first k features; close()
+# merges the segments into values.npy block by block, padding with zeros
+# (the old fillna(0)). features.tsv is rewritten before each segment is
+# published, so a builder reopened after a crash knows every segment's
+# columns.
+VALUES = "values.npy"
+SAMPLES = "samples.tsv"
+FEATURES = "features.tsv"
+SEGMENTS = "segments"
+
+def _read_ids(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.rstrip("\n") for line in f]
+
+def _write_ids(path, ids):
+    with open(path + ".tmp", "w") as f:
+        f.writelines(f"{i}\n" for i in ids)
+    os.replace(path + ".tmp", path)
+
+def is_feature_matrix(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, VALUES))
+
+class FeatureMatrixBuilder:
+    """
+    Append samples to a feature-matrix store, creating it if needed.
+
+    append() takes samples x features DataFrames; rows are buffered and
+    written as float32 segments of about flush_rows samples, so memory stays
+    bounded by one segment. close() (or leaving the with-block) compacts the
+    store so readers see a single memory-mappable values.npy.
+    """
+
+    def __init__(self, path, flush_rows=256):
+        self.path = path
+        self.flush_rows = flush_rows
+        os.makedirs(os.path.join(path, SEGMENTS), exist_ok=True)
+        self.samples = _read_ids(os.path.join(path, SAMPLES))
+        self.features = _read_ids(os.path.join(path, FEATURES))
+        self._feature_pos = {f: i for i, f in enumerate(self.features)}
+        self._known = set(self.samples)
+        self._buffer = []
+        self._buffered = 0
+        self._segments = sorted(p for p in glob.glob(os.path.join(path, SEGMENTS, "*.npy"))
+                                if not p.endswith(".tmp.npy"))
+        stored = len(self.samples)
+        for seg in self._segments:
+            width = np.load(seg, mmap_mode="r").shape[1]
+            if width > len(self.features):
+                raise ValueError(f"{seg} has {width} features but {FEATURES} lists {len(self.features)}")
+            self._add_samples(_read_ids(seg[:-len(".npy")] + ".samples.tsv"))
+        values_path = os.path.join(path, VALUES)
+        if (self._segments and os.path.exists(values_path)
+                and np.load(values_path, mmap_mode="r").shape[0] == len(self.samples) != stored):
+            # close() was interrupted after values.npy already took the segments in
+            self._finish_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    def __contains__(self, sample):
+        return str(sample) in self._known
+
+    def _add_samples(self, ids):
+        duplicated = self._known.intersection(ids)
+        if duplicated:
+            raise ValueError(f"Samples already in {self.path}: {sorted(duplicated)[:5]}")
+        self.samples.extend(ids)
+        self._known.update(ids)
+
+    def append(self, frame):
+        """Buffer a samples x features DataFrame; unseen features extend the index"""
+        ids = [str(i) for i in frame.index]
+        self._add_samples(ids)
+        for feature in map(str, frame.columns):
+            if feature not in self._feature_pos:
+                self._feature_pos[feature] = len(self.features)
+                self.features.append(feature)
+        self._buffer.append((ids, frame))
+        self._buffered += len(ids)
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered samples as one segment"""
+        if not self._buffer:
+            return
+        block = np.zeros((self._buffered, len(self.features)), dtype=np.float32)
+        ids, row = [], 0
+        for frame_ids, frame in self._buffer:
+            cols = [self._feature_pos[str(c)] for c in frame.columns]
+            block[row:row + len(frame_ids), cols] = np.nan_to_num(frame.to_numpy(dtype=np.float32))
+            ids.extend(frame_ids)
+            row += len(frame_ids)
+        seg = os.path.join(self.path, SEGMENTS, f"{len(self._segments):06d}")
+        np.save(seg + ".tmp.npy", block)
+        _write_ids(seg + ".samples.tsv", ids)
+        _write_ids(os.path.join(self.path, FEATURES), self.features)
+        os.replace(seg + ".tmp.npy", seg + ".npy")
+        self._segments.append(seg + ".npy")
+        self._buffer, self._buffered = [], 0
+
+    def close(self, block_rows=1024):
+        """Merge values.npy and all segments into a new values.npy"""
+        self.flush()
+        values_path = os.path.join(self.path, VALUES)
+        if self._segments or not os.path.exists(values_path):
+            tmp_path = os.path.join(self.path, "values.tmp.npy")
+            out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32,
+                                            shape=(len(self.samples), len(self.features)))
+            row = 0
+            parts = ([values_path] if os.path.exists(values_path) else []) + self._segments
+            for part in parts:
+                src = np.load(part, mmap_mode="r")
+                for start in range(0, src.shape[0], block_rows):
+                    block = src[start:start + block_rows]
+                    out[row:row + len(block), :block.shape[1]] = block
+                    out[row:row + len(block), block.shape[1]:] = 0
+                    row += len(block)
+                del src
+            out.flush()
+            del out
+            os.replace(tmp_path, values_path)
+        self._finish_close()
+
+    def _finish_close(self):
+        """Record the ids of a freshly written values.npy and drop the merged segments"""
+        _write_ids(os.path.join(self.path, SAMPLES), self.samples)
+        _write_ids(os.path.join(self.path, FEATURES), self.features)
+        shutil.rmtree(os.path.join(self.path, SEGMENTS))
+        os.makedirs(os.path.join(self.path, SEGMENTS))
+        self._segments = []
+
+class FeatureMatrix:
+    """Read-only view of a compacted store; values is a float32 memmap"""
+
+    def __init__(self, path):
+        if os.listdir(os.path.join(path, SEGMENTS)):
+            raise ValueError(f"{path} has uncompacted segments; close its builder first")
+        self.path = path
+        self.values = np.load(os.path.join(path, VALUES), mmap_mode="r")
+        self.samples = _read_ids(os.path.join(path, SAMPLES))
+        self.features = _read_ids(os.path.join(path, FEATURES))
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def to_frame(self, samples=None):
+        """samples x features DataFrame; zero-copy over the memmap unless rows are selected"""
+        if samples is None:
+            return pd.DataFrame(self.values, index=self.samples, columns=self.features, copy=False)
+        pos = {s: i for i, s in enumerate(self.samples)}
+        rows = [pos[str(s)] for s in samples]
+        return pd.DataFrame(self.values[rows], index=[self.samples[i] for i in rows], columns=self.features)
+
+    def export_tsv(self, out_path, block_rows=1024):
+        """Write the matrix as the samples x features TSV the R scripts read"""
+        with open(out_path, "w") as f:
+            f.write("\t".join([""] + self.features) + "\n")
+            for start in range(0, len(self.samples), block_rows):
+                block = pd.DataFrame(self.values[start:start + block_rows],
+                                     index=self.samples[start:start + block_rows])
+                block.to_csv(f, sep="\t", header=False)
+
+def open_feature_matrix(path):
+    return FeatureMatrix(path)
+
+def read_sample_table(path, suffix=".tsv"):
+    """
+    One per-sample normalized table (features x columns) as samples x features.
+
+    Rows are named after the file (minus suffix); tables with several columns
+    get one row per column, named {sample}_{column}.
+    """
+    sample = os.path.basename(path)
+    if sample.endswith(suffix):
+        sample = sample[:-len(suffix)]
+    df = pd.read_csv(path, sep="\t", index_col=0)
+    df = df[~df.index.duplicated()]
+    rows = df.T
+    rows.index = [sample] if df.shape[1] == 1 else [f"{sample}_{col}" for col in df.columns]
+    return rows
+
+def build_feature_matrix(input_files, out_path, suffix=".tsv", flush_rows=256):
+    """Append per-sample tables to the store at out_path, skipping samples it already holds"""
+    with FeatureMatrixBuilder(out_path, flush_rows=flush_rows) as builder:
+        for f in input_files:
+            rows = read_sample_table(f, suffix)
+            rows = rows.loc[[i for i in rows.index if i not in builder]]
+            if len(rows):
+                builder.append(rows)
+    return open_feature_matrix(out_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the binary samples x features matrix from per-sample tables")
+    parser.add_argument("--inputs", nargs="+", required=True, help="Per-sample normalized TSV files")
+    parser.add_argument("--output", required=True, help="Feature-matrix store directory")
+    parser.add_argument("--suffix", default=".tsv", help="Filename suffix stripped to get the sample id")
+    parser.add_argument("--append", action="store_true",
+                        help="Add new samples to an existing store instead of rebuilding it")
+    parser.add_argument("--tsv", help="Optional samples x features TSV export (for the R scripts)")
+    args = parser.parse_args()
+
+    if not args.append and os.path.exists(args.output):
+        shutil.rmtree(args.output)
+    matrix = build_feature_matrix(args.inputs, args.output, args.suffix)
+    print(f"{args.output}: {matrix.shape[0]} samples x {matrix.shape[1]} features")
+    if args.tsv:
+        matrix.export_tsv(args.tsv)
+
+if __name__ == "__main__":
+    main()
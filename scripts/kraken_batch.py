@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+# Kraken2 + Bracken for a batch of samples in one job.
+#
+# kraken2 --memory-mapping maps the hash table instead of reading it into
+# private memory, so after the first sample the database is served from the
+# page cache and every later sample in the batch (and any concurrent job on
+# the node) reuses it. --stage-db copies the *.k2d files to a shared-memory
+# directory such as /dev/shm once per node for the same effect on slow
+# network filesystems. The staged copy is left in place for later batches
+# on the node; files in /dev/shm count against the job's memory, so remove
+# it with `rm -rf <stage-dir>` once the cohort is done (the sbatch script's
+# combine job does this). The `combine` subcommand builds the cohort matrix
+# from the per-sample Bracken reports (the format of Bracken's
+# combine_bracken_outputs.py); only it needs pandas, so `run` works in an
+# environment with just kraken2 and bracken.
+BRACKEN_KEYS = ["name", "taxonomy_id", "taxonomy_lvl"]
+
+
+def _same_file(src, dst):
+    """dst is a finished copy of src: same size and the mtime copy2 carried over"""
+    if not os.path.exists(dst):
+        return False
+    s, d = os.stat(src), os.stat(dst)
+    return s.st_size == d.st_size and int(s.st_mtime) == int(d.st_mtime)
+
+def stage_database(db, stage_dir):
+    """Copy the Kraken2 index files (*.k2d) to stage_dir unless identical copies exist"""
+    os.makedirs(stage_dir, exist_ok=True)
+    for src in glob.glob(os.path.join(db, "*.k2d")):
+        dst = os.path.join(stage_dir, os.path.basename(src))
+        if _same_file(src, dst):
+            continue
+        # Per-process temporary name: concurrent tasks on the node may stage
+        # at once, and each publishes a complete copy with os.replace
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    return stage_dir
+
+
+def amend_report(report, amended):
+    """Strip the padding of every tab-separated field (taxon names keep their spaces)"""
+    with open(report) as fin, open(amended, "w") as fout:
+        for line in fin:
+            fout.write("\t".join(field.strip() for field in line.rstrip("\n").split("\t")) + "\n")
+
+
+def run_sample(sample, r1, r2, args, kraken_db):
+    prefix = os.path.join(args.outdir, sample)
+    start = time.time()
+    kraken = [args.kraken2, "--db", kraken_db, "--threads", str(args.threads), "--use-names",
+              "--memory-mapping", "--report", f"{prefix}.kraken_report",
+              "--output", f"{prefix}.kraken_output" if args.keep_output else "-",  # "-" drops per-read lines
+              r1, r2]
+    subprocess.run(kraken, check=True)
+    amend_report(f"{prefix}.kraken_report", f"{prefix}_amend.report")
+    subprocess.run([args.bracken, "-d", args.db, "-i", f"{prefix}_amend.report",
+                    "-o", f"{prefix}.bracken_report", "-r", str(args.read_len),
+                    "-l", args.level, "-t", str(args.bracken_threshold)], check=True)
+    print(f"[{sample}] kraken2 + bracken in {time.time() - start:.1f} s", flush=True)
+
+
+def combine_reports(reports, samples, output):
+    """One row per taxon, {sample}_num and {sample}_frac columns per sample"""
+    import pandas as pd
+    merged = None
+    for sample, path in zip(samples, reports):
+        df = pd.read_csv(path, sep="\t")
+        df = df[BRACKEN_KEYS + ["new_est_reads", "fraction_total_reads"]]
+        df.columns = BRACKEN_KEYS + [f"{sample}_num", f"{sample}_frac"]
+        merged = df if merged is None else merged.merge(df, on=BRACKEN_KEYS, how="outer")
+    value_cols = [c for c in merged.columns if c not in BRACKEN_KEYS]
+    merged[value_cols] = merged[value_cols].fillna(0)
+    num_cols = [f"{s}_num" for s in samples]
+    merged[num_cols] = merged[num_cols].astype("int64")
+    merged.sort_values(BRACKEN_KEYS[0]).to_csv(output, sep="\t", index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched Kraken2/Bracken classification")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Classify a batch of samples with one database load")
+    run.add_argument("--db", required=True, help="Kraken2/Bracken database directory")
+    run.add_argument("--samples", nargs="+", required=True)
+    run.add_argument("--r1", nargs="+", required=True, help="R1 files, in --samples order")
+    run.add_argument("--r2", nargs="+", required=True, help="R2 files, in --samples order")
+    run.add_argument("--outdir", required=True)
+    run.add_argument("--threads", type=int, default=1)
+    run.add_argument("--read-len", type=int, default=150, help="Bracken read length (-r)")
+    run.add_argument("--level", default="S", help="Bracken taxonomic level (-l)")
+    run.add_argument("--bracken-threshold", type=int, default=10, help="Bracken read threshold (-t)")
+    run.add_argument("--stage-db", help="Copy *.k2d here first (e.g. /dev/shm/kraken2_db)")
+    run.add_argument("--keep-output", action="store_true", help="Keep per-read .kraken_output files")
+    run.add_argument("--kraken2", default="kraken2", help="kraken2 executable")
+    run.add_argument("--bracken", default="bracken", help="bracken executable")
+
+    combine = sub.add_parser("combine", help="Combine Bracken reports into one matrix")
+    combine.add_argument("--reports", nargs="+", required=True)
+    combine.add_argument("--samples", nargs="+", required=True, help="Sample names, in --reports order")
+    combine.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    if args.command == "combine":
+        if len(args.reports) != len(args.samples):
+            sys.exit("--reports and --samples must have the same length")
+        combine_reports(args.reports, args.samples, args.output)
+        return
+
+    if not (len(args.samples) == len(args.r1) == len(args.r2)):
+        sys.exit("--samples, --r1 and --r2 must have the same length")
+    os.makedirs(args.outdir, exist_ok=True)
+    kraken_db = stage_database(args.db, args.stage_db) if args.stage_db else args.db
+    for sample, r1, r2 in zip(args.samples, args.r1, args.r2):
+        run_sample(sample, r1, r2, args, kraken_db)
+
+
+if __name__ == "__main__":
+    main()
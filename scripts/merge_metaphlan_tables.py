@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
 def read_metaphlan_table(path: Path, sample_name: str) -> pd.DataFrame:
@@ -20,9 +22,91 @@ def read_metaphlan_table(path: Path, sample_name: str) -> pd.DataFrame:
 def infer_sample_name(f: Path) -> str:
     return f.name.replace("_metaphlan_profile.tsv", "") if f.name.endswith("_metaphlan_profile.tsv") else f.stem
 
-def collapse_by_rank(df: pd.DataFrame, rank: str) -> pd.DataFrame:
-    collapsed = df.groupby(lambda x: next((p for p in x.split("|") if p.startswith(rank + "__")), "unclassified")).sum()
-    return collapsed
+def merge_profiles(input_paths, samples=None, threads=1) -> pd.DataFrame:
+    """
+    Merge MetaPhlAn profiles into one clades x samples table.
+
+    Profiles are read (optionally in parallel), a single global clade index is
+    built from all of them, and a preallocated matrix is filled column by
+    column. The result matches the old chain of outer joins: clades sorted
+    when more than one profile is merged, missing values filled with 0.0 and
+    columns ordered by ``samples`` (unknown names become all-NaN columns) or
+    alphabetically.
+    """
+    names = [infer_sample_name(f) for f in input_paths]
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        profiles = list(pool.map(read_metaphlan_table, input_paths, names))
+
+    index_name = profiles[0].index.name
+    clades = pd.Index(np.concatenate([p.index.to_numpy(dtype=object) for p in profiles])).unique()
+    if len(profiles) > 1:
+        clades = clades.sort_values()
+    clades.name = index_name
+
+    columns = list(samples) if samples else sorted(names)
+    positions = {}
+    for j, c in enumerate(columns):
+        positions.setdefault(c, []).append(j)
+
+    matrix = np.full((len(clades), len(columns)), np.nan)
+    for name, profile in zip(names, profiles):
+        rows = clades.get_indexer(profile.index)
+        for j in positions.get(name, []):
+            matrix[:, j] = 0.0
+            matrix[rows, j] = profile.iloc[:, 0].to_numpy(dtype=float)
+
+    return pd.DataFrame(matrix, index=clades, columns=columns)
+
+RANKS = ["k", "p", "c", "o", "f", "g", "s"]
+
+def build_lineage_index(clades, ranks=RANKS) -> dict:
+    """
+    Parse clade strings once into integer codes per rank.
+
+    Returns {rank: (codes, taxa)} where ``codes[i]`` is the position in the
+    sorted ``taxa`` array of the first ``<rank>__`` component of clade i, or of
+    "unclassified" when the clade has none.
+    """
+    parts = pd.Series(np.asarray(clades, dtype=object)).str.split("|").explode()
+    parts = parts[parts.str[1:3] == "__"]
+    parts = pd.DataFrame({"row": parts.index, "rank": parts.str[0], "label": parts.to_numpy()})
+    parts = parts.drop_duplicates(["row", "rank"], keep="first")
+
+    index = {}
+    for r in ranks:
+        labels = np.full(len(clades), "unclassified", dtype=object)
+        hits = parts[parts["rank"] == r]
+        labels[hits["row"].to_numpy()] = hits["label"].to_numpy()
+        codes, taxa = pd.factorize(labels, sort=True)
+        index[r] = (codes, np.asarray(taxa, dtype=object))
+    return index
+
+def collapse_by_rank(df: pd.DataFrame, rank: str, lineage=None) -> pd.DataFrame:
+    """Sum clade rows per taxon of ``rank`` as a segment sum over lineage codes."""
+    if lineage is None:
+        lineage = build_lineage_index(df.index, [rank])
+    codes, taxa = lineage[rank]
+    order = np.argsort(codes, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+    values = np.nan_to_num(df.to_numpy(dtype=float)[order])
+    summed = np.add.reduceat(values, starts, axis=0) if len(starts) else values[:0]
+    return pd.DataFrame(summed, index=taxa, columns=df.columns)
+
+def write_rank_summary(df: pd.DataFrame, out_path: Path, ranks=RANKS) -> None:
+    """Write the long sample_id/taxon/relative_abundance/rank table rank by rank."""
+    lineage = build_lineage_index(df.index, ranks)
+    samples = np.asarray(df.columns, dtype=object)
+    with open(out_path, "w") as fh:
+        fh.write("sample_id\ttaxon\trelative_abundance\trank\n")
+        for r in ranks:
+            collapsed = collapse_by_rank(df, r, lineage)
+            long_df = pd.DataFrame({
+                "sample_id": np.tile(samples, len(collapsed)),
+                "taxon": np.repeat(collapsed.index.to_numpy(), len(samples)),
+                "relative_abundance": collapsed.to_numpy().ravel(),
+                "rank": r,
+            })
+            long_df.to_csv(fh, sep="\t", index=False, header=False)
 
 def main():
     parser = argparse.ArgumentParser()
@@ -30,41 +114,20 @@ def main():
     parser.add_argument("merged_out", help="Merged output TSV")
     parser.add_argument("summary_out", help="Summary output TSV")
     parser.add_argument("--samples", nargs="+", help="Sample order", required=False)
+    parser.add_argument("--threads", type=int, default=1, help="Parallel profile readers")
     args = parser.parse_args()
 
     input_paths = [Path(p) for p in args.inputs]
     merged_out, summary_out = Path(args.merged_out), Path(args.summary_out)
 
-    merged_df = None
-    for f in input_paths:
-        sample = infer_sample_name(f)
-        df = read_metaphlan_table(f, sample)
-        merged_df = df if merged_df is None else merged_df.join(df, how="outer")
-
-    merged_df = merged_df.fillna(0.0)
-
-    # Reorder columns by --samples if provided
-    if args.samples:
-        merged_df = merged_df.reindex(args.samples, axis=1)
-    else:
-        merged_df = merged_df.reindex(sorted(merged_df.columns), axis=1)
+    merged_df = merge_profiles(input_paths, samples=args.samples, threads=args.threads)
 
     merged_out.parent.mkdir(parents=True, exist_ok=True)
     summary_out.parent.mkdir(parents=True, exist_ok=True)
     merged_df.to_csv(merged_out, sep="\t")
 
     # Per-rank summaries
-    ranks = ["k", "p", "c", "o", "f", "g", "s"]
-    summary_frames = []
-    for r in ranks:
-        collapsed = collapse_by_rank(merged_df, r).T
-        collapsed = collapsed.reset_index().melt(id_vars="index", var_name="taxon", value_name="relative_abundance")
-        collapsed = collapsed.rename(columns={"index": "sample_id"})
-        collapsed["rank"] = r
-        summary_frames.append(collapsed)
-
-    summary_df = pd.concat(summary_frames, ignore_index=True)
-    summary_df.to_csv(summary_out, sep="\t", index=False)
+    write_rank_summary(merged_df, summary_out)
 
 if __name__ == "__main__":
     main()
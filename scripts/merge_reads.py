@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import json
+import shutil
+import subprocess
+import sys
+import time
+import zlib
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def open_input(path, threads=1):
+    """Open a FASTQ for binary reading; .gz files are decompressed with pigz when available."""
+    if not path.endswith(".gz"):
+        return open(path, "rb"), None
+    if shutil.which("pigz"):
+        proc = subprocess.Popen(["pigz", "-dc", "-p", str(max(1, threads)), path], stdout=subprocess.PIPE)
+        return proc.stdout, proc
+    return gzip.open(path, "rb"), None
+
+
+def open_output(path, threads=1, level=6):
+    """
+    Open the merged output for binary writing.
+
+    .gz outputs are compressed by a multi-threaded pigz (or bgzip) process fed
+    through a pipe; the stdlib gzip module is the single-threaded fallback.
+    """
+    if not path.endswith(".gz"):
+        return open(path, "wb"), None
+    out = open(path, "wb")
+    commands = {
+        "pigz": ["pigz", "-c", f"-{level}", "-p", str(threads)],
+        "bgzip": ["bgzip", "-c", "-l", str(level), "-@", str(threads)],
+    }
+    for tool, cmd in commands.items():
+        if shutil.which(tool):
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=out)
+            out.close()
+            return proc.stdin, proc
+    out.close()
+    return gzip.open(path, "wb", compresslevel=level), None
+
+
+def copy_gzip_members(path, dst, stats):
+    """
+    Append a .gz file to dst as-is (concatenated gzip members form a valid
+    gzip stream) and count the decompressed bytes/lines without recompressing.
+    Returns the last decompressed byte; raises IOError if the file ends
+    inside a member (a truncated download or an interrupted fastp run).
+    """
+    last = b"\n"
+    decomp = zlib.decompressobj(wbits=31)
+    in_member = False
+    with open(path, "rb") as src:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            dst.write(chunk)
+            while chunk:
+                data = decomp.decompress(chunk)
+                in_member = True
+                stats["bytes"] += len(data)
+                stats["lines"] += data.count(b"\n")
+                last = data[-1:] or last
+                chunk = decomp.unused_data
+                if decomp.eof:
+                    decomp = zlib.decompressobj(wbits=31)
+                    in_member = False
+                else:
+                    break
+    if in_member:
+        raise IOError(f"{path} is truncated: it ends inside a gzip member")
+    return last
+
+
+def merge_reads(inputs, output, threads=1, level=6):
+    """Stream the inputs one after another into output; return bytes/reads processed."""
+    stats = {"inputs": list(inputs), "output": output, "bytes": 0, "lines": 0}
+    start = time.time()
+
+    if output.endswith(".gz") and all(p.endswith(".gz") for p in inputs):
+        # Compressed in, compressed out: no recompression needed
+        with open(output, "wb") as dst:
+            for path in inputs:
+                if copy_gzip_members(path, dst, stats) != b"\n":
+                    dst.write(gzip.compress(b"\n"))
+                    stats["bytes"] += 1
+                    stats["lines"] += 1
+        stats["reads"] = stats["lines"] // 4
+        stats["seconds"] = round(time.time() - start, 2)
+        return stats
+
+    dst, dst_proc = open_output(output, threads, level)
+    try:
+        for path in inputs:
+            src, src_proc = open_input(path, threads)
+            last = b"\n"
+            with src:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    dst.write(chunk)
+                    stats["bytes"] += len(chunk)
+                    stats["lines"] += chunk.count(b"\n")
+                    last = chunk[-1:]
+            if src_proc and src_proc.wait() != 0:
+                raise RuntimeError(f"decompressing {path} failed")
+            # Keep the next file's first record on its own line
+            if last != b"\n":
+                dst.write(b"\n")
+                stats["bytes"] += 1
+                stats["lines"] += 1
+    finally:
+        dst.close()
+        if dst_proc and dst_proc.wait() != 0:
+            raise RuntimeError(f"compressing {output} failed")
+
+    stats["reads"] = stats["lines"] // 4
+    stats["seconds"] = round(time.time() - start, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concatenate trimmed R1/R2 FASTQs into one (optionally gzipped) file")
+    parser.add_argument("--inputs", nargs="+", required=True, help="FASTQ files to merge, in order (.gz allowed)")
+    parser.add_argument("--output", required=True, help="Merged FASTQ; a .gz suffix enables compression")
+    parser.add_argument("--threads", type=int, default=1, help="Compression/decompression threads")
+    parser.add_argument("--level", type=int, default=6, help="gzip compression level")
+    parser.add_argument("--report", help="Optional JSON file for bytes/reads processed")
+    args = parser.parse_args()
+
+    stats = merge_reads(args.inputs, args.output, args.threads, args.level)
+    print(f"Merged {stats['reads']} reads ({stats['bytes']} bytes) into {args.output} "
+          f"in {stats['seconds']} s", file=sys.stderr)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,79 +2,468 @@
 import pandas as pd
 import numpy as np
 import argparse
+import os
+import tempfile
+from scipy import sparse
+from scipy.interpolate import CubicSpline
+from scipy.special import digamma, gammaln
 from skbio.stats.composition import clr
-from biom import load_table
-from biom.util import biom_open
-import rpy2.robjects as ro
-from rpy2.robjects import pandas2ri
-from rpy2.robjects.packages import importr
 
-# Enable pandas-to-R conversion
-pandas2ri.activate()
+# DESeq2 defaults
+MIN_DISP = 1e-8
 
 def load_data(input_file):
     """Load TSV file (HUMAnN/Kraken output) into a pandas DataFrame."""
     df = pd.read_csv(input_file, sep='\t', index_col=0)
     return df
 
+def load_cohort(input_files):
+    """Load several per-sample tables into one features x samples matrix (missing = 0)."""
+    dfs = [load_data(f) for f in input_files]
+    widths = [df.shape[1] for df in dfs]
+    combined = pd.concat(dfs, axis=1, join='outer', sort=False).fillna(0)
+    return combined, widths
+
+def write_per_sample(norm_df, widths, output_files):
+    """Split a normalized cohort matrix back into one TSV per input table."""
+    start = 0
+    for width, output_file in zip(widths, output_files):
+        norm_df.iloc[:, start:start + width].to_csv(output_file, sep='\t')
+        start += width
+
 def normalize_clr(df):
-    """Centered Log-Ratio (CLR) normalization using scikit-bio."""
+    """Centered Log-Ratio (CLR) normalization using scikit-bio (one composition per sample column)."""
     df_clr = pd.DataFrame(
-        clr(df + 1),  # Add pseudocount to avoid zeros
+        clr((df + 1).T.values).T,  # Add pseudocount to avoid zeros
         index=df.index,
         columns=df.columns
     )
     return df_clr
 
-def normalize_css(df):
+def load_cohort_sparse(input_files, chunksize=100000):
+    """
+    Load per-sample tables into a sparse features x samples CSR matrix.
+
+    Files are read in chunks of ``chunksize`` rows and only non-zero entries
+    are kept, so memory scales with the number of non-zeros. Feature order is
+    the same as load_cohort (order of first appearance).
+    """
+    ids, entries, columns, widths = [], [], [], []
+    index_name = None
+    for f in input_files:
+        first = True
+        for chunk in pd.read_csv(f, sep='\t', index_col=0, chunksize=chunksize):
+            if first:
+                columns.extend(chunk.columns)
+                widths.append(chunk.shape[1])
+                index_name = index_name or chunk.index.name
+                first = False
+            values = chunk.to_numpy(dtype=float)
+            rows, cols = np.nonzero(values)
+            entries.append((rows, cols + len(columns) - chunk.shape[1], values[rows, cols]))
+            ids.append(chunk.index.to_numpy())
+
+    index = pd.Index(np.concatenate(ids), name=index_name).unique()
+    row_parts, col_parts, val_parts = [], [], []
+    for part_ids, (rows, cols, vals) in zip(ids, entries):
+        row_parts.append(index.get_indexer(part_ids)[rows])
+        col_parts.append(cols)
+        val_parts.append(vals)
+    X = sparse.csr_matrix(
+        (np.concatenate(val_parts), (np.concatenate(row_parts), np.concatenate(col_parts))),
+        shape=(len(index), len(columns)))
+    return X, index, columns, widths
+
+def clr_log_means(X, block_rows=10000):
+    """Per-sample mean of log(x + 1), accumulated over row blocks of a sparse or dense matrix."""
+    total = np.zeros(X.shape[1])
+    for start in range(0, X.shape[0], block_rows):
+        block = X[start:start + block_rows]
+        total += np.asarray(block.log1p().sum(axis=0)).ravel() if sparse.issparse(block) else np.log1p(block).sum(axis=0)
+    return total / X.shape[0]
+
+def write_clr_per_sample(X, index, columns, widths, output_files, block_rows=10000, max_open=128):
+    """
+    CLR (pseudocount 1) of a sparse cohort matrix, written per sample in row blocks.
+
+    Equivalent to normalize_clr on the dense matrix, but only ``block_rows``
+    rows are ever densified at once. Outputs are written in groups of at most
+    ``max_open`` files, each group in one pass over its own columns, so wide
+    cohorts stay under the open-file limit.
+    """
+    log_means = clr_log_means(X, block_rows)
+    bounds = np.cumsum([0] + list(widths))
+    for first in range(0, len(output_files), max_open):
+        group = output_files[first:first + max_open]
+        c0, c1 = bounds[first], bounds[first + len(group)]
+        X_group = X[:, c0:c1]
+        handles = []
+        try:
+            for f in group:
+                handles.append(open(f, 'w'))
+            for start in range(0, X.shape[0], block_rows):
+                block = X_group[start:start + block_rows]
+                block = block.toarray() if sparse.issparse(block) else np.asarray(block)
+                clr_block = pd.DataFrame(np.log1p(block) - log_means[c0:c1],
+                                         index=index[start:start + block_rows], columns=columns[c0:c1])
+                for k, fh in enumerate(handles):
+                    lo, hi = bounds[first + k] - c0, bounds[first + k + 1] - c0
+                    clr_block.iloc[:, lo:hi].to_csv(fh, sep='\t', header=(start == 0))
+        finally:
+            for fh in handles:
+                fh.close()
+
+def css_quantile(mat, rel=0.1):
+    """Data-driven CSS quantile, as metagenomeSeq::cumNormStatFast."""
+    cols = [np.sort(mat[mat[:, i] > 0, i]) for i in range(mat.shape[1])]
+    if any(len(c) <= 1 for c in cols):
+        raise ValueError("Warning sample with one or zero features")
+    leng = max(len(c) for c in cols)
+
+    # Sorted non-zero counts, bottom-aligned, and their quantiles on a common grid
+    smat = np.zeros((leng, len(cols)))
+    rmat = np.empty((leng, len(cols)))
+    probs = np.linspace(0, 1, leng)
+    for i, c in enumerate(cols):
+        smat[leng - len(c):, i] = c
+        rmat[:, i] = np.quantile(c, probs)
+
+    ref = smat.mean(axis=1)
+    diffr = np.median(np.abs(ref[:, None] - rmat), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hits = np.flatnonzero(np.abs(np.diff(diffr)) / diffr[1:] > rel)
+    x = (hits[0] + 1) / leng if len(hits) else 0.0
+    return max(x, 0.5)
+
+def css_factors(mat, p):
+    """CSS scaling factors, as metagenomeSeq::calcNormFactors."""
+    eps = np.finfo(float).eps
+    factors = np.empty(mat.shape[1])
+    for i in range(mat.shape[1]):
+        col = mat[:, i]
+        q = np.quantile(col[col > 0], p)
+        shifted = col - eps
+        factors[i] = shifted[shifted <= q].sum()
+    return factors
+
+def normalize_css(df, sl=1000):
+    """Cumulative Sum Scaling (CSS) in NumPy, matching metagenomeSeq cumNorm + MRcounts(norm=TRUE)."""
+    mat = df.to_numpy(dtype=float)
+    factors = css_factors(mat, css_quantile(mat))
+    return pd.DataFrame(mat / (factors / sl), index=df.index, columns=df.columns)
+
+def deseq2_size_factors(counts):
+    """Median-of-ratios size factors, as DESeq2::estimateSizeFactorsForMatrix."""
+    with np.errstate(divide="ignore"):
+        log_counts = np.log(counts)
+    log_geo_means = log_counts.mean(axis=1)
+    use = np.isfinite(log_geo_means)
+    if not use.any():
+        raise ValueError("every gene contains at least one zero, cannot compute log geometric means")
+    return np.array([
+        np.exp(np.median(log_counts[use, j] - log_geo_means[use]))
+        for j in range(counts.shape[1])
+    ])
+
+def _log_posterior(log_alpha, y, mu):
+    """DESeq2 log_posterior (C++) for design ~1 without prior: NB log-likelihood plus Cox-Reid term."""
+    alpha = np.exp(log_alpha)[:, None]
+    r = 1 / alpha
+    ll = (gammaln(y + r) - gammaln(r) - y * np.log(mu + r) - r * np.log(1 + mu * alpha)).sum(axis=1)
+    cr = -0.5 * np.log((1 / (1 / mu + alpha)).sum(axis=1))
+    return ll + cr
+
+def _dlog_posterior(log_alpha, y, mu):
+    """DESeq2 dlog_posterior: derivative of _log_posterior with respect to log(alpha)."""
+    alpha = np.exp(log_alpha)
+    a = alpha[:, None]
+    r = 1 / a
+    ll = (digamma(r) + np.log(1 + mu * a) - mu * a / (1 + mu * a) - digamma(y + r) + y / (mu + r)).sum(axis=1) / alpha ** 2
+    w = 1 / (1 / mu + a)
+    cr = -0.5 * (-w ** 2).sum(axis=1) / w.sum(axis=1)
+    return (ll + cr) * alpha
+
+def _dispersion_grid(y, mu, max_disp, n_grid=20):
+    """DESeq2 fitDispGrid: coarse log(alpha) grid, then a fine grid around the best point."""
+    grid = np.linspace(np.log(MIN_DISP), np.log(max_disp), n_grid)
+    lp = np.column_stack([_log_posterior(np.full(len(y), g), y, mu) for g in grid])
+    delta = grid[1] - grid[0]
+    fine = grid[lp.argmax(axis=1)][:, None] + np.linspace(-delta, delta, n_grid)
+    lp = np.column_stack([_log_posterior(fine[:, t], y, mu) for t in range(n_grid)])
+    return np.exp(fine[np.arange(len(y)), lp.argmax(axis=1)])
+
+def deseq2_gene_dispersions(counts, size_factors, kappa_0=1.0, tol=1e-6, maxit=100):
+    """
+    Gene-wise dispersion estimates, as DESeq2::estimateDispersionsGeneEst for design ~1.
+
+    Ports DESeq2's procedure rather than just maximizing the same likelihood:
+    start from min(rough, moments) estimates, run fitDisp's backtracking line
+    search on log(alpha) (vectorized over genes), keep the start value when
+    the log posterior did not increase, and refit non-converged genes on
+    fitDispGrid's grid. Genes stuck on a flat likelihood near MIN_DISP
+    therefore end where DESeq2 leaves them, not at the global maximum.
+    """
+    m = counts.shape[1]
+    max_disp = max(10, m)
+    ncounts = counts / size_factors
+    base_mean = ncounts.mean(axis=1)
+    mu = np.maximum(base_mean[:, None] * size_factors, 0.5)
+
+    # roughDispEstimate and momentsDispEstimate
+    mu_rough = np.maximum(base_mean, 1)[:, None]
+    rough = np.maximum((((ncounts - mu_rough) ** 2 - mu_rough) / mu_rough ** 2).sum(axis=1) / (m - 1), 0)
+    moments = (ncounts.var(axis=1, ddof=1) - np.mean(1 / size_factors) * base_mean) / base_mean ** 2
+    alpha_init = np.clip(np.minimum(rough, moments), MIN_DISP, max_disp)
+
+    # fitDisp line search, genes still iterating are `active`
+    n = len(counts)
+    a = np.log(alpha_init)
+    lp = _log_posterior(a, counts, mu)
+    dlp = _dlog_posterior(a, counts, mu)
+    initial_lp = lp.copy()
+    kappa = np.full(n, kappa_0)
+    iters = np.zeros(n, dtype=int)
+    accepts = np.zeros(n, dtype=int)
+    active = np.ones(n, dtype=bool)
+    min_log_alpha = np.log(MIN_DISP / 10)
+    for _ in range(maxit):
+        idx = np.flatnonzero(active)
+        if not len(idx):
+            break
+        iters[idx] += 1
+        ai, di, ki = a[idx], dlp[idx], kappa[idx]
+        proposal = ai + ki * di
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ki = np.where(proposal < -30.0, (-30.0 - ai) / di, ki)
+            ki = np.where(proposal > 10.0, (10.0 - ai) / di, ki)
+        theta_kappa = -_log_posterior(ai + ki * di, counts[idx], mu[idx])
+        theta_hat_kappa = -lp[idx] - ki * 1e-4 * di ** 2
+        ok = theta_kappa <= theta_hat_kappa
+        kappa[idx] = np.where(ok, ki, ki / 2)
+
+        acc = idx[ok]
+        accepts[acc] += 1
+        a[acc] = ai[ok] + ki[ok] * di[ok]
+        lp_new = _log_posterior(a[acc], counts[acc], mu[acc])
+        done = lp_new - lp[acc] < tol
+        below = ~done & (a[acc] < min_log_alpha)
+        lp[acc[done]] = lp_new[done]
+        active[acc[done | below]] = False
+
+        cont = acc[~done & ~below]
+        lp[cont] = lp_new[~done & ~below]
+        dlp[cont] = _dlog_posterior(a[cont], counts[cont], mu[cont])
+        kappa[cont] = np.minimum(kappa[cont] * 1.1, kappa_0)
+        kappa[cont] = np.where(accepts[cont] % 5 == 0, kappa[cont] / 2, kappa[cont])
+
+    alpha = np.minimum(np.exp(a), max_disp)
+    no_increase = lp < initial_lp + np.abs(initial_lp) / 1e6
+    alpha[no_increase] = alpha_init[no_increase]
+    converged = (iters < maxit) & (iters != 1)
+    refit = ~converged & (alpha > 10 * MIN_DISP)
+    if refit.any():
+        alpha[refit] = _dispersion_grid(counts[refit], mu[refit], max_disp)
+    return np.clip(alpha, MIN_DISP, max_disp)
+
+def _gamma_identity_glm(y, x, coefs, maxit=25, epsilon=1e-8):
+    """IRLS for glm(y ~ x, family=Gamma(link='identity'), start=coefs)."""
+    X = np.column_stack([np.ones_like(x), x])
+    mu = X @ coefs
+    deviance = -2 * np.sum(np.log(y / mu) - (y - mu) / mu)
+    for _ in range(maxit):
+        mu = X @ coefs
+        w = 1 / mu ** 2
+        coefs = np.linalg.solve(X.T @ (X * w[:, None]), X.T @ (w * y))
+        mu = X @ coefs
+        new_deviance = -2 * np.sum(np.log(y / mu) - (y - mu) / mu)
+        if abs(new_deviance - deviance) / (abs(new_deviance) + 0.1) < epsilon:
+            return coefs, True
+        deviance = new_deviance
+    return coefs, False
+
+def deseq2_parametric_fit(means, disps):
+    """asymptDisp + extraPois / mean trend, as DESeq2 parametricDispersionFit."""
+    coefs = np.array([0.1, 1.0])
+    for _ in range(11):
+        residuals = disps / (coefs[0] + coefs[1] / means)
+        good = (residuals > 1e-4) & (residuals < 15)
+        old = coefs
+        coefs, converged = _gamma_identity_glm(disps[good], 1 / means[good], coefs)
+        if not np.all(coefs > 0):
+            raise ValueError("parametric dispersion fit failed")
+        if np.sum(np.log(coefs / old) ** 2) < 1e-6 and converged:
+            return coefs
+    raise ValueError("dispersion fit did not converge")
+
+def deseq2_local_fit(means, disps, span=0.7):
+    """
+    Local dispersion trend, as DESeq2 localDispersionFit (fitType="local").
+
+    Local quadratic regression of log dispersion on log mean with a tricube
+    kernel over the nearest span fraction of genes, weighted by the means.
+    DESeq2 calls locfit, which fits at the vertices of an adaptive tree and
+    interpolates between them; here every query point is fitted directly and
+    log means outside the data range are clamped to it, so the trend is close
+    to locfit's but not identical.
+    """
+    keep = disps >= 10 * MIN_DISP
+    if not keep.any():
+        return lambda q: np.full(len(q), MIN_DISP)
+    x, y, w = np.log(means[keep]), np.log(disps[keep]), means[keep]
+    k = min(len(x), max(3, int(np.ceil(span * len(x)))))
+
+    def disp_function(q):
+        fitted = np.empty(len(q))
+        for i, x0 in enumerate(np.clip(np.log(q), x.min(), x.max())):
+            dist = np.abs(x - x0)
+            h = max(np.partition(dist, k - 1)[k - 1], 1e-12)
+            kw = np.sqrt(w * np.clip(1 - (dist / h) ** 3, 0, None) ** 3)
+            design = np.column_stack([np.ones_like(x), x - x0, (x - x0) ** 2])
+            fitted[i] = np.linalg.lstsq(design * kw[:, None], y * kw, rcond=None)[0][0]
+        return np.exp(fitted)
+    return disp_function
+
+def _fmm_spline(x, y):
+    """Interpolating cubic spline with R splinefun(method="fmm") end conditions.
+
+    fmm matches the third derivative of each end piece to that of the cubic
+    through the four end points; the spline is linear in its end second
+    derivatives, so they are solved for from three natural-type fits.
+    """
+    def third_derivative(xs, ys):
+        dd = list(ys)
+        for order in range(1, 4):
+            dd = [(dd[i + 1] - dd[i]) / (xs[i + order] - xs[i]) for i in range(len(dd) - 1)]
+        return 6 * dd[0]
+    target = np.array([third_derivative(x[:4], y[:4]), third_derivative(x[-4:], y[-4:])])
+    splines = [CubicSpline(x, y, bc_type=((2, a), (2, b))) for a, b in ((0.0, 0.0), (1.0, 0.0), (0.0, 1.0))]
+    ends = np.array([[6 * sp.c[0, 0], 6 * sp.c[0, -1]] for sp in splines])
+    second = np.linalg.solve((ends[1:] - ends[0]).T, target - ends[0])
+    return CubicSpline(x, y, bc_type=((2, second[0]), (2, second[1])))
+
+def deseq2_vst_local(ncounts, size_factors, disp_function):
+    """VST for a non-parametric trend by numerical integration, as DESeq2 getVarianceStabilizedData."""
+    xim = np.mean(1 / size_factors)
+    base_mean = ncounts.mean(axis=1)
+    xg = np.sinh(np.linspace(0, np.arcsinh(ncounts.max()), 1000))[1:]
+    integrand = 1 / np.sqrt(disp_function(xg) * xg ** 2 + xim * xg)
+    splf = _fmm_spline(np.arcsinh((xg[1:] + xg[:-1]) / 2),
+                       np.cumsum(np.diff(xg) * (integrand[1:] + integrand[:-1]) / 2))
+    h1, h2 = np.quantile(base_mean, [0.95, 0.999])
+    eta = (np.log2(h2) - np.log2(h1)) / (splf(np.arcsinh(h2)) - splf(np.arcsinh(h1)))
+    xi = np.log2(h1) - eta * splf(np.arcsinh(h1))
+    return eta * splf(np.arcsinh(ncounts)) + xi
+
+def normalize_deseq2(df):
+    """
+    DESeq2 Variance-Stabilizing Transformation (VST) in NumPy.
+
+    Mirrors varianceStabilizingTransformation(blind=TRUE, fitType="parametric")
+    on a ~1 design. When the parametric trend cannot be fitted, DESeq2
+    substitutes fitType="local"; so does this, with the approximation
+    described in deseq2_local_fit.
+    """
+    counts = np.round(df.to_numpy(dtype=float))
+    size_factors = deseq2_size_factors(counts)
+    ncounts = counts / size_factors
+
+    nonzero = counts.sum(axis=1) > 0
+    disps = deseq2_gene_dispersions(counts[nonzero], size_factors)
+    means = ncounts[nonzero].mean(axis=1)
+
+    use = disps > 100 * MIN_DISP
+    if not use.any():
+        raise ValueError("all gene-wise dispersion estimates are within 2 orders of magnitude "
+                         "from the minimum value; the dispersion trend cannot be fitted")
+    try:
+        asympt_disp, extra_pois = deseq2_parametric_fit(means[use], disps[use])
+    except ValueError as e:
+        print(f"Parametric dispersion fit failed ({e}); substituting a local regression fit (fitType='local')")
+        vst = deseq2_vst_local(ncounts, size_factors, deseq2_local_fit(means[use], disps[use]))
+    else:
+        vst = np.log((1 + extra_pois + 2 * asympt_disp * ncounts
+                      + 2 * np.sqrt(asympt_disp * ncounts * (1 + extra_pois + asympt_disp * ncounts)))
+                     / (4 * asympt_disp)) / np.log(2)
+    return pd.DataFrame(vst, index=df.index, columns=df.columns)
+
+def normalize_css_r(df):
     """Cumulative Sum Scaling (CSS) via metagenomeSeq (R)."""
-    # Convert to BIOM format (required by metagenomeSeq)
+    import biom
+    from biom.util import biom_open
+    import rpy2.robjects as ro
+
+    # Convert to BIOM format (required by metagenomeSeq) in a per-job temp file
     biom_table = biom.Table(df.values, observation_ids=df.index, sample_ids=df.columns)
-    with biom_open("temp.biom", 'w') as f:
-        biom_table.to_hdf5(f, "temp.biom")
-    
-    # Run CSS in R
-    r = ro.r
-    r('library(metagenomeSeq)')
-    r('library(biomformat)')
-    r(f'biom_data <- read_biom("temp.biom")')
-    r('css_data <- metagenomeSeq::newMRexperiment(biom_data@otu_table@.Data)')
-    r('css_norm <- metagenomeSeq::cumNorm(css_data)')
-    r('css_mat <- metagenomeSeq::MRcounts(css_norm, norm=TRUE)')
-    css_df = r('css_mat')
+    fd, biom_path = tempfile.mkstemp(suffix=".biom")
+    os.close(fd)
+    try:
+        with biom_open(biom_path, 'w') as f:
+            biom_table.to_hdf5(f, "normalization.py")
+
+        # Run CSS in R
+        r = ro.r
+        r('library(metagenomeSeq)')
+        r('library(biomformat)')
+        r(f'biom_data <- read_biom("{biom_path}")')
+        r('css_data <- metagenomeSeq::newMRexperiment(as.matrix(biom_data(biom_data)))')
+        r('css_norm <- metagenomeSeq::cumNorm(css_data)')
+        r('css_mat <- metagenomeSeq::MRcounts(css_norm, norm=TRUE)')
+        css_df = np.asarray(r('css_mat'))
+    finally:
+        os.remove(biom_path)
     return pd.DataFrame(css_df, index=df.index, columns=df.columns)
 
-def normalize_deseq2(df):
-    """DESeq2 Variance-Stabilizing Transformation (VST)."""
+def normalize_deseq2_r(df):
+    """DESeq2 Variance-Stabilizing Transformation (VST) via R."""
+    import rpy2.robjects as ro
+    from rpy2.robjects import numpy2ri
+
     r = ro.r
     r('library(DESeq2)')
-    r('library(phyloseq)')
     # Convert to DESeq2 object
-    pandas2ri.activate()
-    r_df = pandas2ri.py2rpy(df)
-    r('dds <- DESeqDataSetFromMatrix(countData = r_df, colData = data.frame(sample=colnames(r_df)), design = ~ 1)')
+    with (ro.default_converter + numpy2ri.converter).context():
+        ro.globalenv['r_counts'] = np.round(df.to_numpy(dtype=float))
+    r('mode(r_counts) <- "integer"')
+    r('dds <- DESeqDataSetFromMatrix(countData = r_counts, colData = data.frame(sample=seq_len(ncol(r_counts))), design = ~ 1)')
     r('dds <- estimateSizeFactors(dds)')
     r('vst_data <- varianceStabilizingTransformation(dds)')
-    vst_df = r('assay(vst_data)')
+    vst_df = np.asarray(r('assay(vst_data)'))
     return pd.DataFrame(vst_df, index=df.index, columns=df.columns)
 
+# css/deseq2 run metagenomeSeq/DESeq2 through R. The NumPy ports are opt-in
+# until tests/test_normalization.py has R reference outputs to match
+# (tests/data/normalization/export_reference.R)
+METHODS = {
+    "clr": normalize_clr,
+    "css": normalize_css_r,
+    "deseq2": normalize_deseq2_r,
+    "css_numpy": normalize_css,
+    "deseq2_numpy": normalize_deseq2,
+}
+
 def main():
     parser = argparse.ArgumentParser(description="Normalize metagenomic count data.")
-    parser.add_argument("--input", required=True, help="Input TSV file (e.g., HUMAnN/Kraken output)")
-    parser.add_argument("--output", required=True, help="Output normalized TSV file")
-    parser.add_argument("--method", choices=["clr", "css", "deseq2"], default="clr", help="Normalization method")
+    parser.add_argument("--input", nargs="+", required=True,
+                        help="Input TSV file(s) (e.g., HUMAnN/Kraken output); several inputs are normalized as one cohort")
+    parser.add_argument("--output", nargs="+", required=True, help="Output normalized TSV file(s), one per input")
+    parser.add_argument("--method", choices=list(METHODS), default="clr", help="Normalization method")
+    parser.add_argument("--block-rows", type=int, default=10000,
+                        help="Rows read/written per block by the sparse CLR path")
     args = parser.parse_args()
 
-    df = load_data(args.input)
-    
+    if len(args.input) != len(args.output):
+        parser.error("--input and --output need the same number of files")
+
     if args.method == "clr":
-        norm_df = normalize_clr(df)
-    elif args.method == "css":
-        norm_df = normalize_css(df)
-    elif args.method == "deseq2":
-        norm_df = normalize_deseq2(df)
-    
-    norm_df.to_csv(args.output, sep='\t')
+        # Sparse, block-wise path: bounded memory on wide gene-family tables
+        X, index, columns, widths = load_cohort_sparse(args.input, chunksize=args.block_rows)
+        write_clr_per_sample(X, index, columns, widths, args.output, block_rows=args.block_rows)
+        return
+
+    # Load every table once and run the method a single time on the combined matrix
+    df, widths = load_cohort(args.input)
+    norm_df = METHODS[args.method](df)
+    write_per_sample(norm_df, widths, args.output)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import numpy as np
+from scipy import sparse
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.preprocessing import StandardScaler
+
+# PCA backends sharing one return format, (coords, explained_variance_ratio),
+# so callers' plotting code does not change:
+#   full         exact LAPACK SVD of the dense matrix (svd_solver="full")
+#   randomized   randomized SVD, fast when only a few components are needed
+#   incremental  IncrementalPCA over row blocks; X may be a memory-mapped
+#                .npy (or its path) so the matrix is never fully in RAM
+BACKENDS = ["full", "randomized", "incremental"]
+
+def _row_blocks(n_rows, batch_size, min_rows):
+    """Row slices of about batch_size rows; the last one has at least min_rows rows"""
+    bounds = list(range(0, n_rows, batch_size)) + [n_rows]
+    if len(bounds) > 2 and bounds[-1] - bounds[-2] < min_rows:
+        del bounds[-2]
+    return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+def _dense(block):
+    return block.toarray() if sparse.issparse(block) else np.asarray(block, dtype=np.float64)
+
+def fit_pca(X, n_components=2, backend="full", batch_size=None, standardize=False, random_state=None):
+    """
+    Fit PCA with the chosen backend and return (coords, explained_variance_ratio).
+
+    X is a samples x features array, DataFrame, scipy sparse matrix, memmap or
+    path to a .npy file. standardize applies StandardScaler first (streamed
+    over the same row blocks for the incremental backend).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PCA backend {backend!r}; choose from {BACKENDS}")
+    if isinstance(X, str):
+        X = np.load(X, mmap_mode="r")
+    elif hasattr(X, "values") and not sparse.issparse(X):
+        X = X.values
+
+    if backend != "incremental":
+        X = _dense(X)
+        if standardize:
+            X = StandardScaler().fit_transform(X)
+        solver = {"full": "full", "randomized": "randomized"}[backend]
+        pca = PCA(n_components=n_components, svd_solver=solver, random_state=random_state)
+        return pca.fit_transform(X), pca.explained_variance_ratio_
+
+    batch_size = max(batch_size or 1000, n_components)
+    blocks = _row_blocks(X.shape[0], batch_size, n_components)
+
+    scaler = None
+    if standardize:
+        scaler = StandardScaler()
+        for rows in blocks:
+            scaler.partial_fit(_dense(X[rows]))
+    prep = (lambda b: scaler.transform(b)) if scaler is not None else (lambda b: b)
+
+    pca = IncrementalPCA(n_components=n_components)
+    for rows in blocks:
+        pca.partial_fit(prep(_dense(X[rows])))
+    coords = np.vstack([pca.transform(prep(_dense(X[rows]))) for rows in blocks])
+    return coords, pca.explained_variance_ratio_
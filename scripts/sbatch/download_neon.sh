@@ -10,4 +10,6 @@ module load python/3.10
 # Activate your virtual env if needed
 # source ~/ENV/bin/activate
 
-python download_to_dir.py
+# Parallel transfers (4 per CPU, the script's default); interrupted files resume
+# from their .part on rerun. A non-zero exit means some downloads failed.
+python download_to_dir.py --workers $(( ${SLURM_CPUS_PER_TASK:-1} * 4 ))
@@ -5,7 +5,7 @@
 #SBATCH --time=24:00:00
 #SBATCH --output=kraken_%A_%a.out
 #SBATCH --error=kraken_%A_%a.err
-#SBATCH --array=1-2   # <-- set number of samples or auto-detect later
+#SBATCH --array=1   # <-- ceil(number of samples / BATCH_SIZE)
 
 # =========================================================
 #   Kraken2 + Bracken multi-sample pipeline (SLURM)
@@ -35,94 +35,93 @@ mkdir -p "$OUT_DIR"
 # ----------------------------
 # 3. Define samples
 # ----------------------------
-# List of sample base names (without _R1/_R2)
+# List of sample base names (without _R1/_R2); each array task runs a batch
+# of BATCH_SIZE samples so the memory-mapped DB is loaded once per batch
 SAMPLES=("SCBI_012" "WOOD_002")
-SAMPLE=${SAMPLES[$((SLURM_ARRAY_TASK_ID-1))]}
+BATCH_SIZE=${BATCH_SIZE:-8}
+SCRIPT_DIR=${SCRIPT_DIR:-$(pwd)/scripts}
+# Optional node-local copy of the DB index, e.g.
+#   STAGE_DB=/dev/shm/kraken2_db_${USER} sbatch scripts/sbatch/kraken_bracken2.sh
+# Off by default: files in /dev/shm count against the job's --mem and keep
+# node RAM until they are deleted
+STAGE_DB=${STAGE_DB:-}
+
+# =========================================================
+# Combine mode: run as a separate job once every array task has finished
+#   jid=$(sbatch --parsable scripts/sbatch/kraken_bracken2.sh)
+#   sbatch --dependency=afterok:${jid} scripts/sbatch/kraken_bracken2.sh combine
+# With STAGE_DB set for both jobs, combine also deletes the staged copy
+# (the Snakemake rules in rules/kraken_bracken.smk do the same with
+#  rule bracken_combine)
+# =========================================================
+if [[ "$1" == "combine" ]]; then
+  echo "[$(date)] Combining Bracken reports into abundance matrix..."
+  REPORTS=()
+  for SAMPLE in "${SAMPLES[@]}"; do
+    REPORTS+=("${OUT_DIR}/${SAMPLE}.bracken_report")
+  done
+  python "${SCRIPT_DIR}/kraken_batch.py" combine \
+    --reports "${REPORTS[@]}" \
+    --samples "${SAMPLES[@]}" \
+    --output "${OUT_DIR}/bracken_abundance_matrix.tsv" || exit 1
+  echo "[$(date)] Combined abundance matrix created:"
+  echo "  ${OUT_DIR}/bracken_abundance_matrix.tsv"
+  if [[ -n "$STAGE_DB" ]]; then
+    rm -rf "$STAGE_DB"
+    echo "[$(date)] Removed staged database $STAGE_DB"
+  fi
+  exit 0
+fi
+
+START=$(( (SLURM_ARRAY_TASK_ID - 1) * BATCH_SIZE ))
+BATCH=("${SAMPLES[@]:$START:$BATCH_SIZE}")
+if [[ ${#BATCH[@]} -eq 0 ]]; then
+  echo "[$(date)] No samples for array task ${SLURM_ARRAY_TASK_ID}"
+  exit 0
+fi
 
 # Input FASTQ files
-R1=${DATA_DIR}/${SAMPLE}_R1.fastq
-R2=${DATA_DIR}/${SAMPLE}_R2.fastq
+R1=()
+R2=()
+for SAMPLE in "${BATCH[@]}"; do
+  R1+=("${DATA_DIR}/${SAMPLE}_R1.fastq")
+  R2+=("${DATA_DIR}/${SAMPLE}_R2.fastq")
+done
 
 echo "========================================================="
-echo "[$(date)] Starting Kraken2 + Bracken for sample: ${SAMPLE}"
-echo "Input files:"
-echo "  R1: $R1"
-echo "  R2: $R2"
+echo "[$(date)] Starting Kraken2 + Bracken for samples: ${BATCH[*]}"
 echo "Database: $KRAKEN_DB"
 echo "Output directory: $OUT_DIR"
 echo "========================================================="
 
 # =========================================================
-# 4. Run Kraken2
+# 4. Run Kraken2 (--memory-mapping) + Bracken for the batch
 # =========================================================
-echo "[$(date)] Running Kraken2..."
-kraken2 \
+# With STAGE_DB set, the DB index is staged there once per node and every
+# sample in the batch (and other tasks on the node) maps the same copy.
+# Sibling tasks may still be using it, so it stays until the combine job
+# (on a multi-node array, copies on other nodes are left to the
+# scheduler's /dev/shm cleanup).
+STAGE_ARGS=()
+if [[ -n "$STAGE_DB" ]]; then
+  STAGE_ARGS=(--stage-db "$STAGE_DB")
+fi
+python "${SCRIPT_DIR}/kraken_batch.py" run \
   --db "$KRAKEN_DB" \
+  "${STAGE_ARGS[@]}" \
+  --samples "${BATCH[@]}" \
+  --r1 "${R1[@]}" \
+  --r2 "${R2[@]}" \
+  --outdir "$OUT_DIR" \
   --threads $SLURM_CPUS_PER_TASK \
-  --use-names \
-  --report "${OUT_DIR}/${SAMPLE}.kraken_report" \
-  --output "${OUT_DIR}/${SAMPLE}.kraken_output" \
-  "$R1" "$R2"
-
-if [[ $? -ne 0 ]]; then
-  echo "[$(date)] ERROR: Kraken2 failed for ${SAMPLE}" >&2
-  exit 1
-fi
-
-echo "[$(date)] Kraken2 completed successfully for ${SAMPLE}"
-echo "---------------------------------------------------------"
-
-# =========================================================
-# 5. Amend Kraken report (tab-delimited format for Bracken)
-# =========================================================
-echo "[$(date)] Reformatting Kraken report..."
-awk '{$1=$1}1' OFS='\t' "${OUT_DIR}/${SAMPLE}.kraken_report" > "${OUT_DIR}/${SAMPLE}_amend.report"
+  --read-len 150 \
+  --level S
 
 if [[ $? -ne 0 ]]; then
-  echo "[$(date)] ERROR: Failed to create amended report" >&2
+  echo "[$(date)] ERROR: Kraken2/Bracken failed for batch ${BATCH[*]}" >&2
   exit 1
 fi
 
-echo "[$(date)] Amended report created: ${OUT_DIR}/${SAMPLE}_amend.report"
-echo "---------------------------------------------------------"
-
-# =========================================================
-# 6. Run Bracken
-# =========================================================
-echo "[$(date)] Running Bracken..."
-bracken \
-  -d "$KRAKEN_DB" \
-  -i "${OUT_DIR}/${SAMPLE}_amend.report" \
-  -o "${OUT_DIR}/${SAMPLE}.bracken_report" \
-  -r 150 -l S -t $SLURM_CPUS_PER_TASK
-
-if [[ $? -ne 0 ]]; then
-  echo "[$(date)] ERROR: Bracken failed for ${SAMPLE}" >&2
-  exit 1
-fi
-
-echo "[$(date)] Bracken completed successfully for ${SAMPLE}"
-echo "Output file: ${OUT_DIR}/${SAMPLE}.bracken_report"
-echo "---------------------------------------------------------"
-
-# =========================================================
-# 7. Combine results (only once after last job)
-# =========================================================
-if [[ $SLURM_ARRAY_TASK_ID -eq ${#SAMPLES[@]} ]]; then
-  echo "[$(date)] Combining Bracken reports into abundance matrix..."
-  cd "$OUT_DIR"
-
-  rm -f bracken_abundance_matrix.tsv
-  bracken_combine_outputs.py --files *.bracken_report -o bracken_abundance_matrix.tsv
-
-  if [[ $? -eq 0 ]]; then
-    echo "[$(date)] Combined abundance matrix created:"
-    echo "  ${OUT_DIR}/bracken_abundance_matrix.tsv"
-  else
-    echo "[$(date)] WARNING: Failed to combine Bracken outputs." >&2
-  fi
-fi
-
-echo "[$(date)] Finished processing sample: ${SAMPLE}"
+echo "[$(date)] Finished processing samples: ${BATCH[*]}"
 echo "========================================================="
-# End of scripts/sbatch/kraken_bracken2.sh
\ No newline at end of file
+# End of scripts/sbatch/kraken_bracken2.sh
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import pickle
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
+
+# SHAP matrices (samples x features) for fitted models, cached on disk.
+#
+# Tree ensembles (XGBoost, RandomForest) use shap's exact TreeExplainer and
+# linear models (ElasticNet, optionally behind a StandardScaler pipeline)
+# use LinearExplainer; both take a background sample of at most
+# `background` training rows. Rows to explain are split into chunks over a
+# process pool. Results are stored as <key>.npy where the key hashes the
+# pickled model, the explained rows, the background rows and the
+# explainer, so a rebuilt report with an unchanged model skips the step.
+DEFAULT_CACHE_DIR = os.environ.get("SOIL_PIPELINE_SHAP_CACHE", "results/cache/shap")
+
+def explainer_kind(model):
+    estimator = model[-1] if hasattr(model, "steps") else model
+    if hasattr(estimator, "coef_"):
+        return "linear"
+    if hasattr(estimator, "feature_importances_"):
+        return "tree"
+    raise ValueError(f"No fast SHAP explainer for {type(estimator).__name__}")
+
+def background_sample(X_background, size, random_state=0):
+    """At most size rows of the background data, drawn without replacement"""
+    X_background = np.asarray(X_background, dtype=np.float64)
+    if size is None or len(X_background) <= size:
+        return X_background
+    rows = np.random.default_rng(random_state).choice(len(X_background), size, replace=False)
+    return X_background[np.sort(rows)]
+
+def model_hash(model, X, background, kind):
+    h = hashlib.sha1(kind.encode())
+    h.update(pickle.dumps(model))
+    for arr in (X, background):
+        h.update(str(arr.shape).encode())
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+def _make_explainer(model, background, kind):
+    import shap
+    if kind == "tree":
+        return shap.TreeExplainer(model, data=background, feature_perturbation="interventional")
+    if hasattr(model, "steps"):
+        background = model[:-1].transform(background)
+        model = model[-1]
+    return shap.LinearExplainer(model, background)
+
+def _init_worker():
+    # Chunks already use every worker; keep model predictions single-threaded
+    threadpool_limits(limits=1)
+
+def _explain_chunk(model, background, kind, X):
+    explainer = _make_explainer(model, background, kind)
+    if kind == "linear" and hasattr(model, "steps"):
+        X = model[:-1].transform(X)
+    values = explainer.shap_values(X)
+    # Multi-output models: older shap returns one matrix per target
+    if isinstance(values, list):
+        values = np.stack(values, axis=-1)
+    return np.asarray(values, dtype=np.float64)
+
+def explain(model, X, X_background, background=100, workers=1, cache_dir=DEFAULT_CACHE_DIR,
+            random_state=0):
+    """
+    SHAP values of model on the rows of X (array or DataFrame), one row per
+    sample; multi-output models give samples x features x targets.
+
+    X_background is usually the training matrix; at most `background` rows
+    of it are used. Returns the cached matrix when the same model has
+    already been explained on the same rows.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    kind = explainer_kind(model)
+    bg = background_sample(X_background, background, random_state)
+    key = model_hash(model, X, bg, kind)
+    path = os.path.join(cache_dir, key + ".npy")
+    if os.path.exists(path):
+        return np.load(path)
+
+    chunks = np.array_split(np.arange(len(X)), max(1, min(workers, len(X))))
+    if len(chunks) == 1:
+        values = _explain_chunk(model, bg, kind, X)
+    else:
+        with ProcessPoolExecutor(max_workers=len(chunks), initializer=_init_worker) as pool:
+            parts = pool.map(_explain_chunk, [model] * len(chunks), [bg] * len(chunks),
+                             [kind] * len(chunks), [X[rows] for rows in chunks])
+            values = np.vstack(list(parts))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(path + ".tmp.npy", values)
+    os.replace(path + ".tmp.npy", path)
+    return values
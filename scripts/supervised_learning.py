@@ -2,112 +2,309 @@
 import pandas as pd
 import numpy as np
 import json
+import time
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
-from sklearn.model_selection import cross_val_score, train_test_split
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from sklearn.model_selection import RepeatedKFold, train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.linear_model import ElasticNet
 from xgboost import XGBRegressor
 from sklearn.metrics import r2_score, mean_squared_error
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import make_pipeline
+from threadpoolctl import threadpool_limits
 import shap
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from feature_matrix import is_feature_matrix, open_feature_matrix
+from shap_cache import DEFAULT_CACHE_DIR as SHAP_CACHE_DIR, explain
+
+# All three models fit several targets natively (one model per target group)
+MODEL_NAMES = ["XGBoost", "RandomForest", "ElasticNet"]
+
+def make_model(name, random_state, n_jobs=1):
+    """Fresh estimator; n_jobs is the model's own thread count"""
+    if name == "XGBoost":
+        return XGBRegressor(random_state=random_state, n_jobs=n_jobs)
+    if name == "RandomForest":
+        return RandomForestRegressor(random_state=random_state, n_jobs=n_jobs)
+    if name == "ElasticNet":
+        return make_pipeline(StandardScaler(), ElasticNet(random_state=random_state))
+    raise ValueError(f"Unknown model {name!r}")
+
+def _fit_y(Y):
+    """Single-target models expect a 1-D y"""
+    return Y[:, 0] if Y.shape[1] == 1 else Y
+
+def _as_2d(pred):
+    return pred.reshape(len(pred), -1)
+
+def target_groups(Y):
+    """
+    Targets grouped by the samples that have them measured, as [(samples, targets)].
+
+    Each group is fitted on exactly its own non-missing rows, so a target is
+    never trained on fewer samples because another one is missing; targets
+    measured on the same samples still share one multi-output fit.
+    """
+    groups = {}
+    for target in Y.columns:
+        rows = Y.index[Y[target].notna()]
+        groups.setdefault(tuple(rows), (rows, []))[1].append(target)
+    return list(groups.values())
+
+# ------------------------------
+# Cross-validation task pool
+# ------------------------------
+# Every (model, repeat, fold) fit is one task on a flat process pool of
+# `threads` workers. Each task runs single-threaded (n_jobs=1 and BLAS/OpenMP
+# pools limited to one thread), so the pool never oversubscribes the rule's
+# cores. The training matrix is sent once per worker, not once per task.
+_X = None
+_y = None
+
+def _init_worker(X, y):
+    global _X, _y
+    _X, _y = X, y
+    threadpool_limits(limits=1)
+
+def _run_fold(name, repeat, fold, train_idx, test_idx, random_state):
+    """One CV fit on all targets; returns per-target (r2, rmse) and the fit seconds"""
+    start = time.perf_counter()
+    model = make_model(name, random_state, n_jobs=1)
+    model.fit(_X[train_idx], _fit_y(_y[train_idx]))
+    pred = _as_2d(model.predict(_X[test_idx]))
+    truth = _y[test_idx]
+    scores = [(r2_score(truth[:, k], pred[:, k]),
+               float(np.sqrt(mean_squared_error(truth[:, k], pred[:, k]))))
+              for k in range(truth.shape[1])]
+    return name, repeat, fold, scores, time.perf_counter() - start
+
+def pool_size(threads, mem_gb, X, copies=4):
+    """Workers that fit in threads and mem_gb, assuming ~copies x X per running fit"""
+    per_task = copies * X.nbytes + 256 * 1024 ** 2
+    return max(1, min(threads, int(mem_gb * 1024 ** 3 // per_task)))
+
+def _converged(means, tol, patience):
+    """True once the running mean R2 moved less than tol for patience repeats"""
+    if len(means) <= patience:
+        return False
+    return all(abs(means[-i] - means[-i - 1]) < tol for i in range(1, patience + 1))
+
+def evaluate_models(X, Y, targets, model_names, n_iterations, threads=1, mem_gb=8, n_splits=5,
+                    tol=0.005, patience=2, random_state=42):
+    """
+    Repeated k-fold CV of every model on one flat task pool.
+
+    Y is samples x targets; every fold fits each model on all targets at
+    once, so all targets share the same splits.
+
+    n_iterations is the per-model budget of fold fits, i.e.
+    ceil(n_iterations / n_splits) repeats of n_splits-fold CV. A model stops
+    early once its running mean R2 (averaged over targets) over completed
+    repeats changes by less than tol for patience consecutive repeats; its
+    queued folds are dropped. Returns ({model: {target: summary}}, per-task
+    DataFrame with one row per target).
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    Y = np.asarray(Y, dtype=np.float64).reshape(len(X), -1)
+    n_repeats = max(1, -(-n_iterations // n_splits))
+    splits = list(RepeatedKFold(n_splits=n_splits, n_repeats=n_repeats,
+                                random_state=random_state).split(X))
+
+    # Interleave models repeat by repeat so early repeats of all models finish first
+    queue = [(name, r, f) for r in range(n_repeats) for name in model_names for f in range(n_splits)]
+    scores = {name: {} for name in model_names}
+    means = {name: [] for name in model_names}
+    stopped = set()
+    tasks = []
+
+    workers = pool_size(threads, mem_gb, X)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X, Y)) as pool:
+        pending = {}
+        while queue or pending:
+            while queue and len(pending) < 2 * workers:
+                name, r, f = queue.pop(0)
+                if name in stopped:
+                    continue
+                train_idx, test_idx = splits[r * n_splits + f]
+                future = pool.submit(_run_fold, name, r, f, train_idx, test_idx, random_state)
+                pending[future] = name
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                if future.cancelled() or name in stopped:
+                    continue
+                name, r, f, fold_scores, seconds = future.result()
+                tasks.extend({"model": name, "repeat": r, "fold": f, "target": target,
+                              "r2": r2, "rmse": rmse, "seconds": seconds}
+                             for target, (r2, rmse) in zip(targets, fold_scores))
+                scores[name].setdefault(r, []).append(np.mean([r2 for r2, _ in fold_scores]))
+                # Check convergence on each newly completed leading repeat
+                while len(scores[name].get(len(means[name]), [])) == n_splits:
+                    done_r2 = [s for rep in range(len(means[name]) + 1) for s in scores[name][rep]]
+                    means[name].append(float(np.mean(done_r2)))
+                    if _converged(means[name], tol, patience):
+                        stopped.add(name)
+                        for other, other_name in pending.items():
+                            if other_name == name:
+                                other.cancel()
+                        break
+
+    tasks = pd.DataFrame(tasks, columns=["model", "repeat", "fold", "target", "r2", "rmse", "seconds"])
+    summary = {}
+    for name in model_names:
+        model_tasks = tasks[tasks["model"] == name]
+        fit_seconds = float(model_tasks.loc[model_tasks["target"] == targets[0], "seconds"].sum())
+        summary[name] = {}
+        for target in targets:
+            # Only complete repeats count, so every model reports whole CV rounds
+            used = model_tasks[(model_tasks["target"] == target) & (model_tasks["repeat"] < len(means[name]))]
+            summary[name][target] = {
+                "cv_mean_r2": float(used["r2"].mean()),
+                "cv_std_r2": float(used["r2"].std(ddof=0)),
+                "cv_repeats": len(means[name]),
+                "cv_early_stopped": name in stopped,
+                "cv_fit_seconds": fit_seconds,
+            }
+    return summary, tasks.sort_values(["model", "target", "repeat", "fold"])
+
+def feature_importances(model, columns, n_targets):
+    """Per-target importance vectors; tree ensembles share one across targets"""
+    estimator = model[-1] if hasattr(model, "steps") else model
+    if hasattr(estimator, "feature_importances_"):
+        return [dict(zip(columns, map(float, estimator.feature_importances_)))] * n_targets
+    if hasattr(estimator, "coef_"):
+        coef = np.asarray(estimator.coef_).reshape(n_targets, -1)
+        return [dict(zip(columns, map(float, row))) for row in coef]
+    return [None] * n_targets
+
+def plot_importances(importance, title):
+    imp_df = pd.DataFrame.from_dict(importance, orient='index', columns=['importance'])
+    imp_df.sort_values('importance', ascending=False).head(20).plot.bar(figsize=(10, 6))
+    plt.title(title)
+    plt.tight_layout()
 
 def main():
     # Load input data
-    features = pd.read_csv(snakemake.input.features, sep='\t', index_col=0)
-    labels = pd.read_csv(snakemake.input.labels, sep='\c', index_col=0)
+    labels = pd.read_csv(snakemake.input.labels, index_col=0)
+    targets = list(snakemake.params.targets)
     
-    # Ensure samples align
-    common_samples = features.index.intersection(labels.index)
-    X = features.loc[common_samples]
-    y = labels.loc[common_samples]
+    # Ensure samples align; only the labelled rows are read from the memmap
+    if is_feature_matrix(snakemake.input.features):
+        matrix = open_feature_matrix(snakemake.input.features)
+        labels.index = labels.index.astype(str)
+        common_samples = pd.Index(matrix.samples).intersection(labels.index)
+        X = matrix.to_frame(common_samples)
+    else:
+        features = pd.read_csv(snakemake.input.features, sep='\t', index_col=0)
+        common_samples = features.index.intersection(labels.index)
+        X = features.loc[common_samples]
+    missing_targets = [t for t in targets if t not in labels.columns]
+    if missing_targets:
+        raise ValueError(f"Targets not in {snakemake.input.labels}: {missing_targets}")
+    # One pass over all targets; each target keeps its own measured samples
+    Y_all = labels.loc[common_samples, targets]
+    for target in targets:
+        missing = int(Y_all[target].isna().sum())
+        if missing:
+            print(f"{target}: {missing} of {len(Y_all)} samples have no value and are left out of its fits")
+    targets = [t for t in targets if Y_all[t].notna().any()]
     
     # Get parameters
     test_size = float(snakemake.params.test_size)
     random_state = int(snakemake.params.random_state)
     n_iterations = int(snakemake.params.n_iterations)
+    threads = int(snakemake.threads)
+    mem_gb = float(snakemake.resources.get("mem_gb", 8))
+    shap_background = int(snakemake.params.get("shap_background", 100))
+    shap_cache_dir = snakemake.params.get("shap_cache", SHAP_CACHE_DIR)
     
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=test_size, random_state=random_state)
-    
-    # Initialize models
-    models = {
-        "XGBoost": XGBRegressor(random_state=random_state, n_jobs=int(snakemake.threads)),
-        "RandomForest": RandomForestRegressor(random_state=random_state, n_jobs=int(snakemake.threads)),
-        "ElasticNet": make_pipeline(StandardScaler(), ElasticNet(random_state=random_state))
-    }
-    
-    # Results storage
-    metrics = {}
-    importances = {}
-    shap_values = {}
+    # Results storage, keyed by target then model
+    metrics = {target: {} for target in targets}
+    importances = {target: {} for target in targets}
+    cv_tasks = []
     
     # Create PDF report
     with PdfPages(snakemake.output.report) as pdf:
-        # Train and evaluate each model
-        for name, model in models.items():
-            # Cross-validation
-            cv_scores = cross_val_score(model, X_train, y_train.values.ravel(), 
-                                      cv=5, scoring='r2', n_jobs=int(snakemake.threads))
+        for rows, group in target_groups(Y_all[targets]):
+            X_group, Y = X.loc[rows], Y_all.loc[rows, group]
             
-            # Final training
-            model.fit(X_train, y_train.values.ravel())
-            y_pred = model.predict(X_test)
-            
-            # Calculate metrics
-            metrics[name] = {
-                "r2_score": r2_score(y_test, y_pred),
-                "rmse": np.sqrt(mean_squared_error(y_test, y_pred)),
-                "cv_mean_r2": np.mean(cv_scores),
-                "cv_std_r2": np.std(cv_scores)
-            }
+            # Split data (shared by the group's targets)
+            X_train, X_test, Y_train, Y_test = train_test_split(
+                X_group, Y, test_size=test_size, random_state=random_state)
             
-            # Get feature importances
-            if hasattr(model, 'feature_importances_'):
-                importances[name] = dict(zip(X.columns, model.feature_importances_))
-            elif hasattr(model, 'coef_'):
-                importances[name] = dict(zip(X.columns, model[-1].coef_))  # For pipeline
+            # Cross-validate all models on one task pool, within threads / mem_gb
+            cv_summary, group_tasks = evaluate_models(
+                X_train.values, Y_train.values, group, MODEL_NAMES, n_iterations,
+                threads=threads, mem_gb=mem_gb, random_state=random_state)
+            cv_tasks.append(group_tasks)
             
-            # SHAP analysis (for XGBoost only)
-            if name == "XGBoost":
-                explainer = shap.Explainer(model)
-                shap_values[name] = explainer(X_test).values.mean(0)
+            # Final fits run one at a time, so each model gets all the threads;
+            # each model is trained on all of the group's targets at once
+            for name in MODEL_NAMES:
+                model = make_model(name, random_state, n_jobs=threads)
+                model.fit(X_train, _fit_y(Y_train.values))
+                Y_pred = _as_2d(model.predict(X_test))
+                model_importances = feature_importances(model, X.columns, len(group))
                 
-                # SHAP summary plot
-                plt.figure(figsize=(10, 6))
-                shap.summary_plot(shap_values[name], X_test, plot_type="bar", show=False)
-                plt.title(f"{name} Feature Importance (SHAP)")
-                pdf.savefig()
-                plt.close()
-            
-            # Performance plot
+                # SHAP analysis: exact tree / linear explainers, cached by model hash
+                shap_values = explain(model, X_test, X_train, background=shap_background,
+                                      workers=threads, cache_dir=shap_cache_dir,
+                                      random_state=random_state)
+                
+                for k, target in enumerate(group):
+                    y_test, y_pred = Y_test[target], Y_pred[:, k]
+                    
+                    # Calculate metrics
+                    metrics[target][name] = {
+                        "r2_score": r2_score(y_test, y_pred),
+                        "rmse": np.sqrt(mean_squared_error(y_test, y_pred)),
+                        "n_samples": len(rows),
+                        **cv_summary[name][target]
+                    }
+                    if model_importances[k] is not None:
+                        importances[target][name] = model_importances[k]
+                    
+                    # SHAP summary plot (mean |SHAP| per feature over the test samples)
+                    target_shap = shap_values[:, :, k] if shap_values.ndim == 3 else shap_values
+                    plt.figure(figsize=(10, 6))
+                    shap.summary_plot(target_shap, X_test, plot_type="bar", show=False)
+                    plt.title(f"{name} {target} Feature Importance (SHAP)")
+                    pdf.savefig()
+                    plt.close()
+                    
+                    # Performance plot
+                    plt.figure(figsize=(10, 6))
+                    plt.scatter(y_test, y_pred, alpha=0.6)
+                    plt.plot([Y[target].min(), Y[target].max()], [Y[target].min(), Y[target].max()], 'k--')
+                    plt.xlabel(f'Actual {target}')
+                    plt.ylabel(f'Predicted {target}')
+                    plt.title(f'{name} {target} Performance\nR² = {metrics[target][name]["r2_score"]:.2f}')
+                    pdf.savefig()
+                    plt.close()
+                    
+                    # Feature importance plot
+                    if name in importances[target]:
+                        plot_importances(importances[target][name], f'{name} {target} Top 20 Important Features')
+                        pdf.savefig()
+                        plt.close()
+    
+        # Add summary pages, one per target
+        for target in targets:
             plt.figure(figsize=(10, 6))
-            plt.scatter(y_test, y_pred, alpha=0.6)
-            plt.plot([y.min(), y.max()], [y.min(), y.max()], 'k--')
-            plt.xlabel('Actual Values')
-            plt.ylabel('Predicted Values')
-            plt.title(f'{name} Performance\nR² = {metrics[name]["r2_score"]:.2f}')
+            pd.DataFrame(metrics[target]).T[['r2_score', 'rmse', 'cv_mean_r2']].plot.bar(rot=0)
+            plt.title(f'Model Comparison: {target}')
+            plt.ylabel('Score')
             pdf.savefig()
             plt.close()
-            
-            # Feature importance plot
-            if name in importances:
-                imp_df = pd.DataFrame.from_dict(importances[name], orient='index', columns=['importance'])
-                imp_df.sort_values('importance', ascending=False).head(20).plot.bar(figsize=(10, 6))
-                plt.title(f'{name} Top 20 Important Features')
-                plt.tight_layout()
-                pdf.savefig()
-                plt.close()
     
-        # Add summary page
-        plt.figure(figsize=(10, 6))
-        pd.DataFrame(metrics).T[['r2_score', 'rmse', 'cv_mean_r2']].plot.bar(rot=0)
-        plt.title('Model Comparison')
-        plt.ylabel('Score')
-        pdf.savefig()
-        plt.close()
+    pd.concat(cv_tasks).to_csv(snakemake.output.cv_tasks, sep='\t', index=False)
     
     # Save metrics JSON
     with open(snakemake.output.metrics, 'w') as f:
@@ -118,14 +315,12 @@ def main():
         json.dump(importances, f, indent=2)
     
     # Save individual plots
-    for name in models:
-        if name in importances:
-            imp_df = pd.DataFrame.from_dict(importances[name], orient='index', columns=['importance'])
-            imp_df.sort_values('importance', ascending=False).head(20).plot.bar(figsize=(10, 6))
-            plt.title(f'{name} Top 20 Important Features')
-            plt.tight_layout()
-            plt.savefig(f"results/ml/{name.lower()}_feature_importance.png")
-            plt.close()
+    for target in targets:
+        for name in MODEL_NAMES:
+            if name in importances[target]:
+                plot_importances(importances[target][name], f'{name} {target} Top 20 Important Features')
+                plt.savefig(f"results/ml/{name.lower()}_{target}_feature_importance.png")
+                plt.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
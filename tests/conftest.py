@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The pipeline scripts are plain modules, not an installed package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+sys.path.insert(0, os.path.join(ROOT, "scripts", "Gal_code"))
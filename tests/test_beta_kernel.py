@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from scipy.spatial.distance import pdist, squareform
+
+import beta_kernel
+import distance_cache
+
+
+def make_counts(n=37, m=25, seed=0):
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(2.0, size=(n, m)).astype(float)
+    counts[rng.random((n, m)) < 0.5] = 0
+    counts[:, 0] += 1  # no all-zero rows, which Bray-Curtis leaves undefined
+    return counts
+
+
+def reference(counts, metric):
+    if metric == "aitchison":
+        logs = np.log(counts + 1.0)
+        return squareform(pdist(logs - logs.mean(axis=1, keepdims=True), "euclidean"))
+    return squareform(pdist(counts, metric))
+
+
+def kernel_square(X, tmp_path, metric, **kwargs):
+    out = str(tmp_path / "d.npy")
+    beta_kernel.pairwise_condensed(X, out, metric=metric, **kwargs)
+    return distance_cache.to_square(np.load(out), X.shape[0])
+
+
+@pytest.mark.parametrize("metric", beta_kernel.METRICS)
+@pytest.mark.parametrize("layout", ["dense", "float32", "sparse"])
+def test_matches_pdist(metric, layout, tmp_path):
+    counts = make_counts()
+    X = {"dense": counts, "float32": counts.astype(np.float32), "sparse": sparse.csr_matrix(counts)}[layout]
+    square = kernel_square(X, tmp_path, metric, tile=8)
+    np.testing.assert_allclose(square, reference(counts, metric), rtol=1e-6, atol=1e-12)
+
+
+def test_process_pool_matches_serial(tmp_path):
+    counts = make_counts()
+    square = kernel_square(counts, tmp_path, "braycurtis", tile=8, workers=2)
+    np.testing.assert_allclose(square, reference(counts, "braycurtis"), rtol=1e-12)
+
+
+def test_tile_rows_follow_the_memory_budget():
+    assert beta_kernel.tile_rows(100, workers=1) == 1024
+    wide = beta_kernel.tile_rows(1_000_000, workers=4, memory=512 * 1024 ** 2)
+    assert wide == 512 * 1024 ** 2 // (1_000_000 * 8 * 4 * 4)
+    assert beta_kernel.tile_rows(10 ** 9, workers=8) == 1
+
+
+def test_small_budget_still_matches_pdist(tmp_path):
+    counts = make_counts()
+    square = kernel_square(counts, tmp_path, "jaccard", workers=2, memory=counts.shape[1] * 8 * 4 * 2 * 3)
+    np.testing.assert_allclose(square, reference(counts, "jaccard"), rtol=1e-12)
@@ -0,0 +1,63 @@
+import os
+
+import pandas as pd
+import pytest
+
+import clade_store
+import taxonomy_levels
+
+PROFILES = {
+    "SCBI_012.tsv": "k__Bacteria\t100.0\nk__Bacteria|p__Proteobacteria\t60.5\nk__Bacteria|p__Firmicutes\t39.5\n",
+    "WOOD_002.tsv": "k__Bacteria\t90\nk__Bacteria|p__Firmicutes\t90\nUNCLASSIFIED\t10\n",
+    "HARV_001.txt": "k__Archaea\t100.0\nk__Archaea|p__Euryarchaeota/Candidatus x\t1e-05\n",
+}
+
+
+def legacy_export(merged_df, output_dir):
+    """The per-clade TSV loop the store replaced"""
+    os.makedirs(output_dir, exist_ok=True)
+    for _, row in merged_df.iterrows():
+        clade = row["clade_name"]
+        safe_name = clade.replace("|", "_").replace("/", "_").replace(" ", "_")
+        clade_df = pd.DataFrame(row).T
+        clade_df = clade_df.drop(columns=["clade_name"]).T
+        clade_df.columns = ["relative_abundance"]
+        clade_df.index.name = "sample_id"
+        clade_df.to_csv(os.path.join(output_dir, f"{safe_name}.tsv"), sep="\t")
+
+
+@pytest.fixture
+def merged(tmp_path):
+    profiles = tmp_path / "profiles"
+    profiles.mkdir()
+    for name, content in PROFILES.items():
+        (profiles / name).write_text(content)
+    return taxonomy_levels.merge_profiles(str(profiles), sample_pattern=None)
+
+
+def test_export_matches_legacy_files(merged, tmp_path):
+    store = clade_store.CladeStore(clade_store.write_clade_store(merged, str(tmp_path / "store")))
+    assert store.export_tsv(str(tmp_path / "new")) == len(merged)
+    legacy_export(merged, str(tmp_path / "old"))
+
+    names = sorted(os.listdir(tmp_path / "old"))
+    assert sorted(os.listdir(tmp_path / "new")) == names
+    for name in names:
+        assert (tmp_path / "new" / name).read_bytes() == (tmp_path / "old" / name).read_bytes(), name
+
+
+def test_lookup_uses_the_row_index(merged, tmp_path):
+    store = clade_store.CladeStore(clade_store.write_clade_store(merged, str(tmp_path / "store")))
+    expected = merged.set_index("clade_name")
+
+    class NoScan(list):
+        def __iter__(self):
+            raise AssertionError("lookup scanned the clade list")
+        index = __contains__ = __iter__
+    store.clades = NoScan(store.clades)
+
+    for clade in expected.index:
+        assert clade in store
+        assert store.lookup(clade).to_dict() == expected.loc[clade].to_dict()
+    with pytest.raises(KeyError):
+        store.lookup("k__Fungi")
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+import cooccurrence
+
+
+def make_abundance(seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.poisson(5, size=(30, 12)).astype(float),
+                      index=[f"g__Taxon{i}" for i in range(30)])
+    df.iloc[1] = df.iloc[0] * 2 + 1  # perfectly correlated with taxon 0
+    df.iloc[2] = df.iloc[0] + rng.normal(0, 0.5, 12)
+    return df
+
+
+def edge_set(edges):
+    return {frozenset(pair) for pair in zip(edges["source"], edges["target"])}
+
+
+def test_default_matches_pandas_pearson_network():
+    df = make_abundance()
+    corr = df.T.corr().stack().reset_index()
+    corr.columns = ["Taxon1", "Taxon2", "Correlation"]
+    expected = corr.query("0.7 < Correlation < 1 and Taxon1 != Taxon2")
+
+    edges = cooccurrence.cooccurrence_edges(df, block=7)
+
+    assert edge_set(edges) == {frozenset(pair) for pair in zip(expected["Taxon1"], expected["Taxon2"])}
+    assert frozenset(["g__Taxon0", "g__Taxon1"]) not in edge_set(edges)
+    assert "p_value" not in edges
+
+
+def test_perfect_pairs_kept_on_request():
+    edges = cooccurrence.cooccurrence_edges(make_abundance(), exclude_perfect=False)
+    assert frozenset(["g__Taxon0", "g__Taxon1"]) in edge_set(edges)
+
+
+def test_permutations_add_q_values():
+    edges = cooccurrence.cooccurrence_edges(make_abundance(), permutations=20, workers=2)
+    assert ((edges["p_value"] > 0) & (edges["p_value"] <= 1)).all()
+    assert (edges["q_value"] >= edges["p_value"]).all()
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.spatial.distance import pdist, squareform
+
+import distance_cache
+
+
+@pytest.fixture
+def counts():
+    rng = np.random.default_rng(1)
+    values = rng.poisson(3.0, size=(30, 12)).astype(float)
+    values[:, 0] += 1
+    return pd.DataFrame(values, index=[f"S{i}" for i in range(30)], columns=[f"g{j}" for j in range(12)])
+
+
+@pytest.fixture
+def kernel_calls(monkeypatch):
+    calls = []
+    kernel = distance_cache.pairwise_condensed
+    def recording(X, out_path, **kwargs):
+        calls.append((X.shape[0], kwargs["start"], os.path.basename(out_path)))
+        return kernel(X, out_path, **kwargs)
+    monkeypatch.setattr(distance_cache, "pairwise_condensed", recording)
+    return calls
+
+
+def test_exact_hit_is_reused(counts, tmp_path, kernel_calls):
+    cache_dir = str(tmp_path / "cache")
+    first, ids = distance_cache.cached_distances(counts, "braycurtis", cache_dir)
+    second, _ = distance_cache.cached_distances(counts, "braycurtis", cache_dir)
+
+    assert len(kernel_calls) == 1
+    assert f".{os.getpid()}.tmp.npy" in kernel_calls[0][2]
+    np.testing.assert_array_equal(first, second)
+    np.testing.assert_allclose(distance_cache.to_square(second, len(ids)),
+                               squareform(pdist(counts.to_numpy(), "braycurtis")), rtol=1e-6)
+    assert sorted(os.listdir(cache_dir)) == sorted(f for f in os.listdir(cache_dir) if ".tmp" not in f)
+
+
+def test_prefix_entry_is_extended(counts, tmp_path, kernel_calls):
+    cache_dir = str(tmp_path / "cache")
+    distance_cache.cached_distances(counts.iloc[:20], "braycurtis", cache_dir, tile=8)
+    condensed, ids = distance_cache.cached_distances(counts, "braycurtis", cache_dir, tile=8)
+
+    assert [(n, start) for n, start, _ in kernel_calls] == [(20, 0), (30, 20)]
+    assert ids == list(counts.index)
+    np.testing.assert_allclose(distance_cache.to_square(condensed, len(ids)),
+                               squareform(pdist(counts.to_numpy(), "braycurtis")), rtol=1e-6)
+
+
+def test_other_metric_or_features_miss(counts, tmp_path, kernel_calls):
+    cache_dir = str(tmp_path / "cache")
+    distance_cache.cached_distances(counts, "braycurtis", cache_dir)
+    distance_cache.cached_distances(counts, "jaccard", cache_dir)
+    distance_cache.cached_distances(counts.rename(columns={"g0": "g_new"}), "braycurtis", cache_dir)
+    assert [start for _, start, _ in kernel_calls] == [0, 0, 0]
+
+
+def test_cache_key_ignores_dtype_and_sparsity(counts, tmp_path, kernel_calls):
+    cache_dir = str(tmp_path / "cache")
+    first, _ = distance_cache.cached_distances(counts.astype(np.float32), "jaccard", cache_dir)
+    second, _ = distance_cache.cached_distances(counts.astype(pd.SparseDtype(np.float64, 0.0)), "jaccard", cache_dir)
+
+    assert len(kernel_calls) == 1
+    np.testing.assert_array_equal(first, second)
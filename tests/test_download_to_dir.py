@@ -0,0 +1,122 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import download_to_dir
+
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 123)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD at any path, honouring `Range: bytes=N-` like NEON's storage"""
+
+    def do_GET(self):
+        if self.path.startswith("/missing"):
+            self.send_error(404)
+            return
+        start = 0
+        if "Range" in self.headers:
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            if start >= len(PAYLOAD):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(PAYLOAD)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD) - start))
+        self.end_headers()
+        self.wfile.write(PAYLOAD[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_download_resumes_part_file(server, tmp_path):
+    save_path = str(tmp_path / "S1_R1.fastq.gz")
+    with open(save_path + ".part", "wb") as f:
+        f.write(PAYLOAD[:1000])
+
+    size = download_to_dir.download_file(download_to_dir.make_session(1), f"{server}/S1", save_path,
+                                         md5=hashlib.md5(PAYLOAD).hexdigest())
+
+    assert size == len(PAYLOAD)
+    assert not os.path.exists(save_path + ".part")
+    with open(save_path, "rb") as f:
+        assert f.read() == PAYLOAD
+
+
+def test_complete_part_file_is_finalised(server, tmp_path):
+    save_path = str(tmp_path / "S1_R1.fastq.gz")
+    with open(save_path + ".part", "wb") as f:
+        f.write(PAYLOAD)
+
+    download_to_dir.download_file(download_to_dir.make_session(1), f"{server}/S1", save_path)
+
+    with open(save_path, "rb") as f:
+        assert f.read() == PAYLOAD
+
+
+def test_oversized_part_file_is_restarted(server, tmp_path):
+    save_path = str(tmp_path / "S1_R1.fastq.gz")
+    with open(save_path + ".part", "wb") as f:
+        f.write(PAYLOAD + b"garbage")
+
+    size = download_to_dir.download_file(download_to_dir.make_session(1), f"{server}/S1", save_path)
+
+    assert size == len(PAYLOAD)
+    with open(save_path, "rb") as f:
+        assert f.read() == PAYLOAD
+
+
+def test_md5_mismatch_discards_part_file(server, tmp_path):
+    save_path = str(tmp_path / "S1_R1.fastq.gz")
+    with pytest.raises(IOError, match="md5 mismatch"):
+        download_to_dir.download_file(download_to_dir.make_session(1), f"{server}/S1", save_path,
+                                      md5="0" * 32)
+    assert not os.path.exists(save_path)
+    assert not os.path.exists(save_path + ".part")
+
+
+def test_download_all_reports_failures(server, tmp_path):
+    df = pd.DataFrame({
+        "dnaSampleID": ["S1-DNA1", "S1-DNA1", "S2-DNA1"],
+        "rawDataFileDescription": ["R1 fastq", "R2 fastq", "R1 fastq"],
+        "rawDataFilePath": [f"{server}/S1_R1", f"{server}/S1_R2", f"{server}/missing"],
+        "checksum": [hashlib.md5(PAYLOAD).hexdigest(), None, None],
+    })
+
+    failed = download_to_dir.download_all(df, str(tmp_path), workers=2)
+
+    assert failed == [f"{server}/missing"]
+    assert sorted(os.listdir(tmp_path)) == ["S1_R1.fastq.gz", "S1_R2.fastq.gz"]
+
+
+def test_main_exits_nonzero_on_failure(server, tmp_path, monkeypatch):
+    metadata = tmp_path / "meta.csv"
+    pd.DataFrame({
+        "dnaSampleID": ["S2-DNA1"],
+        "rawDataFileDescription": ["R1 fastq"],
+        "rawDataFilePath": [f"{server}/missing"],
+    }).to_csv(metadata, index=False)
+    monkeypatch.setattr("sys.argv", ["download_to_dir.py", "--metadata", str(metadata),
+                                     "--outdir", str(tmp_path / "out"), "--workers", "1"])
+
+    with pytest.raises(SystemExit) as exc:
+        download_to_dir.main()
+    assert exc.value.code == 1
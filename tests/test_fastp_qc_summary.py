@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("seaborn")
+import fastp_qc_summary
+
+
+def write_report(path, total_bases=1000, q30=0.9):
+    section = {"total_bases": total_bases, "q20_rate": 0.95, "q30_rate": q30}
+    path.write_text(json.dumps({
+        "summary": {"before_filtering": section, "after_filtering": dict(section, total_bases=total_bases - 100)},
+        "read1_before_filtering": {"quality_curves": {"mean": [30.0, 31.0]}, "content_curves": {}},
+    }))
+    return str(path)
+
+
+@pytest.fixture
+def parse_calls(monkeypatch):
+    calls = []
+    parse = fastp_qc_summary.parse_report
+    def counting(filepath):
+        calls.append(os.path.basename(filepath))
+        return parse(filepath)
+    monkeypatch.setattr(fastp_qc_summary, "parse_report", counting)
+    return calls
+
+
+def test_only_changed_reports_are_reparsed(tmp_path, parse_calls):
+    store = str(tmp_path / "store.sqlite")
+    s1 = write_report(tmp_path / "S1.json")
+    s2 = write_report(tmp_path / "S2.json", total_bases=2000)
+
+    fastp_qc_summary.summarize([s1, s2], store)
+    assert parse_calls == ["S1.json", "S2.json"]
+
+    # Unchanged: no parsing. Rewritten with identical content: sha1 matches, no parsing
+    fastp_qc_summary.summarize([s1, s2], store)
+    write_report(tmp_path / "S1.json")
+    os.utime(s1, (0, 12345))
+    assert parse_calls == ["S1.json", "S2.json"]
+    fastp_qc_summary.summarize([s1, s2], store)
+    assert parse_calls == ["S1.json", "S2.json"]
+
+    # Changed content: reparsed
+    write_report(tmp_path / "S2.json", total_bases=5000)
+    os.utime(s2, (0, 99999))
+    df = fastp_qc_summary.summarize([s1, s2], store)
+    assert parse_calls == ["S1.json", "S2.json", "S2.json"]
+    assert df["bases_before"].tolist() == [1000, 5000]
+    assert df["sample"].tolist() == ["S1", "S2"]
+
+
+def test_curves_are_stored(tmp_path):
+    store = str(tmp_path / "store.sqlite")
+    fastp_qc_summary.summarize([write_report(tmp_path / "S1_fastp.json")], store)
+    con = fastp_qc_summary.open_store(store)
+    assert fastp_qc_summary.load_curves(con, "S1")["read1_before_filtering"]["quality_curves"]["mean"] == [30.0, 31.0]
+    con.close()
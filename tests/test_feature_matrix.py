@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_matrix
+
+
+def frame(samples, features, start=1.0):
+    values = np.arange(start, start + len(samples) * len(features)).reshape(len(samples), len(features))
+    return pd.DataFrame(values, index=samples, columns=features)
+
+
+def expected(*frames):
+    return pd.concat(frames).fillna(0).astype(np.float32)
+
+
+def test_resume_after_crash_keeps_new_features(tmp_path):
+    path = str(tmp_path / "store.fmx")
+    a = frame(["S1", "S2"], ["f1", "f2"])
+    b = frame(["S3", "S4"], ["f1", "f3"], start=10)
+    c = frame(["S5"], ["f4", "f2"], start=20)
+    with feature_matrix.FeatureMatrixBuilder(path, flush_rows=2) as builder:
+        builder.append(a)
+    builder = feature_matrix.FeatureMatrixBuilder(path, flush_rows=2)
+    builder.append(b)  # flushed as a segment; the process then dies before close()
+    del builder
+
+    builder = feature_matrix.FeatureMatrixBuilder(path, flush_rows=2)
+    assert "S3" in builder and "S5" not in builder
+    builder.append(c)
+    builder.close()
+
+    result = feature_matrix.open_feature_matrix(path).to_frame()
+    pd.testing.assert_frame_equal(result, expected(a, b, c), check_names=False)
+
+
+def test_resume_after_interrupted_close(tmp_path, monkeypatch):
+    path = str(tmp_path / "store.fmx")
+    a = frame(["S1", "S2"], ["f1", "f2"])
+    b = frame(["S3"], ["f3"], start=10)
+    with feature_matrix.FeatureMatrixBuilder(path) as builder:
+        builder.append(a)
+
+    write_ids = feature_matrix._write_ids
+    def crash_on_samples(p, ids):
+        if os.path.basename(p) == feature_matrix.SAMPLES:
+            raise KeyboardInterrupt
+        write_ids(p, ids)
+    monkeypatch.setattr(feature_matrix, "_write_ids", crash_on_samples)
+    builder = feature_matrix.FeatureMatrixBuilder(path)
+    builder.append(b)
+    with pytest.raises(KeyboardInterrupt):
+        builder.close()  # values.npy already holds S3
+    monkeypatch.setattr(feature_matrix, "_write_ids", write_ids)
+
+    feature_matrix.FeatureMatrixBuilder(path).close()
+
+    result = feature_matrix.open_feature_matrix(path).to_frame()
+    pd.testing.assert_frame_equal(result, expected(a, b), check_names=False)
+
+
+def test_build_skips_samples_already_stored(tmp_path):
+    tables = []
+    for sample, start in [("S1", 1.0), ("S2", 5.0)]:
+        p = tmp_path / f"{sample}.tsv"
+        pd.DataFrame({"value": [start, start + 1]}, index=["f1", "f2"]).to_csv(p, sep="\t")
+        tables.append(str(p))
+    path = str(tmp_path / "store.fmx")
+
+    feature_matrix.build_feature_matrix(tables[:1], path)
+    matrix = feature_matrix.build_feature_matrix(tables, path)
+
+    assert matrix.samples == ["S1", "S2"]
+    np.testing.assert_array_equal(matrix.values, [[1, 2], [5, 6]])
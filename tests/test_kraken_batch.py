@@ -0,0 +1,96 @@
+import os
+import stat
+import subprocess
+import sys
+import textwrap
+
+import pandas as pd
+
+import kraken_batch
+
+# Stand-ins for the real executables: kraken2 writes a padded report for
+# its first read file, bracken turns the amended report into a Bracken table
+KRAKEN2 = """
+    import sys
+    args = sys.argv[1:]
+    report = args[args.index("--report") + 1]
+    assert "--memory-mapping" in args
+    with open(args[-2]) as f:
+        taxa = [line.split() for line in f if line.strip()]
+    with open(report, "w") as out:
+        for name, taxid, reads in taxa:
+            out.write(f"  50.00\\t{reads}\\t{reads}\\tS\\t{taxid}\\t      {name.replace('_', ' ')}\\n")
+"""
+BRACKEN = """
+    import sys
+    args = sys.argv[1:]
+    with open(args[args.index("-i") + 1]) as f:
+        rows = [line.rstrip("\\n").split("\\t") for line in f]
+    total = sum(int(r[1]) for r in rows)
+    with open(args[args.index("-o") + 1], "w") as out:
+        out.write("name\\ttaxonomy_id\\ttaxonomy_lvl\\tkraken_assigned_reads\\tadded_reads\\t"
+                  "new_est_reads\\tfraction_total_reads\\n")
+        for r in rows:
+            out.write(f"{r[5]}\\t{r[4]}\\tS\\t{r[1]}\\t0\\t{r[1]}\\t{int(r[1]) / total:.5f}\\n")
+"""
+
+
+def write_stub(path, body):
+    path.write_text(f"#!{sys.executable}\n" + textwrap.dedent(body))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_run_and_combine_with_stub_classifier(tmp_path, monkeypatch):
+    db = tmp_path / "db"
+    db.mkdir()
+    (db / "hash.k2d").write_bytes(b"k2d" * 100)
+    reads = {"S1": "Escherichia_coli 562 30\nBacillus_subtilis 1423 10\n",
+             "S2": "Escherichia_coli 562 5\n"}
+    for sample, content in reads.items():
+        (tmp_path / f"{sample}_R1.fastq").write_text(content)
+        (tmp_path / f"{sample}_R2.fastq").write_text(content)
+    out = tmp_path / "out"
+
+    monkeypatch.setattr("sys.argv", [
+        "kraken_batch.py", "run", "--db", str(db), "--stage-db", str(tmp_path / "shm"),
+        "--samples", "S1", "S2",
+        "--r1", str(tmp_path / "S1_R1.fastq"), str(tmp_path / "S2_R1.fastq"),
+        "--r2", str(tmp_path / "S1_R2.fastq"), str(tmp_path / "S2_R2.fastq"),
+        "--outdir", str(out),
+        "--kraken2", write_stub(tmp_path / "kraken2", KRAKEN2),
+        "--bracken", write_stub(tmp_path / "bracken", BRACKEN)])
+    kraken_batch.main()
+
+    assert (tmp_path / "shm" / "hash.k2d").read_bytes() == b"k2d" * 100
+    assert (out / "S1_amend.report").read_text().splitlines()[0].split("\t") == \
+        ["50.00", "30", "30", "S", "562", "Escherichia coli"]
+
+    kraken_batch.combine_reports([str(out / "S1.bracken_report"), str(out / "S2.bracken_report")],
+                                 ["S1", "S2"], str(out / "matrix.tsv"))
+    matrix = pd.read_csv(out / "matrix.tsv", sep="\t").set_index("name")
+    assert matrix.loc["Escherichia coli", ["S1_num", "S2_num"]].tolist() == [30, 5]
+    assert matrix.loc["Bacillus subtilis", ["S1_num", "S2_num"]].tolist() == [10, 0]
+    assert matrix.loc["Bacillus subtilis", "S2_frac"] == 0
+
+
+def test_stage_database_recopies_changed_files(tmp_path):
+    db, stage = tmp_path / "db", tmp_path / "shm"
+    db.mkdir()
+    src = db / "hash.k2d"
+    src.write_bytes(b"old-")
+    kraken_batch.stage_database(str(db), str(stage))
+
+    src.write_bytes(b"new!")  # same size, rebuilt later
+    os.utime(src, (src.stat().st_atime, src.stat().st_mtime + 10))
+    kraken_batch.stage_database(str(db), str(stage))
+
+    assert (stage / "hash.k2d").read_bytes() == b"new!"
+    assert os.listdir(stage) == ["hash.k2d"]
+
+
+def test_run_does_not_need_pandas():
+    # The sbatch array tasks only load the kraken2/bracken modules
+    code = "import sys, kraken_batch; assert 'pandas' not in sys.modules"
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(kraken_batch.__file__))
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
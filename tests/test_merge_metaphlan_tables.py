@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import merge_metaphlan_tables as mmt
+
+PROFILES = {
+    "SCBI_012_metaphlan_profile.tsv": [
+        ("k__Bacteria", 100.0),
+        ("k__Bacteria|p__Proteobacteria", 60.0),
+        ("k__Bacteria|p__Proteobacteria|c__Gammaproteobacteria", 60.0),
+        ("k__Bacteria|p__Firmicutes", 40.0),
+    ],
+    "WOOD_002_metaphlan_profile.tsv": [
+        ("k__Bacteria", 90.0),
+        ("k__Bacteria|p__Firmicutes", 90.0),
+        ("k__Bacteria|p__Firmicutes|c__Bacilli", 90.0),
+        ("UNCLASSIFIED", 10.0),
+    ],
+    "HARV_001.tsv": [
+        ("k__Archaea", 100.0),
+        ("k__Archaea|p__Euryarchaeota", 100.0),
+    ],
+}
+
+
+def legacy_merge(paths, samples=None):
+    """The chained outer join merge_profiles replaced"""
+    merged = None
+    for f in paths:
+        df = mmt.read_metaphlan_table(f, mmt.infer_sample_name(f))
+        merged = df if merged is None else merged.join(df, how="outer")
+    merged = merged.fillna(0.0)
+    return merged.reindex(samples if samples else sorted(merged.columns), axis=1)
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    paths = []
+    for name, rows in PROFILES.items():
+        path = tmp_path / name
+        lines = ["#mpa_vJan21_CHOCOPhlAnSGB_202103", "clade_name\trelative_abundance"]
+        path.write_text("\n".join(lines + [f"{c}\t{v}" for c, v in rows]) + "\n")
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize("samples", [None, ["WOOD_002", "SCBI_012", "HARV_001"], ["SCBI_012", "MISSING"]])
+def test_merge_matches_chained_outer_join(profiles, samples):
+    merged = mmt.merge_profiles(profiles, samples=samples, threads=2)
+    pd.testing.assert_frame_equal(merged, legacy_merge(profiles, samples))
+
+
+def test_merge_values(profiles):
+    merged = mmt.merge_profiles(profiles)
+    assert list(merged.columns) == ["HARV_001", "SCBI_012", "WOOD_002"]
+    assert merged.index.is_monotonic_increasing
+    assert merged.loc["k__Bacteria|p__Firmicutes"].tolist() == [0.0, 40.0, 90.0]
+    assert merged.loc["UNCLASSIFIED"].tolist() == [0.0, 0.0, 10.0]
+
+
+def test_single_profile_keeps_file_order(profiles):
+    merged = mmt.merge_profiles(profiles[:1])
+    assert list(merged.index) == [c for c, _ in PROFILES["SCBI_012_metaphlan_profile.tsv"]]
+    np.testing.assert_array_equal(merged["SCBI_012"], [100.0, 60.0, 60.0, 40.0])
+
+
+def legacy_collapse(df, rank):
+    return df.groupby(lambda x: next((p for p in x.split("|") if p.startswith(rank + "__")), "unclassified")).sum()
+
+
+def legacy_summary(merged):
+    frames = []
+    for r in mmt.RANKS:
+        collapsed = legacy_collapse(merged, r).T
+        collapsed = collapsed.reset_index().melt(id_vars="index", var_name="taxon", value_name="relative_abundance")
+        collapsed = collapsed.rename(columns={"index": "sample_id"})
+        collapsed["rank"] = r
+        frames.append(collapsed)
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.mark.parametrize("rank", mmt.RANKS)
+def test_collapse_matches_groupby(profiles, rank):
+    merged = mmt.merge_profiles(profiles)
+    collapsed = mmt.collapse_by_rank(merged, rank, mmt.build_lineage_index(merged.index))
+    expected = legacy_collapse(merged, rank)
+    pd.testing.assert_frame_equal(collapsed, expected, check_names=False, check_index_type=False)
+
+
+def test_rank_summary_matches_legacy_output(profiles, tmp_path):
+    merged = mmt.merge_profiles(profiles)
+    out = tmp_path / "summary.tsv"
+    mmt.write_rank_summary(merged, out)
+
+    expected = tmp_path / "legacy.tsv"
+    legacy_summary(merged).to_csv(expected, sep="\t", index=False)
+    assert out.read_text() == expected.read_text()
@@ -0,0 +1,90 @@
+import gzip
+import os
+import stat
+import sys
+
+import pytest
+
+import merge_reads
+
+R1 = b"@r1/1\nACGT\n+\nIIII\n@r2/1\nGGCC\n+\nIIII\n"
+R2 = b"@r1/2\nTTAA\n+\nIIII\n@r2/2\nCCGG\n+\nIIII"  # no trailing newline
+MERGED = R1 + R2 + b"\n"
+
+# pigz stand-in: drops "-p N" and hands the rest to gzip
+PIGZ = """
+import subprocess, sys
+args = sys.argv[1:]
+if "-p" in args:
+    i = args.index("-p")
+    del args[i:i + 2]
+sys.exit(subprocess.call(["gzip"] + args))
+"""
+
+
+@pytest.fixture
+def reads(tmp_path):
+    paths = {}
+    for name, data in (("R1", R1), ("R2", R2)):
+        paths[name] = tmp_path / f"S1_{name}_trimmed.fastq"
+        paths[name].write_bytes(data)
+        paths[name + ".gz"] = tmp_path / f"S1_{name}_trimmed.fastq.gz"
+        # Two members per file, as fastp writes with several threads
+        paths[name + ".gz"].write_bytes(gzip.compress(data[:9]) + gzip.compress(data[9:]))
+    return paths
+
+
+@pytest.fixture(params=["pigz", "gzip-module"])
+def compressor(request, tmp_path, monkeypatch):
+    """Run with a pigz on PATH, and with no external tool (stdlib gzip fallback)"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    if request.param == "pigz":
+        pigz = bin_dir / "pigz"
+        pigz.write_text(f"#!{sys.executable}\n{PIGZ}")
+        pigz.chmod(pigz.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    else:
+        monkeypatch.setattr(merge_reads.shutil, "which", lambda tool: None)
+    return request.param
+
+
+def test_gzip_members_are_copied(reads, tmp_path):
+    out = str(tmp_path / "merged.fastq.gz")
+    stats = merge_reads.merge_reads([str(reads["R1.gz"]), str(reads["R2.gz"])], out)
+
+    with gzip.open(out) as f:
+        assert f.read() == MERGED
+    assert stats["reads"] == 4
+    assert stats["bytes"] == len(MERGED)
+
+
+def test_plain_inputs_compressed(reads, tmp_path, compressor):
+    out = str(tmp_path / "merged.fastq.gz")
+    stats = merge_reads.merge_reads([str(reads["R1"]), str(reads["R2"])], out, threads=2)
+
+    with gzip.open(out) as f:
+        assert f.read() == MERGED
+    assert stats["reads"] == 4
+
+
+def test_gzip_inputs_decompressed(reads, tmp_path, compressor):
+    out = tmp_path / "merged.fastq"
+    merge_reads.merge_reads([str(reads["R1.gz"]), str(reads["R2.gz"])], str(out), threads=2)
+    assert out.read_bytes() == MERGED
+
+
+def test_truncated_member_copy_raises(reads, tmp_path):
+    data = reads["R2.gz"].read_bytes()
+    reads["R2.gz"].write_bytes(data[:-10])
+
+    with pytest.raises(IOError, match="truncated"):
+        merge_reads.merge_reads([str(reads["R1.gz"]), str(reads["R2.gz"])], str(tmp_path / "merged.fastq.gz"))
+
+
+def test_truncated_input_raises_when_decompressing(reads, tmp_path, compressor):
+    data = reads["R2.gz"].read_bytes()
+    reads["R2.gz"].write_bytes(data[:-10])
+
+    with pytest.raises((RuntimeError, EOFError)):
+        merge_reads.merge_reads([str(reads["R1.gz"]), str(reads["R2.gz"])], str(tmp_path / "merged.fastq"))
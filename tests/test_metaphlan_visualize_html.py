@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("plotly")
+
+import metaphlan_visualize_html as mvh
+
+# Phylum A has one genus (50) plus a class with nothing below it (10);
+# Phylum B's children cover only part of it; UNCLASSIFIED has no ranks at all
+PROFILE = (
+    "#clade_name\tNCBI_tax_id\trelative_abundance\tadditional_species\n"
+    "UNCLASSIFIED\t-1\t10.0\t\n"
+    "k__K\t1\t90.0\t\n"
+    "k__K|p__A\t1|2\t60.0\t\n"
+    "k__K|p__A|c__A1\t1|2|3\t50.0\t\n"
+    "k__K|p__A|c__A1|o__A1\t1|2|3|4\t50.0\t\n"
+    "k__K|p__A|c__A1|o__A1|f__A1\t1|2|3|4|5\t50.0\t\n"
+    "k__K|p__A|c__A1|o__A1|f__A1|g__A1\t1|2|3|4|5|6\t50.0\t\n"
+    "k__K|p__A|c__A1|o__A1|f__A1|g__A1|s__A1\t1|2|3|4|5|6|7\t50.0\t\n"
+    "k__K|p__A|c__A2\t1|2|8\t10.0\t\n"
+    "k__K|p__B\t1|9\t30.0\t\n"
+    "k__K|p__B|c__B1\t1|9|10\t20.0\t\n"
+    "k__K|p__B|c__B1|o__B1\t1|9|10|11\t20.0\t\n"
+    "k__K|p__B|c__B1|o__B1|f__B1\t1|9|10|11|12\t20.0\t\n"
+    "k__K|p__B|c__B1|o__B1|f__B1|g__B1\t1|9|10|11|12|13\t20.0\t\n"
+)
+
+
+@pytest.fixture
+def levels(tmp_path):
+    path = tmp_path / "SAMPLE01.tsv"
+    path.write_text(PROFILE)
+    return mvh.aggregate_levels(mvh.load_taxonomy(str(path), "SAMPLE01"))
+
+
+def totals(df, rank):
+    return df.groupby(rank)["relative_abundance"].sum().to_dict()
+
+
+def test_parent_totals_match_the_profile(levels):
+    for level, df in levels.items():
+        assert totals(df, "Phylum") == {"A": 60.0, "B": 30.0, "Unclassified": 10.0}, level
+        assert totals(df, "Kingdom") == {"K": 90.0, "UNCLASSIFIED": 10.0}, level
+
+
+def test_uncovered_abundance_becomes_an_unclassified_child(levels):
+    genus = levels["Genus"].set_index(["Phylum", "Class", "Genus"])["relative_abundance"]
+    assert genus[("A", "A1", "A1")] == 50.0
+    assert genus[("A", "A2", "Unclassified")] == 10.0
+    assert genus[("B", "B1", "B1")] == 20.0
+    assert genus[("B", "Unclassified", "Unclassified")] == 10.0
+
+
+def test_batch_writes_one_shared_bundle(tmp_path):
+    (tmp_path / "SAMPLE01.tsv").write_text(PROFILE)
+    out = tmp_path / "new" / "html"
+
+    paths = mvh.generate_sunburst_batch([str(tmp_path / "SAMPLE01.tsv")], str(out))
+
+    assert paths == [str(out / "SAMPLE01_sunburst.html")]
+    assert (out / mvh.PLOTLY_BUNDLE).exists()
+    assert mvh.PLOTLY_BUNDLE in (out / "SAMPLE01_sunburst.html").read_text()
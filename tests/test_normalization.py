@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("skbio")
+import normalization
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "normalization")
+
+
+def load_counts():
+    return pd.read_csv(os.path.join(DATA, "counts.tsv"), sep="\t", index_col=0)
+
+
+def test_css_hand_computed():
+    # Non-zero counts per sample: [1,2,3,10], [1,3,5,8], [1,2,4,6]; the
+    # cumNormStatFast statistic is 0.25, so the default 0.5 is used and the
+    # medians 2.5, 4 and 3 give scaling sums 1+2, 3+1 and 2+1
+    df = pd.DataFrame([[1, 0, 2], [2, 3, 0], [3, 1, 4], [10, 5, 6], [0, 8, 1]],
+                      index=list("abcde"), columns=["S1", "S2", "S3"])
+    assert normalization.css_quantile(df.to_numpy(dtype=float)) == 0.5
+
+    expected = df.to_numpy(dtype=float) / (np.array([3.0, 4.0, 3.0]) / 1000)
+    np.testing.assert_allclose(normalization.normalize_css(df).to_numpy(), expected, rtol=1e-12)
+
+
+def test_dlog_posterior_is_the_derivative():
+    counts = load_counts().to_numpy(dtype=float)
+    counts = counts[counts.sum(axis=1) > 0]
+    size_factors = normalization.deseq2_size_factors(counts)
+    mu = np.maximum((counts / size_factors).mean(axis=1, keepdims=True) * size_factors, 0.5)
+    log_alpha = np.log(np.full(len(counts), 0.05))
+    step = 1e-5
+
+    numeric = (normalization._log_posterior(log_alpha + step, counts, mu)
+               - normalization._log_posterior(log_alpha - step, counts, mu)) / (2 * step)
+    np.testing.assert_allclose(normalization._dlog_posterior(log_alpha, counts, mu), numeric, rtol=1e-5, atol=1e-6)
+
+
+def test_parametric_fit_recovers_trend():
+    means = np.geomspace(1, 1e4, 200)
+    asympt_disp, extra_pois = normalization.deseq2_parametric_fit(means, 0.05 + 2 / means)
+    assert asympt_disp == pytest.approx(0.05, rel=1e-6)
+    assert extra_pois == pytest.approx(2, rel=1e-6)
+
+
+def test_local_fit_follows_smooth_trend():
+    means = np.geomspace(1, 1e4, 300)
+    disp_function = normalization.deseq2_local_fit(means, 0.05 + 2 / means)
+    query = np.geomspace(2, 5e3, 50)
+    np.testing.assert_allclose(disp_function(query), 0.05 + 2 / query, rtol=0.05)
+
+
+def test_numeric_vst_matches_parametric_closed_form():
+    # With the parametric trend plugged into the numerical integration, the
+    # local-fit VST is the closed-form integral of 1/sqrt(xim*x + (a + b/x)*x^2)
+    # up to DESeq2's affine anchoring (zeros are extrapolated below the first
+    # spline knot, in DESeq2 too, so only non-zero counts are compared)
+    counts = load_counts().to_numpy(dtype=float)
+    size_factors = normalization.deseq2_size_factors(counts)
+    ncounts = counts / size_factors
+    a, b = 0.05, 2.0
+    xim = np.mean(1 / size_factors)
+
+    numeric = normalization.deseq2_vst_local(ncounts, size_factors, lambda q: a + b / q)
+    closed = np.log(xim + b + 2 * a * ncounts + 2 * np.sqrt(a * ncounts * (xim + b + a * ncounts)))
+    nonzero = ncounts > 0
+    design = np.column_stack([np.ones(nonzero.sum()), closed[nonzero]])
+    coefs = np.linalg.lstsq(design, numeric[nonzero], rcond=None)[0]
+    assert np.abs(design @ coefs - numeric[nonzero]).max() < 5e-3
+
+
+def test_failed_parametric_fit_falls_back_to_local(monkeypatch, capsys):
+    def fail(means, disps):
+        raise ValueError("parametric dispersion fit failed")
+    monkeypatch.setattr(normalization, "deseq2_parametric_fit", fail)
+    df = load_counts()
+
+    vst = normalization.normalize_deseq2(df)
+
+    assert "fitType='local'" in capsys.readouterr().out
+    assert np.isfinite(vst.to_numpy()).all()
+    for sample in df.columns:
+        order = np.argsort(df[sample].to_numpy(), kind="stable")
+        assert np.all(np.diff(vst[sample].to_numpy()[order]) >= -1e-9)
+
+
+@pytest.mark.parametrize("method, reference, atol", [
+    ("css_numpy", "css_metagenomeseq.tsv", 1e-6),
+    ("deseq2_numpy", "vst_deseq2.tsv", 1e-3),
+])
+def test_matches_r_reference(method, reference, atol):
+    path = os.path.join(DATA, reference)
+    if not os.path.exists(path):
+        pytest.skip(f"{reference} not exported; run tests/data/normalization/export_reference.R")
+    df = load_counts()
+    expected = pd.read_csv(path, sep="\t", index_col=0).loc[df.index, df.columns]
+
+    result = normalization.METHODS[method](df)
+
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-6, atol=atol)
+
+
+def test_sparse_clr_matches_dense(tmp_path):
+    # Three per-sample tables with partly different features, written in
+    # row blocks of 7 with at most two output files open at once
+    counts = load_counts()
+    tables = [counts.iloc[:40, :2], counts.iloc[10:, 2:5], counts.iloc[::2, 5:]]
+    inputs, outputs = [], []
+    for k, table in enumerate(tables):
+        inputs.append(str(tmp_path / f"in{k}.tsv"))
+        outputs.append(str(tmp_path / f"out{k}.tsv"))
+        table.to_csv(inputs[-1], sep="\t")
+
+    X, index, columns, widths = normalization.load_cohort_sparse(inputs, chunksize=9)
+    normalization.write_clr_per_sample(X, index, columns, widths, outputs, block_rows=7, max_open=2)
+
+    dense, _ = normalization.load_cohort(inputs)
+    expected = normalization.normalize_clr(dense)
+    for k, out in enumerate(outputs):
+        result = pd.read_csv(out, sep="\t", index_col=0)
+        pd.testing.assert_frame_equal(result, expected[tables[k].columns], rtol=1e-12)
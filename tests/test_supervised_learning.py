@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("xgboost")
+pytest.importorskip("shap")
+
+import shap_cache
+import supervised_learning
+
+
+def make_data(n=40, m=6, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, m))
+    Y = np.column_stack([X[:, 0] * 2 + rng.normal(scale=0.1, size=n),
+                         X[:, 1] - X[:, 2] + rng.normal(scale=0.1, size=n)])
+    return X, Y
+
+
+def test_cv_pool_scores_every_target():
+    X, Y = make_data()
+    summary, tasks = supervised_learning.evaluate_models(
+        X, Y, ["a", "b"], ["ElasticNet", "RandomForest"], n_iterations=6, threads=2, n_splits=3,
+        patience=5)
+
+    assert set(summary) == {"ElasticNet", "RandomForest"}
+    for name in summary:
+        assert set(summary[name]) == {"a", "b"}
+        assert summary[name]["a"]["cv_repeats"] == 2
+        assert not summary[name]["a"]["cv_early_stopped"]
+    # one row per (model, repeat, fold, target)
+    assert len(tasks) == 2 * 2 * 3 * 2
+    assert summary["RandomForest"]["a"]["cv_mean_r2"] > 0.5
+
+
+def test_cv_pool_stops_converged_models_early():
+    X, Y = make_data()
+    summary, tasks = supervised_learning.evaluate_models(
+        X, Y[:, :1], ["a"], ["ElasticNet"], n_iterations=30, n_splits=3, tol=1.0, patience=1)
+
+    assert summary["ElasticNet"]["a"]["cv_early_stopped"]
+    assert summary["ElasticNet"]["a"]["cv_repeats"] == 2
+    assert tasks["repeat"].max() < 10
+
+
+class StubLinear:
+    """Fitted linear model as far as shap_cache can tell"""
+
+    def __init__(self, coef):
+        self.coef_ = np.asarray(coef, dtype=float)
+
+
+def test_shap_values_are_reused_from_the_cache(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_chunk(model, background, kind, X):
+        calls.append(kind)
+        return X * model.coef_
+
+    monkeypatch.setattr(shap_cache, "_explain_chunk", fake_chunk)
+    X, _ = make_data()
+    model = StubLinear(np.arange(X.shape[1]))
+
+    first = shap_cache.explain(model, X, X, background=10, cache_dir=str(tmp_path))
+    second = shap_cache.explain(model, X, X, background=10, cache_dir=str(tmp_path))
+    assert calls == ["linear"]
+    np.testing.assert_array_equal(first, second)
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+
+    # A different model or different rows are explained again
+    shap_cache.explain(StubLinear(np.ones(X.shape[1])), X, X, background=10, cache_dir=str(tmp_path))
+    shap_cache.explain(model, X[:5], X, background=10, cache_dir=str(tmp_path))
+    assert calls == ["linear"] * 3
@@ -0,0 +1,74 @@
+import json
+import re
+
+import pytest
+
+pytest.importorskip("plotly")
+
+import taxonomy_explorer
+
+PROFILE = (
+    "#clade_name\tNCBI_tax_id\trelative_abundance\tadditional_species\n"
+    "UNCLASSIFIED\t-1\t10.0\t\n"
+    "k__K\t1\t90.0\t\n"
+    "k__K|p__A\t1|2\t60.0\t\n"
+    "k__K|p__A|c__A1\t1|2|3\t60.0\t\n"
+    "k__K|p__A|c__A1|o__A1\t1|2|3|4\t60.0\t\n"
+    "k__K|p__A|c__A1|o__A1|f__A1\t1|2|3|4|5\t60.0\t\n"
+    "k__K|p__A|c__A1|o__A1|f__A1|g__A1\t1|2|3|4|5|6\t60.0\t\n"
+    "k__K|p__B\t1|9\t30.0\t\n"
+)
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    (tmp_path / "SCBI_012.tsv").write_text(PROFILE)
+    (tmp_path / "WOOD_002.tsv").write_text(PROFILE.replace("\t60.0", "\t50.0").replace("\t30.0", "\t40.0"))
+    return [str(tmp_path / "SCBI_012.tsv"), str(tmp_path / "WOOD_002.tsv")]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_level_tables_keep_profile_totals(profiles, workers):
+    tables = taxonomy_explorer.cohort_level_tables(profiles, workers)
+
+    assert list(tables) == ["Phylum", "Class", "Order", "Family", "Genus"]
+    phylum = tables["Phylum"].droplevel("Kingdom")
+    assert list(phylum.columns) == ["SCBI_012", "WOOD_002"]
+    assert phylum.loc["A"].tolist() == [60.0, 50.0]
+    assert phylum.loc["B"].tolist() == [30.0, 40.0]
+    for table in tables.values():
+        assert table.sum().tolist() == [100.0, 100.0]
+
+
+def test_duplicate_sample_ids_are_rejected(tmp_path, profiles):
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "SCBI_012.tsv").write_text(PROFILE)
+
+    with pytest.raises(ValueError, match="SCBI_012"):
+        taxonomy_explorer.cohort_level_tables(profiles + [str(other / "SCBI_012.tsv")])
+
+
+def test_payload_is_sparse_per_sample(profiles):
+    table = taxonomy_explorer.cohort_level_tables(profiles)["Genus"]
+    payload = taxonomy_explorer.level_payload(table)
+
+    assert len(payload["samples"]) == 2
+    for (idx, values), sample in zip(payload["samples"], table.columns):
+        assert values == [table[sample].iloc[i] for i in idx]
+        assert 0.0 not in values
+
+
+@pytest.mark.parametrize("plotlyjs", ["inline", "directory"])
+def test_explorer_written_into_a_new_directory(tmp_path, profiles, plotlyjs):
+    tables = taxonomy_explorer.cohort_level_tables(profiles)
+    output = tmp_path / "new" / "explorer.html"
+
+    taxonomy_explorer.build_explorer(tables, str(output), plotlyjs=plotlyjs)
+
+    html = output.read_text()
+    meta = json.loads(re.search(r"const META = (.*);", html).group(1))
+    assert meta["samples"] == ["SCBI_012", "WOOD_002"]
+    assert meta["sites"] == ["SCBI", "WOOD"]
+    assert 'id="level-Genus"' in html
+    assert (output.parent / taxonomy_explorer.PLOTLY_BUNDLE).exists() == (plotlyjs == "directory")
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+import taxonomy_levels
+
+PROFILE = (
+    "#mpa_vJan21_CHOCOPhlAnSGB_202103\n"
+    "#clade_name\tNCBI_tax_id\trelative_abundance\tadditional_species\n"
+    "k__Bacteria\t2\t100.0\t\n"
+    "k__Bacteria|p__Proteobacteria\t2|1224\t60.5\t\n"
+    "k__Bacteria|p__Firmicutes\t2|1239\t39.5\t\n"
+)
+
+
+def test_abundance_column_selected_by_name(tmp_path):
+    (tmp_path / "SCBI_012.tsv").write_text(PROFILE)
+    (tmp_path / "WOOD_002.tsv").write_text(PROFILE.replace("60.5", "70.5").replace("39.5", "29.5"))
+
+    merged = taxonomy_levels.merge_profiles(str(tmp_path), abundance_col="relative_abundance")
+
+    merged = merged.set_index("clade_name")[["SCBI_012", "WOOD_002"]]
+    assert merged.loc["k__Bacteria|p__Proteobacteria"].tolist() == [60.5, 70.5]
+    assert merged.loc["k__Bacteria"].tolist() == [100.0, 100.0]
+
+
+def test_default_column_uses_header(tmp_path):
+    (tmp_path / "SCBI_012.tsv").write_text(PROFILE)
+    s = taxonomy_levels.read_profile(str(tmp_path / "SCBI_012.tsv"), "SCBI_012")
+    assert s["k__Bacteria|p__Firmicutes"] == 39.5
+
+
+def test_default_column_merges_headerless_profiles_by_position(tmp_path):
+    (tmp_path / "SCBI_012.tsv").write_text(PROFILE)
+    (tmp_path / "WOOD_002.tsv").write_text("k__Bacteria\t100.0\nk__Bacteria|p__Firmicutes\t25.0\n")
+
+    merged = taxonomy_levels.merge_profiles(str(tmp_path), sample_pattern=None)
+
+    merged = merged.set_index("clade_name")[["SCBI_012", "WOOD_002"]]
+    assert merged.loc["k__Bacteria|p__Firmicutes"].tolist() == [39.5, 25.0]
+
+
+def test_no_readable_profiles_raises(tmp_path):
+    (tmp_path / "SCBI_012.tsv").write_text("only_one_column\n")
+    with pytest.raises(ValueError, match="could be read"):
+        taxonomy_levels.merge_profiles(str(tmp_path))
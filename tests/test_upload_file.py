@@ -0,0 +1,120 @@
+import itertools
+import sys
+import types
+
+import pytest
+
+# upload_file imports bioblend at module level; the tests drive it with an
+# in-memory Galaxy instead, so a placeholder module is enough
+if "bioblend" not in sys.modules:
+    bioblend = types.ModuleType("bioblend")
+    bioblend.galaxy = types.ModuleType("bioblend.galaxy")
+    bioblend.galaxy.GalaxyInstance = None
+    sys.modules.update({"bioblend": bioblend, "bioblend.galaxy": bioblend.galaxy})
+
+import upload_file
+
+
+class FakeGalaxy:
+    """Just enough of bioblend's GalaxyInstance for MetaPhlAnOrchestrator"""
+
+    def __init__(self, job_state="ok", output_state="ok"):
+        self.job_state = job_state
+        self.output_state = output_state
+        self.ids = (f"id{i}" for i in itertools.count())
+        self.histories_created = []
+        self.histories_deleted = []
+        self.contents = {}   # history id -> [dataset]
+        self.jobs_by_id = {}
+        self.datasets_by_id = {}
+        self.histories = types.SimpleNamespace(create_history=self.create_history,
+                                               delete_history=self.delete_history,
+                                               show_history=self.show_history)
+        self.tools = types.SimpleNamespace(upload_file=self.upload_file, run_tool=self.run_tool)
+        self.jobs = types.SimpleNamespace(show_job=lambda job_id: self.jobs_by_id[job_id])
+        self.datasets = types.SimpleNamespace(show_dataset=lambda ds_id: self.datasets_by_id[ds_id],
+                                              download_dataset=self.download_dataset)
+
+    def _dataset(self, history_id, name, state="ok"):
+        ds = {"id": next(self.ids), "name": name, "state": state, "deleted": False}
+        self.datasets_by_id[ds["id"]] = ds
+        self.contents.setdefault(history_id, []).append(ds)
+        return ds
+
+    def create_history(self, name):
+        history = {"id": next(self.ids), "name": name}
+        self.histories_created.append(history["id"])
+        self.contents[history["id"]] = []
+        return history
+
+    def delete_history(self, history_id, purge=False):
+        self.histories_deleted.append(history_id)
+
+    def show_history(self, history_id, contents=False):
+        if contents:
+            return list(self.contents[history_id])
+        return {"state_details": {"ok": len(self.contents[history_id])}}
+
+    def upload_file(self, path, history_id):
+        return {"outputs": [self._dataset(history_id, path)]}
+
+    def run_tool(self, history_id, tool_id, inputs):
+        output = self._dataset(history_id, "MetaPhlAn profile", self.output_state)
+        job = {"id": next(self.ids), "state": self.job_state,
+               "outputs": {"output_file": {"id": output["id"], "src": "hda"}}}
+        self.jobs_by_id[job["id"]] = job
+        return {"jobs": [job]}
+
+    def download_dataset(self, ds_id, file_path, use_default_filename, wait_for_completion):
+        with open(file_path, "w") as f:
+            f.write(self.datasets_by_id[ds_id]["name"])
+
+
+@pytest.fixture
+def pairs(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    for read in ("R1", "R2"):
+        (raw / f"S1_{read}.fastq").write_text("@r\nACGT\n+\nIIII\n")
+    return upload_file.find_pairs(str(raw))
+
+
+def run(gi, tmp_path, pairs):
+    state = upload_file.RunState(str(tmp_path / "state.json"))
+    orchestrator = upload_file.MetaPhlAnOrchestrator(gi, "metaphlan", str(tmp_path / "out"), state,
+                                                     poll_min=0.01, poll_max=0.01)
+    orchestrator.run(pairs)
+    return state
+
+
+def test_successful_job_downloads_only_its_outputs(tmp_path, pairs):
+    state = run(FakeGalaxy(), tmp_path, pairs)
+
+    assert state.get("S1")["stage"] == upload_file.DONE
+    assert sorted(p.name for p in (tmp_path / "out" / "S1").iterdir()) == ["MetaPhlAn_profile.dat"]
+
+
+@pytest.mark.parametrize("job_state, output_state", [("error", "error"), ("ok", "error")])
+def test_errored_job_is_marked_failed(tmp_path, pairs, job_state, output_state):
+    state = run(FakeGalaxy(job_state, output_state), tmp_path, pairs)
+
+    st = state.get("S1")
+    assert st["stage"] == upload_file.FAILED
+    assert st["job_id"] is None
+    assert not (tmp_path / "out" / "S1").exists()
+
+
+def test_resume_during_upload_starts_a_fresh_history(tmp_path, pairs):
+    gi = FakeGalaxy()
+    stale = gi.create_history("S1_MetaPhlAn")["id"]
+    gi.upload_file(pairs["S1"]["R1"], stale)  # orphaned by the interrupted run
+    upload_file.RunState(str(tmp_path / "state.json")).update("S1", stage=upload_file.UPLOADING,
+                                                               history_id=stale)
+
+    state = run(gi, tmp_path, pairs)
+
+    st = state.get("S1")
+    assert st["stage"] == upload_file.DONE
+    assert gi.histories_deleted == [stale]
+    assert st["history_id"] != stale
+    assert sorted(p.name for p in (tmp_path / "out" / "S1").iterdir()) == ["MetaPhlAn_profile.dat"]